@@ -0,0 +1,320 @@
+import bisect
+import json
+import os
+
+from collections import deque
+from jembatan.core.af import process_default_view, AnalysisFunction
+from jembatan.core.spandex import Span, Spandex
+from jembatan.core.trace import get_tracer
+from jembatan.typesys import Annotation
+from jembatan.typesys.namedentity import NamedEntity
+from pathlib import Path
+from typing import Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy
+
+
+# code points are below this, so (state, code point) pairs pack into a single sortable key
+_CODE_POINTS = 0x110000
+
+_ARRAYS = ("keys", "targets", "first", "fail", "output", "terminal", "depth", "id_offsets", "id_data")
+
+
+def fold_case(text: str) -> str:
+    """
+    Lower case text without changing its length, so offsets into the folded text are valid for the original.
+    Characters whose lower case form is longer than one character are left as they are.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class GazetteerAutomaton(object):
+    """
+    Aho-Corasick automaton over the characters of dictionary terms.  All occurrences of all terms in a text
+    are found in a single pass over the text, regardless of the number of terms.
+
+    The automaton is stored in flat numpy arrays.  Goto transitions are kept as a sorted array of keys packing
+    (state, code point) together with an array of target states.  The transitions of a state are contiguous,
+    so they are looked up by binary search over just that state's range, given by the `first` array.  Saved
+    automata are a directory of `.npy` files which `load` memory maps, so loading is instant and worker
+    processes share the pages of the same automaton.
+
+    Usage:
+        automaton = GazetteerAutomaton.build([("aspirin", "D001"), ("ibuprofen", "D002")], case_fold=True)
+        automaton.save("drugs.gaz")
+
+        automaton = GazetteerAutomaton.load("drugs.gaz")
+        for begin, end, entry in automaton.find("Aspirin or ibuprofen?"):
+            print(begin, end, automaton.identifier(entry))
+    """
+
+    def __init__(self, arrays: Mapping[str, numpy.ndarray], case_fold: bool = False):
+        """
+        Use `build` or `load` to create automata.
+
+        Args:
+            arrays: automaton arrays, see `build`
+            case_fold: terms were lower cased and texts should be too before matching
+        """
+        self.arrays = dict(arrays)
+        self.case_fold = case_fold
+
+        # memoryviews give fast element access from Python without copying memory mapped arrays
+        self._keys = memoryview(self.arrays["keys"])
+        self._targets = memoryview(self.arrays["targets"])
+        self._first = memoryview(self.arrays["first"])
+        self._fail = memoryview(self.arrays["fail"])
+        self._output = memoryview(self.arrays["output"])
+        self._terminal = memoryview(self.arrays["terminal"])
+        self._depth = memoryview(self.arrays["depth"])
+
+        # transitions out of the root are taken after nearly every mismatch, so keep them in a small dict
+        root_end = bisect.bisect_left(self._keys, _CODE_POINTS)
+        self._root = {key: self._targets[i] for i, key in enumerate(self._keys[:root_end].tolist())}
+
+    @property
+    def states(self) -> int:
+        return len(self.arrays["fail"])
+
+    @property
+    def entries(self) -> int:
+        return len(self.arrays["id_offsets"]) - 1
+
+    @classmethod
+    def build(cls, entries: Union[Mapping[str, str], Iterable[Union[str, Tuple[str, str]]]],
+              case_fold: bool = False) -> "GazetteerAutomaton":
+        """
+        Compile dictionary entries into an automaton
+
+        Args:
+            entries: mapping of term to identifier, or iterable of terms or (term, identifier) pairs.  Terms
+                without an identifier use the term itself.  If a term occurs more than once the first
+                identifier is kept.
+            case_fold: match terms regardless of case
+        """
+        pairs = entries.items() if hasattr(entries, "items") else entries
+
+        children = [{}]
+        terminal = [-1]
+        depth = [0]
+        identifiers = []
+        for item in pairs:
+            term, identifier = (item, item) if isinstance(item, str) else item
+            key = fold_case(term) if case_fold else term
+            if not key:
+                continue
+
+            state = 0
+            for cp in map(ord, key):
+                next_state = children[state].get(cp)
+                if next_state is None:
+                    next_state = len(children)
+                    children[state][cp] = next_state
+                    children.append({})
+                    terminal.append(-1)
+                    depth.append(depth[state] + 1)
+                state = next_state
+            if terminal[state] == -1:
+                terminal[state] = len(identifiers)
+                identifiers.append(identifier)
+
+        # breadth first pass computing failure links and links to the longest terminal suffix state
+        fail = [0] * len(children)
+        output = [-1] * len(children)
+        queue = deque(children[0].values())
+        while queue:
+            state = queue.popleft()
+            for cp, child in children[state].items():
+                fallback = fail[state]
+                while fallback and cp not in children[fallback]:
+                    fallback = fail[fallback]
+                target = children[fallback].get(cp, 0)
+                fail[child] = target if target != child else 0
+                output[child] = fail[child] if terminal[fail[child]] != -1 else output[fail[child]]
+                queue.append(child)
+
+        transitions = sorted((state * _CODE_POINTS + cp, child)
+                             for state, state_children in enumerate(children)
+                             for cp, child in state_children.items())
+
+        first = numpy.zeros(len(children) + 1, dtype=numpy.int64)
+        first[1:] = numpy.cumsum([len(state_children) for state_children in children], dtype=numpy.int64)
+
+        encoded = [str(identifier).encode("utf-8") for identifier in identifiers]
+        id_offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        id_offsets[1:] = numpy.cumsum([len(e) for e in encoded], dtype=numpy.int64)
+
+        arrays = {
+            "keys": numpy.array([k for k, _ in transitions], dtype=numpy.int64),
+            "targets": numpy.array([t for _, t in transitions], dtype=numpy.int32),
+            "first": first,
+            "fail": numpy.array(fail, dtype=numpy.int32),
+            "output": numpy.array(output, dtype=numpy.int32),
+            "terminal": numpy.array(terminal, dtype=numpy.int32),
+            "depth": numpy.array(depth, dtype=numpy.int32),
+            "id_offsets": id_offsets,
+            "id_data": numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8),
+        }
+        return cls(arrays, case_fold=case_fold)
+
+    def save(self, path: Union[str, Path]):
+        """
+        Save the automaton as a directory of `.npy` files
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            numpy.save(str(path / f"{name}.npy"), self.arrays[name])
+        meta = {"format": 1, "case_fold": self.case_fold, "states": self.states, "entries": self.entries}
+        tmp_path = path / "meta.json.tmp"
+        with tmp_path.open("w") as f:
+            json.dump(meta, f)
+        # meta is written last, so a directory with meta.json holds a complete automaton
+        os.replace(tmp_path, path / "meta.json")
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap_mode: Optional[str] = "r") -> "GazetteerAutomaton":
+        """
+        Load an automaton saved with `save`.  Arrays are memory mapped unless `mmap_mode` is None.
+        """
+        path = Path(path)
+        with (path / "meta.json").open() as f:
+            meta = json.load(f)
+        arrays = {name: numpy.load(str(path / f"{name}.npy"), mmap_mode=mmap_mode) for name in _ARRAYS}
+        return cls(arrays, case_fold=meta["case_fold"])
+
+    def identifier(self, entry: int) -> str:
+        offsets = self.arrays["id_offsets"]
+        return bytes(self.arrays["id_data"][offsets[entry]:offsets[entry + 1]]).decode("utf-8")
+
+    def prepare(self, text: str) -> str:
+        """
+        Return text as it should be handed to `find`
+        """
+        return fold_case(text) if self.case_fold else text
+
+    def find(self, text: str, begin: int = 0, end: Optional[int] = None,
+             prepared: bool = False) -> List[Tuple[int, int, int]]:
+        """
+        Return (begin, end, entry) for every occurrence of a term in text[begin:end], including overlapping ones.
+        Pass `prepared=True` when text has already been run through `prepare`.
+        """
+        if not prepared:
+            text = self.prepare(text)
+        if end is None:
+            end = len(text)
+
+        keys, targets, first, fail = self._keys, self._targets, self._first, self._fail
+        output, terminal, depth = self._output, self._terminal, self._depth
+        root = self._root
+        bisect_left = bisect.bisect_left
+
+        matches = []
+        state = 0
+        for pos in range(begin, end):
+            cp = ord(text[pos])
+            while True:
+                if state == 0:
+                    state = root.get(cp, 0)
+                    break
+                key = state * _CODE_POINTS + cp
+                hi = first[state + 1]
+                i = bisect_left(keys, key, first[state], hi)
+                if i < hi and keys[i] == key:
+                    state = targets[i]
+                    break
+                state = fail[state]
+
+            match_state = state if terminal[state] != -1 else output[state]
+            while match_state > 0:
+                matches.append((pos + 1 - depth[match_state], pos + 1, terminal[match_state]))
+                match_state = output[match_state]
+        return matches
+
+
+def leftmost_longest(matches: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """
+    Resolve overlapping matches, preferring matches that start earlier and then longer ones
+    """
+    selected = []
+    covered = 0
+    for match in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if match[0] >= covered:
+            selected.append(match)
+            covered = match[1]
+    return selected
+
+
+class GazetteerAnnotator(AnalysisFunction):
+    """
+    Spandex AnalysisFunction tagging occurrences of dictionary terms using a `GazetteerAutomaton`.  Every match
+    becomes an annotation of `annotation_type` with the identifier of the matched entry stored in `id_field`.
+    """
+
+    def __init__(self, automaton: Union[GazetteerAutomaton, str, Path], annotation_type: Annotation = NamedEntity,
+                 id_field: str = "identifier", value: str = None, token_type: Annotation = None,
+                 window_type: Annotation = None, longest_match: bool = True):
+        """
+        Args:
+            automaton: compiled automaton, or path of an automaton saved with `GazetteerAutomaton.save`
+            annotation_type: annotation type to create for matches
+            id_field: field of `annotation_type` to store the matched entry's identifier in
+            value: optional value stored in the `value` field of each annotation, e.g. "DRUG"
+            token_type: only keep matches starting at the beginning and ending at the end of annotations of
+                this type, e.g. `Token`
+            window_type: annotation type over which to run analyses (i.e. over sentences, paragraphs, etc)
+            longest_match: drop matches overlapping an earlier or longer match
+        """
+        if not isinstance(automaton, GazetteerAutomaton):
+            automaton = GazetteerAutomaton.load(automaton)
+        self.automaton = automaton
+        self.annotation_type = annotation_type
+        self.id_field = id_field
+        self.value = value
+        self.token_type = token_type
+        self.window_type = window_type
+        self.longest_match = longest_match
+
+    @property
+    def input_types(self):
+        return tuple(t for t in (self.window_type, self.token_type) if t)
+
+    def aligned(self, spndx: Spandex, matches: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+        tokens = spndx.select(self.token_type)
+        begins = {t.begin for t in tokens}
+        ends = {t.end for t in tokens}
+        return [m for m in matches if m[0] in begins and m[1] in ends]
+
+    @process_default_view
+    def process(self, spndx: Spandex, **kwargs):
+        if self.window_type:
+            windows = [window.span for window in spndx.select(self.window_type)]
+        else:
+            windows = [Span(0, len(spndx.content_string))]
+
+        automaton = self.automaton
+        with get_tracer().span("gazetteer.match", cat="gazetteer", windows=len(windows)):
+            text = automaton.prepare(spndx.content_string)
+            matches = [m for window in windows for m in automaton.find(text, window.begin, window.end, prepared=True)]
+            if self.token_type:
+                matches = self.aligned(spndx, matches)
+            if self.longest_match:
+                matches = leftmost_longest(matches)
+
+        annotations = []
+        identifiers = {}
+        for begin, end, entry in matches:
+            annotation = self.annotation_type(begin=begin, end=end)
+            identifier = identifiers.get(entry)
+            if identifier is None:
+                identifier = identifiers[entry] = automaton.identifier(entry)
+            setattr(annotation, self.id_field, identifier)
+            if self.value is not None:
+                annotation.value = self.value
+            annotations.append(annotation)
+
+        with get_tracer().span("spandex.add_annotations", cat="spandex", annotations=len(annotations)):
+            spndx.add_annotations(*annotations)
@@ -0,0 +1,155 @@
+import threading
+
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def _freeze(val: Any) -> Hashable:
+    """
+    Turn configuration values into something usable as part of a dictionary key
+    """
+    if isinstance(val, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in val.items()))
+    elif isinstance(val, (list, tuple, set, frozenset)):
+        items = [_freeze(v) for v in val]
+        return tuple(sorted(items, key=repr) if isinstance(val, (set, frozenset)) else items)
+    return val
+
+
+def _spacy_load(name: str, **config):
+    import spacy
+    return spacy.load(name, **config)
+
+
+class _RegistryEntry(object):
+
+    __slots__ = ("model", "refcount")
+
+    def __init__(self, model):
+        self.model = model
+        self.refcount = 0
+
+
+class ModelRegistry(object):
+    """
+    Process-wide registry of loaded models keyed by model name and load configuration.  Analyzers
+    acquire models from the registry instead of loading their own copy, so several analyzers using the
+    same model share it.
+
+    Models are loaded lazily on first acquisition and reference counted.  Models no longer referenced
+    stay loaded until evicted, unless the registry was created with `evict_unused=True`.
+
+    Usage:
+        nlp = get_model_registry().acquire("en_core_web_sm", disable=["ner"])
+        ...
+        get_model_registry().release("en_core_web_sm", disable=["ner"])
+
+    For fork based worker pools call `preload` in the parent before forking, so workers share the
+    model's memory copy-on-write instead of each loading their own.
+    """
+
+    def __init__(self, loader: Callable = _spacy_load, evict_unused: bool = False):
+        """
+        Args:
+            loader: function called as `loader(name, **config)` to load a model.  Defaults to `spacy.load`.
+            evict_unused: drop models as soon as their reference count reaches zero
+        """
+        self.loader = loader
+        self.evict_unused = evict_unused
+        self._entries: Dict[Tuple, _RegistryEntry] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(name: str, **config) -> Tuple:
+        return (name, _freeze(config))
+
+    def __contains__(self, key: Tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _load(self, key: Tuple, name: str, config: Dict) -> _RegistryEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _RegistryEntry(self.loader(name, **config))
+            self._entries[key] = entry
+        return entry
+
+    def acquire(self, name: str, **config):
+        """
+        Return the model loaded with `name` and `config`, loading it if needed, and increment its
+        reference count.  Every call should be paired with a call to `release`.
+        """
+        key = self.key(name, **config)
+        with self._lock:
+            entry = self._load(key, name, config)
+            entry.refcount += 1
+            return entry.model
+
+    def release(self, name: str, **config):
+        """
+        Decrement the reference count of a model acquired with `name` and `config`
+        """
+        key = self.key(name, **config)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refcount <= 0:
+                raise ValueError("Model {} was not acquired from this registry".format(key))
+            entry.refcount -= 1
+            if entry.refcount == 0 and self.evict_unused:
+                del self._entries[key]
+
+    def preload(self, name: str, **config):
+        """
+        Load a model without acquiring a reference to it.  Use before forking worker processes.
+        """
+        key = self.key(name, **config)
+        with self._lock:
+            return self._load(key, name, config).model
+
+    def refcount(self, name: str, **config) -> int:
+        key = self.key(name, **config)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refcount if entry is not None else 0
+
+    def evict(self, name: Optional[str] = None, force: bool = False, **config) -> List[Tuple]:
+        """
+        Drop loaded models that are no longer referenced.  If `name` is given only the model loaded with
+        `name` and `config` is considered.  With `force`, models are dropped even if still referenced;
+        analyzers holding them keep working with their copy.
+
+        Returns keys of the evicted models.
+        """
+        with self._lock:
+            if name is not None:
+                keys = [self.key(name, **config)]
+            else:
+                keys = list(self._entries)
+
+            evicted = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and (force or entry.refcount == 0):
+                    del self._entries[key]
+                    evicted.append(key)
+            return evicted
+
+    def loaded(self) -> Dict[Tuple, int]:
+        """
+        Return keys of loaded models and their reference counts
+        """
+        with self._lock:
+            return {key: entry.refcount for key, entry in self._entries.items()}
+
+
+_model_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Return the process-wide model registry
+    """
+    return _model_registry
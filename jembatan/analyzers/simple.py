@@ -1,28 +1,152 @@
 from jembatan.core.af import process_default_view, AnalysisFunction
 from jembatan.core.spandex import JembatanDoc, Span, Spandex
+from jembatan.core.trace import get_tracer
 from jembatan.typesys import Annotation
 from jembatan.typesys.segmentation import Token
-from typing import Pattern
+from typing import Iterable, List, Mapping, Optional, Pattern, Tuple, Union
 
 import re
 
 
+def match_spans(match_re: Pattern[str], offset: int, text: str, windows: List[Tuple[int, int]]
+                ) -> List[Tuple[int, int]]:
+    """
+    Return (begin, end) spans of matches in the (begin, end) windows of text, scanned in place with
+    `finditer(text, begin, end)` and shifted by `offset`.  Defined at module level so it can be sent to
+    worker processes.
+    """
+    finditer = match_re.finditer
+    return [(offset + m.start(), offset + m.end()) for begin, end in windows for m in finditer(text, begin, end)]
+
+
+def lookbehind_chars(match_re: Pattern[str]) -> Optional[int]:
+    """
+    Return an upper bound on the number of characters before the scan position that `match_re` may look
+    at, through lookbehinds or assertions like `\\b` and `^`.  Returns None if the pattern can not be
+    inspected.
+    """
+    try:
+        from re import _parser as sre_parse
+    except ImportError:
+        import sre_parse
+
+    def width(node) -> int:
+        total = 0
+        if isinstance(node, sre_parse.SubPattern):
+            for op, av in node:
+                if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] < 0:
+                    total += av[1].getwidth()[1]
+                total += width(av)
+        elif isinstance(node, (list, tuple)):
+            total += sum(width(item) for item in node)
+        return total
+
+    try:
+        # lookbehinds are fixed width; one more character covers word boundaries and line starts
+        return width(sre_parse.parse(match_re.pattern, match_re.flags)) + 1
+    except Exception:
+        return None
+
+
+def partition(items: List, parts: int) -> List[List]:
+    """
+    Split items into at most `parts` contiguous groups of similar size
+    """
+    size, extra = divmod(len(items), parts)
+    groups = []
+    begin = 0
+    for i in range(parts):
+        end = begin + size + (1 if i < extra else 0)
+        if end > begin:
+            groups.append(items[begin:end])
+        begin = end
+    return groups
+
+
 class RegexMatchAnnotator(AnalysisFunction):
     """
     Spandex AnalysisFunction which will find matches from the specified regular expression and will create
     the corresponding annotation type when found over the view
     """
-    def __init__(self, match_re: Pattern[str], annotation_type: Annotation, window_type: Annotation=None):
+    # views with less text than this are always matched in process, since shipping windows to
+    # workers costs more than matching them
+    PARALLEL_MIN_CHARS = 1 << 16
+
+    def __init__(self, match_re: Pattern[str], annotation_type: Annotation, window_type: Annotation=None,
+                 n_workers: int = 1):
         """
         Creates Spandex RegexMatch Analyzer
 
         @param match_re - regular expression specifying match parameters
         @param annotation_type - annotation type to create for matching spans
         @param window_type - annotation type over which to run analyses (i.e. over sentences, paragraphs, etc)
+        @param n_workers - number of worker processes windows of a single large view are matched in.  Results
+                are identical to matching in process.  Workers are shut down by `close`, at the end of
+                `SimplePipeline.run`, when used as a context manager, or when the annotator is garbage collected.
         """
         self.match_re = match_re
         self.annotation_type = annotation_type
         self.window_type = window_type
+        self.n_workers = n_workers
+        self._executor = None
+
+    @property
+    def input_types(self):
+        return (self.window_type,) if self.window_type else ()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        return self._executor
+
+    def close(self):
+        """
+        Shut down worker processes, if any were started.  Workers are started again if the annotator is
+        used afterwards.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def collection_process_complete(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def find_spans(self, text: str, windows: List[Span]) -> List[Tuple[int, int]]:
+        """
+        Return spans of all matches within the windows of text, in window order.  Windows are scanned in place
+        with `finditer(text, pos, endpos)`, so as with `Pattern.finditer`, `^` only matches at the start of
+        the text (or of a line with MULTILINE) and lookbehinds may see text before the window.
+        """
+        total_chars = sum(window.end - window.begin for window in windows)
+        if self.n_workers > 1 and len(windows) > 1 and total_chars >= self.PARALLEL_MIN_CHARS:
+            # each group of windows is sent along with as much preceding text as the pattern may look
+            # behind, so workers find the same matches as an in place scan.  Several groups per worker
+            # so uneven windows still balance out.
+            context = lookbehind_chars(self.match_re)
+            offsets, texts, group_windows = [], [], []
+            for group in partition(windows, self.n_workers * 4):
+                begin = 0 if context is None else max(group[0].begin - context, 0)
+                end = max(window.end for window in group)
+                offsets.append(begin)
+                texts.append(text[begin:end])
+                group_windows.append([(window.begin - begin, window.end - begin) for window in group])
+            results = self.executor.map(match_spans, [self.match_re] * len(texts), offsets, texts, group_windows)
+            return [span for group_spans in results for span in group_spans]
+
+        return match_spans(self.match_re, 0, text, [(window.begin, window.end) for window in windows])
 
     @process_default_view
     def process(self, spndx: Spandex, **kwargs):
@@ -31,16 +155,120 @@ class RegexMatchAnnotator(AnalysisFunction):
         else:
             windows = [Span(0, len(spndx.content_string))]
 
-        annotations = []
+        with get_tracer().span("regex.match", cat="regex", windows=len(windows)):
+            spans = self.find_spans(spndx.content_string, windows)
+            annotations = [self.annotation_type(begin=begin, end=end) for begin, end in spans]
+        with get_tracer().span("spandex.add_annotations", cat="spandex", annotations=len(annotations)):
+            spndx.add_annotations(*annotations)
+
+
+class MultiRegexMatchAnnotator(AnalysisFunction):
+    """
+    Spandex AnalysisFunction matching several regular expressions, each with its own annotation type, in a
+    single scan over the view.  The patterns are combined into one alternation of named groups, so the cost
+    depends on the length of the text rather than on the number of patterns.  All matches are added to the
+    view in one batch.
+
+    Like any alternation, the combined scan finds non-overlapping matches and earlier patterns win when
+    several match at the same position.  Set `allow_overlaps` to scan for each pattern separately and keep
+    overlapping matches of different patterns, as separate `RegexMatchAnnotator`s would.  Patterns that
+    can not be combined (e.g. because they use backreferences) are always scanned separately.
+    """
+
+    FLAG_LETTERS = ((re.ASCII, "a"), (re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+
+    def __init__(self, patterns: Union[Mapping[Union[str, Pattern[str]], Annotation],
+                                       Iterable[Tuple[Union[str, Pattern[str]], Annotation]]],
+                 window_type: Annotation=None, allow_overlaps: bool = False):
+        """
+        Creates Spandex MultiRegexMatch Analyzer
+
+        @param patterns - mapping of regular expression to the annotation type to create for its matches, or
+                an iterable of (regular expression, annotation type) pairs
+        @param window_type - annotation type over which to run analyses (i.e. over sentences, paragraphs, etc)
+        @param allow_overlaps - scan for each pattern separately, keeping overlapping matches
+        """
+        pairs = patterns.items() if hasattr(patterns, "items") else patterns
+        self.patterns = [(re.compile(p) if isinstance(p, str) else p, annotation_type) for p, annotation_type in pairs]
+        self.window_type = window_type
+        self.allow_overlaps = allow_overlaps
+        self.combined_re, self.group_types, self.separate = self.combine(self.patterns, allow_overlaps)
+
+    @property
+    def input_types(self):
+        return (self.window_type,) if self.window_type else ()
+
+    @classmethod
+    def scoped_pattern(cls, pattern: Pattern[str]) -> str:
+        """
+        Return pattern source with its flags applied as a scoped inline flag group
+        """
+        letters = "".join(letter for flag, letter in cls.FLAG_LETTERS if pattern.flags & flag)
+        return f"(?{letters}:{pattern.pattern})" if letters else f"(?:{pattern.pattern})"
+
+    @classmethod
+    def combine(cls, patterns: List[Tuple[Pattern[str], Annotation]], allow_overlaps: bool):
+        """
+        Combine patterns into a single alternation.  Returns the combined pattern (or None), a mapping of
+        group index to annotation type and the (pattern, annotation type) pairs to scan for separately.
+        """
+        if allow_overlaps:
+            return None, {}, list(patterns)
+
+        combinable = []
+        separate = []
+        for pattern, annotation_type in patterns:
+            if re.search(r'\\[1-9]|\(\?P=', pattern.pattern):
+                # numbered groups shift in the combined pattern, and named ones may clash
+                separate.append((pattern, annotation_type))
+            elif pattern.flags & re.LOCALE:
+                # locale dependent matching can not be scoped to part of a pattern
+                separate.append((pattern, annotation_type))
+            else:
+                combinable.append((pattern, annotation_type))
+
+        if not combinable:
+            return None, {}, separate
+
+        source = "|".join(f"(?P<_jem{i}>{cls.scoped_pattern(p)})" for i, (p, _) in enumerate(combinable))
+        try:
+            combined_re = re.compile(source)
+        except re.error:
+            # e.g. duplicate group names across patterns
+            return None, {}, list(patterns)
+
+        group_types = {combined_re.groupindex[f"_jem{i}"]: t for i, (_, t) in enumerate(combinable)}
+        return combined_re, group_types, separate
+
+    def find_matches(self, text: str, windows: List[Span]) -> List[Tuple[Annotation, int, int]]:
+        """
+        Return (annotation type, begin, end) of all matches within the windows of text
+        """
+        matches = []
+        combined_re = self.combined_re
+        group_types = self.group_types
         for window in windows:
-            window_text = spndx.spanned_text(window)
+            if combined_re is not None:
+                for m in combined_re.finditer(text, window.begin, window.end):
+                    # lastindex is the outermost group that matched, i.e. the pattern's own group
+                    matches.append((group_types[m.lastindex], m.start(), m.end()))
+            for pattern, annotation_type in self.separate:
+                for m in pattern.finditer(text, window.begin, window.end):
+                    matches.append((annotation_type, m.start(), m.end()))
+        return matches
 
-            for match in self.match_re.finditer(window_text):
-                mbeg, mend = match.span()
-                annotation = self.annotation_type()
-                annotation.span = Span(begin=window.begin+mbeg, end=window.begin+mend)
-                annotations.append(annotation)
-        spndx.add_annotations(*annotations)
+    @process_default_view
+    def process(self, spndx: Spandex, **kwargs):
+        if self.window_type:
+            windows = [window.span for window in spndx.select(self.window_type)]
+        else:
+            windows = [Span(0, len(spndx.content_string))]
+
+        with get_tracer().span("regex.match", cat="regex", windows=len(windows), patterns=len(self.patterns)):
+            annotations = [annotation_type(begin=begin, end=end)
+                           for annotation_type, begin, end in self.find_matches(spndx.content_string, windows)]
+        with get_tracer().span("spandex.add_annotations", cat="spandex", annotations=len(annotations)):
+            spndx.add_annotations(*annotations)
 
 
 class RegexSplitAnnotator(AnalysisFunction):
@@ -61,6 +289,10 @@ class RegexSplitAnnotator(AnalysisFunction):
         self.annotation_type = annotation_type
         self.window_type = window_type
 
+    @property
+    def input_types(self):
+        return (self.window_type,) if self.window_type else ()
+
     @process_default_view
     def process(self, spndx: Spandex, **kwargs):
         if self.window_type:
@@ -68,34 +300,25 @@ class RegexSplitAnnotator(AnalysisFunction):
         else:
             windows = [Span(0, len(spndx.content_string))]
 
-        annotations = []
+        text = spndx.content_string
+        finditer = self.split_re.finditer
+        spans = []
         for window in windows:
-            window_text = spndx.spanned_text(window)
-
-            matches = list(self.split_re.finditer(window_text))
+            # scan the window in place rather than copying its text
+            separators = [m.span() for m in finditer(text, window.begin, window.end)]
 
-            if not matches:
+            if not separators:
                 # no split found so make the whole window paragraph
-                span = Span(begin=window.begin+0, end=window.begin+len(spndx.content_string))
-                annotation = self.annotation_type(begin=span.begin, end=span.end)
-                annotations.append(annotation)
-            else:
-                if matches[0].span()[0] > 0:
-                    span = Span(begin=window.begin+0, end=window.begin+matches[0].span()[0])
-                    annotation = self.annotation_type(begin=span.begin, end=span.end)
-                    annotations.append(annotation)
-
-                for m0, m1 in zip(matches[0:-1], matches[1:]):
-                    span = Span(begin=window.begin+m0.span()[1], end=window.begin+m1.span()[0])
-                    annotation = self.annotation_type(begin=span.begin, end=span.end)
-                    annotations.append(annotation)
-
-                if matches[-1].span()[1] <= len(window_text):
-                    # get straggling span
-                    span = Span(begin=window.begin+matches[-1].span()[1], end=window.begin+len(spndx.content_string))
-                    annotation = self.annotation_type(begin=span.begin, end=span.end)
-                    annotations.append(annotation)
+                spans.append((window.begin, window.end))
+                continue
+
+            if separators[0][0] > window.begin:
+                spans.append((window.begin, separators[0][0]))
+            spans.extend((prev_end, next_begin) for (_, prev_end), (next_begin, _) in zip(separators, separators[1:]))
+            # straggling span runs to the end of the window
+            spans.append((separators[-1][1], window.end))
 
+        annotations = [self.annotation_type(begin=begin, end=end) for begin, end in spans]
         spndx.add_annotations(*annotations)
 
 
@@ -103,6 +326,10 @@ class SimpleTokenizer:
     def __init__(self, window_type=None):
         self.regex_annotator = RegexMatchAnnotator(re.compile(r'\w+'), Token, window_type=window_type)
 
+    @property
+    def input_types(self):
+        return self.regex_annotator.input_types
+
     def process(self, jemdoc: JembatanDoc):
         self.regex_annotator.process(jemdoc)
 
@@ -113,5 +340,9 @@ class SimpleSentenceSegmenter:
         self.regex_annotator = RegexMatchAnnotator(
             re.compile(re.compile(r'[^\s\.][^\.]+')), Sentence, window_type=window_type)
 
+    @property
+    def input_types(self):
+        return self.regex_annotator.input_types
+
     def process(self, jemdoc: JembatanDoc):
         self.regex_annotator.process(jemdoc)
@@ -1,13 +1,18 @@
 import re
 import itertools
 import functools
+import json
 
 from enum import auto, Flag
-from jembatan.core.spandex import (Span, Spandex)
+from jembatan.core.spandex import (JembatanDoc, Span, Spandex)
 from jembatan.core.af import process_default_view, AnalysisFunction
+from jembatan.analyzers.registry import get_model_registry
+from jembatan.core.trace import get_tracer
 from jembatan.typesys.chunking import NounChunk, Entity
 from jembatan.typesys.segmentation import (Document, Sentence, Token)
 from jembatan.typesys.syntax import (DependencyEdge, DependencyNode, DependencyParse)
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
 
 class AnnotationLayers(Flag):
@@ -99,11 +104,307 @@ class SpacyToJson(object):
             "language": "unk"
         }
 
+    def to_json_arrays(self, spacydoc):
+        """
+        Same output as `to_json`, built from token attribute columns pulled out with `Doc.to_array`
+        """
+        arrays = SpacyDocArrays(spacydoc)
+        string = arrays.string
+        text = spacydoc.text
+        begins, ends = arrays.begins, arrays.ends
+
+        sentences = [
+            {"text": {"content": text[begins[start]:ends[end - 1]], "beginOffset": begins[start]}, "sentiment": {}}
+            for start, end in arrays.sentence_bounds()
+        ]
+        tokens = [
+            {
+                "text": {"content": text[begin:end], "beginOffset": begin},
+                "partOfSpeech": {"tag": string(pos), "pos": string(tag)},
+                "lemma": lemma,
+                "dependencyEdge": {"headTokenIndex": head, "label": string(dep)}
+            }
+            for begin, end, pos, tag, lemma, head, dep in
+            zip(begins, ends, arrays.pos, arrays.tags, arrays.lemma_strings(), arrays.heads, arrays.deps)
+        ]
+        entities = []
+        for start, end, label in arrays.entity_bounds():
+            content = text[begins[start]:ends[end - 1]]
+            entities.append({
+                "name": content,
+                "type": string(label),
+                "metadata": {},
+                "salience": -1,
+                "mentions": [{"content": content, "beginOffset": begins[start], "type": "PROPER"}]
+            })
+
+        return {
+            "sentences": sentences,
+            "tokens": tokens,
+            "entities": entities,
+            "documentSentiment": {},
+            "language": "unk"
+        }
+
+
+class SpacyJsonlExporter(object):
+    """
+    Streams spacy analyses of a corpus to JSON lines, one `SpacyToJson` document per line.  Texts are parsed
+    with batched `nlp.pipe` calls and every document is written as soon as it is parsed, so memory use is
+    bounded by the batch size rather than the corpus size.
+
+    Usage:
+        exporter = SpacyJsonlExporter(nlp, batch_size=256, n_process=4)
+        exporter.export(((text, {"id": doc_id}) for doc_id, text in corpus), "corpus.jsonl", as_tuples=True)
+    """
+
+    def __init__(self, spacy_pipeline, batch_size: int = 64, n_process: int = 1, serializer: SpacyToJson = None):
+        """
+        Args:
+            spacy_pipeline: spacy `Language` used to parse texts
+            batch_size: number of texts handed to `nlp.pipe` per batch
+            n_process: number of processes `nlp.pipe` should use
+            serializer: `SpacyToJson` instance producing the per document output
+        """
+        self.spacy_pipeline = spacy_pipeline
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.serializer = serializer if serializer is not None else SpacyToJson()
+
+    def iter_records(self, texts: Iterable, as_tuples: bool = False) -> Iterator[Dict]:
+        """
+        Yield one output record per text.  With `as_tuples`, `texts` holds (text, context) pairs and the
+        entries of each context dict are added to its record.
+        """
+        pipe_kwargs = {"batch_size": self.batch_size, "as_tuples": as_tuples}
+        if self.n_process != 1:
+            pipe_kwargs["n_process"] = self.n_process
+
+        for item in self.spacy_pipeline.pipe(texts, **pipe_kwargs):
+            if as_tuples:
+                spacydoc, context = item
+                record = dict(context or {})
+            else:
+                spacydoc, record = item, {}
+            record.update(self.serializer.to_json_arrays(spacydoc))
+            yield record
+
+    def export(self, texts: Iterable, path: Union[str, Path, TextIO], as_tuples: bool = False) -> int:
+        """
+        Write one JSON line per text to `path`, which may also be an open text file.  Returns the number of
+        documents written.
+        """
+        if isinstance(path, (str, Path)):
+            with open(path, "w") as f:
+                return self.export(texts, f, as_tuples=as_tuples)
+
+        count = 0
+        for record in self.iter_records(texts, as_tuples=as_tuples):
+            path.write(json.dumps(record))
+            path.write("\n")
+            count += 1
+        return count
+
+
+def build_dependency_layer(begins: List[int], ends: List[int], heads: List[int], labels: List[str],
+                           is_space: List[bool], sentence_bounds: List[Tuple[int, int]]
+                           ) -> Tuple[List[DependencyNode], List[DependencyEdge], List[DependencyParse]]:
+    """
+    Assemble dependency nodes, edges and parses in a single pass over the head array and sentence boundaries.
+    All arguments are indexed by token position, except `sentence_bounds` which holds (start, end) token
+    indices of each sentence.  Whitespace tokens get no node, and edges attached to them are skipped.
+    """
+    nodes = [None if space else DependencyNode(begin=begins[i], end=ends[i]) for i, space in enumerate(is_space)]
+
+    depnodes = []
+    depedges = []
+    depparses = []
+    seen = [False] * len(nodes)
+    for start, end in sentence_bounds:
+        root = None
+        for i in range(start, end):
+            child_node = nodes[i]
+            if child_node is None:
+                continue
+            head = heads[i]
+            head_node = nodes[head]
+            if head_node is None:
+                continue
+
+            depedge = DependencyEdge(begin=min(begins[i], begins[head]), end=max(ends[i], ends[head]),
+                                     label=labels[i], head=head_node, child=child_node)
+            child_node.head_edge = depedge
+            head_node.child_edges.append(depedge)
+            depedges.append(depedge)
+
+            for node_index in (head, i):
+                if not seen[node_index]:
+                    depnodes.append(nodes[node_index])
+                    seen[node_index] = True
+
+            if root is None and head == i:
+                root = child_node
+
+        depparses.append(DependencyParse(begin=begins[start], end=ends[end - 1], root=root))
+    return depnodes, depedges, depparses
+
+
+class SpacyDocArrays:
+    """
+    Column oriented view over a spacy document.  Token attributes are pulled out with a single call to
+    `Doc.to_array` and annotations are built from the resulting arrays, avoiding a Python attribute lookup
+    per token attribute.  Character offsets are shifted by `offset`.
+
+    When the spacy document was built from existing tokens, `begins` and `ends` give the character offsets
+    of those tokens and are used in place of the offsets within the spacy document.
+
+    If `token_range` is given, only annotations lying entirely within that (start, end) range of token
+    indices are built.  This is used to convert the accepted part of an overlapping chunk.
+    """
+    ATTRS = ["IDX", "LENGTH", "HEAD", "DEP", "TAG", "POS", "LEMMA", "ENT_IOB", "ENT_TYPE", "IS_SPACE"]
+
+    # ENT_IOB codes used by spacy
+    IOB_MISSING, IOB_INSIDE, IOB_OUTSIDE, IOB_BEGIN = 0, 1, 2, 3
+
+    def __init__(self, spacy_doc, offset: int = 0, begins: Optional[List[int]] = None,
+                 ends: Optional[List[int]] = None, token_range: Optional[Tuple[int, int]] = None):
+        import numpy
+
+        self.spacy_doc = spacy_doc
+        self.token_range = token_range if token_range is not None else (0, len(spacy_doc))
+        self.strings = spacy_doc.vocab.strings
+        self._string_cache = {}
+        self._sentence_bounds = None
+
+        n = len(spacy_doc)
+        if n:
+            arr = spacy_doc.to_array(self.ATTRS)
+        else:
+            arr = numpy.zeros((0, len(self.ATTRS)), dtype=numpy.uint64)
+        cols = {attr: arr[:, i] for i, attr in enumerate(self.ATTRS)}
+
+        if begins is not None and ends is not None:
+            self.begins = list(begins)
+            self.ends = list(ends)
+        else:
+            token_begins = cols["IDX"].astype(numpy.int64) + offset
+            self.begins = token_begins.tolist()
+            self.ends = (token_begins + cols["LENGTH"].astype(numpy.int64)).tolist()
+        # heads are stored relative to the token, with negative offsets wrapped around in the unsigned array
+        self.heads = (cols["HEAD"].astype(numpy.int64) + numpy.arange(n, dtype=numpy.int64)).tolist()
+        self.deps = cols["DEP"].tolist()
+        self.tags = cols["TAG"].tolist()
+        self.pos = cols["POS"].tolist()
+        self.lemmas = cols["LEMMA"].tolist()
+        self.ent_iobs = cols["ENT_IOB"].tolist()
+        self.ent_types = cols["ENT_TYPE"].tolist()
+        self.is_space = cols["IS_SPACE"].astype(bool).tolist()
+
+    def __len__(self):
+        return len(self.begins)
+
+    def string(self, key: int) -> str:
+        """
+        Look up the string for a hash or id from the spacy string store
+        """
+        try:
+            return self._string_cache[key]
+        except KeyError:
+            val = self.strings[key]
+            self._string_cache[key] = val
+            return val
+
+    def lemma_strings(self) -> List[str]:
+        """
+        Return the lemma of every token.  Tokens without a lemma set fall back to spacy's `lemma_`,
+        which looks the lemma up instead.
+        """
+        string = self.string
+        spacy_doc = self.spacy_doc
+        return [string(lemma) if lemma else spacy_doc[i].lemma_ for i, lemma in enumerate(self.lemmas)]
+
+    def in_range(self, start: int, end: int) -> bool:
+        return self.token_range[0] <= start and end <= self.token_range[1]
+
+    def sentence_bounds(self) -> List[Tuple[int, int]]:
+        """
+        Return (start, end) token indices of each sentence
+        """
+        if self._sentence_bounds is None:
+            self._sentence_bounds = [(s.start, s.end) for s in self.spacy_doc.sents if self.in_range(s.start, s.end)]
+        return self._sentence_bounds
+
+    def sentences(self) -> List[Sentence]:
+        return [Sentence(begin=self.begins[start], end=self.ends[end - 1]) for start, end in self.sentence_bounds()]
+
+    def tokens(self) -> List[Optional[Token]]:
+        """
+        Return a Token for every spacy token, with None in place of whitespace tokens
+        """
+        string = self.string
+        range_start, range_end = self.token_range
+        return [
+            None if is_space or not range_start <= i < range_end
+            else Token(begin=begin, end=end, lemma=lemma, pos=string(tag), tag=string(pos))
+            for i, (begin, end, lemma, tag, pos, is_space) in
+            enumerate(zip(self.begins, self.ends, self.lemma_strings(), self.tags, self.pos, self.is_space))
+        ]
+
+    def merge_tokens(self, tokens: List[Token]):
+        """
+        Set lemma, pos and tag on existing tokens the spacy document was built from
+        """
+        string = self.string
+        for token, lemma, tag, pos in zip(tokens, self.lemma_strings(), self.tags, self.pos):
+            token.lemma = lemma
+            token.pos = string(tag)
+            token.tag = string(pos)
+
+    def dependencies(self) -> Tuple[List[DependencyNode], List[DependencyEdge], List[DependencyParse]]:
+        """
+        Build dependency nodes, edges and one parse per sentence for all non-whitespace tokens
+        """
+        string = self.string
+        return build_dependency_layer(self.begins, self.ends, self.heads, [string(d) for d in self.deps],
+                                      self.is_space, self.sentence_bounds())
+
+    def entity_bounds(self) -> List[Tuple[int, int, int]]:
+        """
+        Return (start, end, label) for each entity, decoded from the IOB columns the same way as `Doc.ents`
+        """
+        bounds = []
+        start = -1
+        label = 0
+        for i, (iob, ent_type) in enumerate(zip(self.ent_iobs, self.ent_types)):
+            if iob == self.IOB_BEGIN:
+                if start != -1:
+                    bounds.append((start, i, label))
+                start = i
+                label = ent_type
+            elif iob in (self.IOB_OUTSIDE, self.IOB_MISSING):
+                if start != -1:
+                    bounds.append((start, i, label))
+                start = -1
+                label = 0
+        if start != -1:
+            bounds.append((start, len(self), label))
+        return [(start, end, label) for start, end, label in bounds if self.in_range(start, end)]
+
+    def noun_chunks(self) -> List[NounChunk]:
+        return [NounChunk(begin=self.begins[nc.start], end=self.ends[nc.end - 1], label=nc.label_)
+                for nc in self.spacy_doc.noun_chunks if self.in_range(nc.start, nc.end)]
+
+    def entities(self) -> List[Entity]:
+        return [
+            Entity(begin=self.begins[start], end=self.ends[end - 1], name=None, salience=None, label=self.string(label))
+            for start, end, label in self.entity_bounds()
+        ]
+
 
 class SpacyToSpandexUtils:
 
     @staticmethod
-    def convert_sentence(spacysent, window_span=None):
+    def convert_sentence(spacysent, window_span=None, keep_source: bool = False):
         begin = spacysent.start_char
         end = begin + len(spacysent.text)
 
@@ -114,31 +415,34 @@ class SpacyToSpandexUtils:
 
         sent = Sentence()
         sent.span = sent_span
-        sent.source = spacysent
+        if keep_source:
+            sent.source = spacysent
         return sent
 
     @staticmethod
-    def convert_token(spacytok, window_span=None):
+    def convert_token(spacytok, window_span=None, keep_source: bool = False):
         span = Span(spacytok.idx, spacytok.idx + len(spacytok))
         if window_span:
             span = Span(window_span.begin + span.begin, window_span.begin + span.end)
         tok = Token(lemma=spacytok.lemma_, pos=spacytok.tag_, tag=spacytok.pos_)
         tok.span = span
-        tok.source = spacytok
+        if keep_source:
+            tok.source = spacytok
         return tok
 
     @staticmethod
-    def convert_entity(entity, window_span=None):
+    def convert_entity(spacyent, window_span=None, keep_source: bool = False):
         if window_span:
-            entity_span = Span(window_span.begin + entity.start_char,
-                               window_span.begin + entity.end_char)
+            entity_span = Span(window_span.begin + spacyent.start_char,
+                               window_span.begin + spacyent.end_char)
         else:
-            entity_span = Span(entity.start_char,
-                               entity.end_char)
+            entity_span = Span(spacyent.start_char,
+                               spacyent.end_char)
 
-        entity = Entity(name=None, salience=None, label=entity.label_)
+        entity = Entity(name=None, salience=None, label=spacyent.label_)
         entity.span = entity_span
-        entity.source = entity
+        if keep_source:
+            entity.source = spacyent
         return entity
 
     @staticmethod
@@ -154,10 +458,30 @@ class SpacyToSpandexUtils:
         return noun_chunk
 
     @staticmethod
-    def spacy_to_spandex(spacy_doc, spndx=None, annotation_layers=AnnotationLayers.ALL(), window_span=None):
+    def spacy_to_spandex(spacy_doc, spndx=None, annotation_layers=AnnotationLayers.ALL(), window_span=None,
+                         use_arrays=True, tokens: Optional[List[Token]] = None, keep_source: bool = False):
+        """
+        Convert a spacy document into annotations on a Spandex.
+
+        Args:
+            spacy_doc: spacy document to convert
+            spndx (:obj:`Spandex`, optional): view to add annotations to.  A new one is created if omitted.
+            annotation_layers (:obj:`AnnotationLayers`): mask of layers to convert
+            window_span (:obj:`Span`, optional): span of the view the spacy document was created from
+            use_arrays: read token attributes in bulk with `Doc.to_array` instead of from spacy objects
+                one attribute at a time.  Both paths produce the same annotations.
+            tokens (:obj:`list` of :obj:`Token`, optional): existing tokens the spacy document was built from.
+                Token analyses are merged onto these instead of creating a new token layer.  Implies use_arrays.
+            keep_source: set a `source` attribute on sentences, tokens and entities pointing at the spacy
+                object they were converted from.  Useful for debugging, but every such reference keeps the
+                whole spacy document alive for as long as the Spandex is.
+        """
+        if use_arrays or tokens is not None:
+            return SpacyToSpandexUtils.spacy_to_spandex_arrays(spacy_doc, spndx, annotation_layers, window_span,
+                                                               tokens=tokens, keep_source=keep_source)
 
         if not spndx:
-            spndx = Spandex(spacy_doc.text_with_ws)
+            spndx = Spandex(parent=None, content_string=spacy_doc.text_with_ws)
 
         if annotation_layers & AnnotationLayers.DOCUMENT:
             if window_span:
@@ -170,68 +494,214 @@ class SpacyToSpandexUtils:
 
         if annotation_layers & AnnotationLayers.SENTENCE:
             spndx.add_annotations(
-                *[SpacyToSpandexUtils.convert_sentence(s, window_span) for s in spacy_doc.sents])
+                *[SpacyToSpandexUtils.convert_sentence(s, window_span, keep_source) for s in spacy_doc.sents])
 
         # Extract tokens and dependency parse
         spacy_toks = [t for t in spacy_doc]
         if annotation_layers & AnnotationLayers.TOKEN:
-            all_toks = [SpacyToSpandexUtils.convert_token(t, window_span) for t in spacy_toks]
+            all_toks = [SpacyToSpandexUtils.convert_token(t, window_span, keep_source) for t in spacy_toks]
             word_toks = [(tok, spacy_tok) for (tok, spacy_tok) in zip(all_toks, spacy_toks) if not spacy_tok.is_space]
             toks = [tok for (tok, spacy_tok) in word_toks]
             spndx.add_annotations(*toks)
 
             if annotation_layers & AnnotationLayers.DEPPARSE:
-                # Pull out dependency graphs
-                span_to_nodes = {tok.span: DependencyNode(begin=tok.begin, end=tok.end) for tok in toks}
-
-                depedges = []
-                depnodes = []
-                depnode_spans = set()
-                for (tok, spacy_tok) in word_toks:
-                    headtok = all_toks[spacy_tok.head.i]
-                    head_node = span_to_nodes[headtok.span]
-                    child_span = tok.span
-                    child_node = span_to_nodes[child_span]
-
-                    # get span for full dependency
-                    depspan = Span(begin=min(tok.begin, headtok.begin),
-                                   end=max(tok.end, headtok.end))
-                    # Build edges
-                    depedge = DependencyEdge(label=spacy_tok.dep_, head=head_node, child=child_node)
-                    depedge.span = depspan
-                    child_node.head_edge = depedge
-                    head_node.child_edges.append(depedge)
-                    if headtok.span not in depnode_spans:
-                        depnodes.append(head_node)
-                        depnode_spans.add(head_node.span)
-
-                    if child_span not in depnode_spans:
-                        depnodes.append(child_node)
-                        depnode_spans.add(child_span)
-                    depedges.append(depedge)
+                depnodes, depedges, depparses = build_dependency_layer(
+                    [t.begin for t in all_toks], [t.end for t in all_toks], [t.head.i for t in spacy_toks],
+                    [t.dep_ for t in spacy_toks], [t.is_space for t in spacy_toks],
+                    [(s.start, s.end) for s in spacy_doc.sents])
                 # push dependency graph onto spandex
-                spndx.add_annotations(*depedges)
-                spndx.add_annotations(*depnodes)
-
-                dep_parses = []
-                for sent in spndx.select(Sentence):
-                    dep_parse = DependencyParse(begin=sent.begin, end=sent.end)
-                    dep_nodes = [n for n in spndx.select_covered(DependencyNode, dep_parse)]
-                    for dep_node in dep_nodes:
-                        if not dep_parse.root and dep_node.is_root:
-                            # found the root
-                            dep_parse.root = dep_node
-                    dep_parses.append(dep_parse)
-
-                spndx.add_annotations(*dep_parses)
+                spndx.add_annotations(*depedges, *depnodes, *depparses)
 
         if annotation_layers & AnnotationLayers.ENTITY:
-            spndx.add_annotations(*[SpacyToSpandexUtils.convert_entity(e, window_span) for e in spacy_doc.ents])
+            spndx.add_annotations(
+                *[SpacyToSpandexUtils.convert_entity(e, window_span, keep_source) for e in spacy_doc.ents])
 
         if annotation_layers & AnnotationLayers.NOUN_CHUNK:
             spndx.add_annotations(
                 *[SpacyToSpandexUtils.convert_noun_chunk(n, window_span) for n in spacy_doc.noun_chunks])
 
+        return spndx
+
+    @staticmethod
+    def spacy_to_spandex_arrays(spacy_doc, spndx=None, annotation_layers=AnnotationLayers.ALL(), window_span=None,
+                                tokens: Optional[List[Token]] = None, keep_source: bool = False,
+                                token_range: Optional[Tuple[int, int]] = None, offset: Optional[int] = None):
+        """
+        Convert a spacy document into annotations on a Spandex reading token attributes with a single
+        `Doc.to_array` call.  All layers are inserted into the Spandex at once.
+
+        If the spacy document was built from existing `tokens` (one per spacy token), analyses are merged
+        onto those tokens instead of creating new ones, and their offsets are used for all other layers.
+        `token_range` restricts conversion to annotations within a range of token indices, and `offset`
+        overrides the character offset otherwise taken from `window_span`.
+        """
+        if not spndx:
+            spndx = Spandex(parent=None, content_string=spacy_doc.text_with_ws)
+
+        if offset is None:
+            offset = window_span.begin if window_span else 0
+        if tokens is not None:
+            arrays = SpacyDocArrays(spacy_doc, begins=[t.begin for t in tokens], ends=[t.end for t in tokens],
+                                    token_range=token_range)
+        else:
+            arrays = SpacyDocArrays(spacy_doc, offset=offset, token_range=token_range)
+        annotations = []
+
+        if annotation_layers & AnnotationLayers.DOCUMENT:
+            if window_span:
+                annotations.append(Document(begin=window_span.begin, end=window_span.end))
+            else:
+                annotations.append(Document(begin=0, end=len(spndx.content_string)))
+
+        if annotation_layers & AnnotationLayers.SENTENCE:
+            sentences = arrays.sentences()
+            if keep_source:
+                for sent, (start, end) in zip(sentences, arrays.sentence_bounds()):
+                    sent.source = spacy_doc[start:end]
+            annotations.extend(sentences)
+
+        if annotation_layers & AnnotationLayers.TOKEN:
+            if tokens is not None:
+                arrays.merge_tokens(tokens)
+            else:
+                new_tokens = arrays.tokens()
+                if keep_source:
+                    for tok, spacytok in zip(new_tokens, spacy_doc):
+                        if tok is not None:
+                            tok.source = spacytok
+                annotations.extend(t for t in new_tokens if t is not None)
+
+            if annotation_layers & AnnotationLayers.DEPPARSE:
+                depnodes, depedges, depparses = arrays.dependencies()
+                annotations.extend(depedges)
+                annotations.extend(depnodes)
+                annotations.extend(depparses)
+
+        if annotation_layers & AnnotationLayers.ENTITY:
+            entities = arrays.entities()
+            if keep_source:
+                for entity, (start, end, _) in zip(entities, arrays.entity_bounds()):
+                    entity.source = spacy_doc[start:end]
+            annotations.extend(entities)
+
+        if annotation_layers & AnnotationLayers.NOUN_CHUNK:
+            annotations.extend(arrays.noun_chunks())
+
+        spndx.add_annotations(*annotations)
+        return spndx
+
+
+class PretokenizedTokenizer(object):
+    """
+    Tokenizer building spacy documents from JSON encoded `[words, spaces]` lists instead of raw text, so
+    already tokenized documents can be sent through `nlp.pipe` and its worker processes
+    """
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def __call__(self, text: str):
+        from spacy.tokens import Doc
+
+        words, spaces = json.loads(text)
+        return Doc(self.vocab, words=words, spaces=spaces)
+
+
+class LayerPipeline(object):
+    """
+    Runs a subset of a spacy pipeline's components.  Texts are tokenized with `nlp.make_doc` and then
+    handed through the selected components in pipeline order.
+    """
+
+    def __init__(self, nlp, components: List[Tuple[str, object]], disabled: List[str]):
+        """
+        Args:
+            nlp: spacy `Language` the components belong to
+            components: (name, component) pairs to run, in order
+            disabled: names of the components of `nlp` that are skipped
+        """
+        self.nlp = nlp
+        self.components = components
+        self.disabled = disabled
+
+    @property
+    def pipe_names(self) -> List[str]:
+        return [name for name, _ in self.components]
+
+    def __call__(self, text: str):
+        doc = self.nlp.make_doc(text)
+        for _, component in self.components:
+            doc = component(doc)
+        return doc
+
+    def pipe_docs(self, docs: Iterable, batch_size: int = 64, n_process: int = 1):
+        """
+        Run the components over already tokenized spacy documents.  With `n_process` other than one the
+        documents are handed to spacy's worker processes as serialized words and spaces.
+        """
+        own_components = [name for name, _ in self.components if name not in self.nlp.pipe_names]
+        if n_process != 1 and not own_components:
+            texts = [json.dumps([[t.text for t in doc], [bool(t.whitespace_) for t in doc]]) for doc in docs]
+            tokenizer = self.nlp.tokenizer
+            self.nlp.tokenizer = PretokenizedTokenizer(self.nlp.vocab)
+            try:
+                return list(self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=self.disabled))
+            finally:
+                self.nlp.tokenizer = tokenizer
+
+        for _, component in self.components:
+            if hasattr(component, "pipe"):
+                docs = component.pipe(docs, batch_size=batch_size)
+            else:
+                docs = (component(doc) for doc in docs)
+        return docs
+
+    def pipe(self, texts: Iterable[str], batch_size: int = 64, n_process: int = 1):
+        own_components = [name for name, _ in self.components if name not in self.nlp.pipe_names]
+        if n_process != 1 and not own_components:
+            # let spacy handle the worker processes
+            return self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=self.disabled)
+
+        return self.pipe_docs((self.nlp.make_doc(text) for text in texts), batch_size=batch_size)
+
+
+# boundaries at which long texts may be split, from most to least preferred
+CHUNK_BOUNDARY_PATTERNS = (
+    re.compile(r'\n[^\S\n]*\n\s*'),            # paragraph breaks
+    re.compile(r'[.!?][\'")\]]*\s+'),          # likely sentence ends
+    re.compile(r'\s+'),
+)
+
+
+def safe_boundary(text: str, lo: int, hi: int) -> int:
+    """
+    Return the last position in [lo, hi] at which text can be split, preferring paragraph breaks over
+    sentence ends over whitespace.  Falls back to `hi` if there is no boundary in range.
+    """
+    for pattern in CHUNK_BOUNDARY_PATTERNS:
+        last = None
+        for last in pattern.finditer(text, lo, hi):
+            pass
+        if last is not None and last.end() > lo:
+            return last.end()
+    return hi
+
+
+def chunk_bounds(text: str, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Split text into overlapping (begin, end) chunks of at most `chunk_size` characters.  Chunks end and
+    start at safe boundaries, and consecutive chunks overlap by at least `overlap` characters where possible.
+    """
+    overlap = min(overlap, chunk_size // 4)
+    bounds = []
+    begin = 0
+    while len(text) - begin > chunk_size:
+        end = safe_boundary(text, begin + chunk_size // 2, begin + chunk_size)
+        bounds.append((begin, end))
+        begin = safe_boundary(text, max(end - 2 * overlap, begin + 1), end - overlap)
+    bounds.append((begin, len(text)))
+    return bounds
+
 
 class SpacyAnalyzer(AnalysisFunction):
     """
@@ -239,11 +709,44 @@ class SpacyAnalyzer(AnalysisFunction):
     Spacy analyses are then converted into a common typesystem
     """
 
-    def __init__(self, spacy_pipeline=None, window_type=None):
+    # spacy components needed to populate each layer.  Sentences are handled separately since they can come
+    # from either the parser or a sentence segmenter.
+    LAYER_COMPONENTS = {
+        AnnotationLayers.TOKEN: ("tagger",),
+        AnnotationLayers.DEPPARSE: ("parser",),
+        AnnotationLayers.NOUN_CHUNK: ("parser",),
+        AnnotationLayers.ENTITY: ("ner", "entity_ruler"),
+    }
+    SENTENCE_COMPONENTS = ("senter", "sentencizer")
+
+    def __init__(self, spacy_pipeline=None, window_type=None, batch_size: int = 64, n_process: int = 1,
+                 model_name: str = "en_core_web_sm", model_config: Optional[Dict] = None, registry=None,
+                 token_type=None, keep_source: bool = False, chunk_size: Optional[int] = None,
+                 chunk_overlap: int = 2000):
         """
         @param spacy_pipeline: a spacy model pipeline function which accepts text
                 and returns a spacy document.  Default value of None will trigger
-                creation and initialization of the Spacy English model.
+                loading of `model_name` from the shared model registry the first time the
+                analyzer is used.
+        @param window_type: annotation type over which to run analyses (i.e. over sentences, paragraphs, etc)
+        @param batch_size: number of texts handed to `nlp.pipe` per batch.  Texts are grouped by length
+                so that batches hold texts of similar size.
+        @param n_process: number of processes `nlp.pipe` should use (requires spacy>=2.2)
+        @param model_name: name of the spacy model to load when no pipeline is given
+        @param model_config: keyword arguments passed to `spacy.load` along with `model_name`
+        @param registry: `ModelRegistry` to acquire the model from.  Defaults to the process-wide registry,
+                so analyzers configured with the same model share one copy of it.
+        @param token_type: when given, spacy documents are built from the existing annotations of this type
+                (e.g. `Token` from `SimpleTokenizer`) instead of running spacy's tokenizer.  Tagger output is
+                merged onto those annotations rather than adding a second token layer.
+        @param chunk_size: texts (views or windows) longer than this many characters are split into
+                overlapping chunks at paragraph or sentence boundaries.  Chunks are parsed together with
+                `nlp.pipe`, so they use `n_process` workers, and the results are stitched back together.
+                Defaults to the pipeline's `max_length`, so only texts spacy would refuse are chunked.
+        @param chunk_overlap: number of characters consecutive chunks overlap by
+        @param keep_source: link converted annotations to the spacy objects they came from via a `source`
+                attribute.  Off by default since the links keep every spacy document alive along with the
+                Spandex.
 
         Example:
             # initialize pipeline
@@ -253,15 +756,339 @@ class SpacyAnalyzer(AnalysisFunction):
             layers = AnnotationLayers.DOCUMENT | AnnotationLayers.SENTENCE \
                     | AnnotationLayers.TOKEN
             spacy_analyzer(spndx, annotation_layers=layers)
+
+            # process many documents at once with nlp.pipe
+            spacy_analyzer.process_batch(jemdocs)
+
+        Only the spacy components needed for the requested annotation layers are run, e.g. tokenizing and
+        sentence splitting skips the parser and entity recognizer.  Components the analyzer does not know
+        about are always run.
         """
-        if spacy_pipeline:
-            self.spacy_pipeline = spacy_pipeline
-        else:
-            # no pipeline is specified so go ahead and initialize one
-            import spacy
-            self.spacy_pipeline = spacy.load("en_core_web_sm")
+        self._spacy_pipeline = spacy_pipeline
+        self._acquired = False
+        # model is only loaded from the registry when no pipeline is specified
+        self.model_name = None if spacy_pipeline else model_name
+        self.model_config = dict(model_config or {})
+        self._registry = registry
+        self.token_type = token_type
+        self.keep_source = keep_source
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
 
         self.window_type = window_type
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self._layer_pipelines = {}
+
+    @property
+    def input_types(self):
+        return tuple(t for t in (self.window_type, self.token_type) if t)
+
+    @property
+    def cacheable(self) -> bool:
+        """
+        Whether `CachedAnalysisFunction` can replay results.  With `token_type` tagger output is merged onto
+        existing tokens, and edits to existing annotations are not captured by the cache.
+        """
+        return not self.token_type
+
+    @property
+    def registry(self):
+        return self._registry if self._registry is not None else get_model_registry()
+
+    @property
+    def spacy_pipeline(self):
+        if self._spacy_pipeline is None:
+            # no pipeline is specified so go ahead and acquire one from the shared registry
+            self._spacy_pipeline = self.registry.acquire(self.model_name, **self.model_config)
+            self._acquired = True
+        return self._spacy_pipeline
+
+    def fingerprint_config(self) -> Dict:
+        """
+        Identify the model for cache keys.  Models loaded from the registry are identified by `model_name`
+        and `model_config`, pipelines given directly by their language, name, version and components.
+        """
+        return {"model": self._spacy_pipeline if self.model_name is None else None}
+
+    def release_model(self):
+        """
+        Hand the model back to the registry if it was acquired from it.  The model is acquired again if the
+        analyzer is used afterwards.
+        """
+        if self._acquired:
+            self.registry.release(self.model_name, **self.model_config)
+            self._spacy_pipeline = None
+            self._acquired = False
+            self._layer_pipelines = {}
+
+    def required_components(self, annotation_layers: AnnotationLayers) -> List[str]:
+        """
+        Return names of the components of the spacy pipeline needed to populate `annotation_layers`.  If
+        sentences are requested without a parse and the pipeline has no sentence segmenter, "sentencizer"
+        is included and added when the layer pipeline is built.
+        """
+        pipe_names = self.spacy_pipeline.pipe_names
+        needed = set()
+        for layer, components in self.LAYER_COMPONENTS.items():
+            if annotation_layers & layer:
+                needed.update(components)
+
+        if annotation_layers & AnnotationLayers.SENTENCE and "parser" not in needed:
+            # the parser also sets sentence boundaries, but a segmenter is much cheaper
+            segmenters = [name for name in self.SENTENCE_COMPONENTS if name in pipe_names]
+            needed.add(segmenters[0] if segmenters else "sentencizer")
+
+        known = {name for components in self.LAYER_COMPONENTS.values() for name in components}
+        known.update(self.SENTENCE_COMPONENTS)
+        required = [name for name in pipe_names if name in needed or name not in known]
+        if "sentencizer" in needed and "sentencizer" not in pipe_names:
+            required.append("sentencizer")
+        return required
+
+    def layer_pipeline(self, annotation_layers: AnnotationLayers):
+        """
+        Return a pipeline running only the components needed for `annotation_layers`.  One pipeline is
+        built per layer mask and reused.  The full spacy pipeline is returned if every component is needed,
+        or if it is not a spacy `Language`.
+        """
+        nlp = self.spacy_pipeline
+        if not (hasattr(nlp, "pipeline") and hasattr(nlp, "make_doc")):
+            return nlp
+
+        try:
+            return self._layer_pipelines[annotation_layers]
+        except KeyError:
+            pass
+
+        required = self.required_components(annotation_layers)
+        if required == nlp.pipe_names:
+            pipeline = nlp
+        else:
+            components = dict(nlp.pipeline)
+            if "sentencizer" in required and "sentencizer" not in components:
+                from spacy.pipeline import Sentencizer
+                components["sentencizer"] = Sentencizer()
+            disabled = [name for name in nlp.pipe_names if name not in required]
+            pipeline = LayerPipeline(nlp, [(name, components[name]) for name in required], disabled)
+
+        self._layer_pipelines[annotation_layers] = pipeline
+        return pipeline
+
+    def pipe_texts(self, texts: List[str], annotation_layers: AnnotationLayers = AnnotationLayers.ALL()) -> List:
+        """
+        Run spacy over texts and return spacy documents in the same order as the texts.
+
+        Texts are sorted by length before being handed to `nlp.pipe`, so each batch holds texts of
+        similar length.
+        """
+        nlp = self.layer_pipeline(annotation_layers)
+        if not hasattr(nlp, "pipe"):
+            # plain callables get no batching
+            return [nlp(text) for text in texts]
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        pipe_kwargs = {"batch_size": self.batch_size}
+        if self.n_process != 1:
+            pipe_kwargs["n_process"] = self.n_process
+
+        spacy_docs = [None] * len(texts)
+        piped = nlp.pipe((texts[i] for i in order), **pipe_kwargs)
+        for i, spacy_doc in zip(order, piped):
+            spacy_docs[i] = spacy_doc
+        return spacy_docs
+
+    def pipe_docs(self, docs: List, annotation_layers: AnnotationLayers = AnnotationLayers.ALL()) -> List:
+        """
+        Run the spacy components needed for `annotation_layers` over already tokenized spacy documents
+        """
+        nlp = self.layer_pipeline(annotation_layers)
+        if not isinstance(nlp, LayerPipeline):
+            nlp = LayerPipeline(nlp, nlp.pipeline, [])
+        return list(nlp.pipe_docs(docs, batch_size=self.batch_size, n_process=self.n_process))
+
+    def tokens_to_doc(self, spndx: Spandex, tokens: List[Token]):
+        """
+        Build a spacy document from existing tokens.  Tokens followed by a gap are marked as followed by a space.
+        """
+        from spacy.tokens import Doc
+
+        text = spndx.content_string
+        words = [text[t.begin:t.end] for t in tokens]
+        spaces = [nxt.begin > tok.end for tok, nxt in zip(tokens, tokens[1:])]
+        if tokens:
+            spaces.append(len(text) > tokens[-1].end)
+        return Doc(self.spacy_pipeline.vocab, words=words, spaces=spaces)
+
+    def windows(self, spndx: Spandex) -> List[Optional[Span]]:
+        """
+        Return the windows of the view to process.  A window of None stands for the full view
+        """
+        if not self.window_type:
+            return [None]
+        return spndx.select(self.window_type)
+
+    def process_views(self, spndxs: Iterable[Spandex], **kwargs):
+        """
+        Run spacy over the given views, sending all of their windows through `nlp.pipe` together.  With
+        `n_process` greater than one, the windows of even a single large view are parsed in parallel.
+        """
+        annotation_layers = kwargs.get('annotation_layers', AnnotationLayers.ALL())
+        tracer = get_tracer()
+
+        tasks = [(spndx, window) for spndx in spndxs for window in self.windows(spndx)]
+
+        if self.token_type:
+            tokens = [spndx.select(self.token_type) if window is None else spndx.select_covered(self.token_type, window)
+                      for spndx, window in tasks]
+            with tracer.span("spacy.parse", cat="spacy", texts=len(tasks), tokens=sum(len(t) for t in tokens)):
+                docs = [self.tokens_to_doc(spndx, toks) for (spndx, _), toks in zip(tasks, tokens)]
+                spacy_docs = self.pipe_docs(docs, annotation_layers)
+        else:
+            texts = [spndx.content_string if window is None else spndx.spanned_text(window)
+                     for spndx, window in tasks]
+
+            limit = self.chunk_limit()
+            if limit:
+                for (spndx, window), text in zip(tasks, texts):
+                    if len(text) > limit:
+                        self.process_chunked(spndx, window, text, limit, annotation_layers)
+                keep = [i for i, text in enumerate(texts) if len(text) <= limit]
+                tasks = [tasks[i] for i in keep]
+                texts = [texts[i] for i in keep]
+
+            tokens = [None] * len(tasks)
+            with tracer.span("spacy.parse", cat="spacy", texts=len(texts), characters=sum(len(t) for t in texts)):
+                spacy_docs = self.pipe_texts(texts, annotation_layers)
+
+        # annotations of all windows of a view are inserted together, so the view is only sorted once
+        added = {}
+        for (spndx, window), spacy_doc, toks in zip(tasks, spacy_docs, tokens):
+            with tracer.span("spacy.convert", cat="spacy", tokens=len(spacy_doc)):
+                scratch = Spandex(parent=None, content_string=spndx.content_string)
+                SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, scratch, annotation_layers, window, tokens=toks,
+                                                     keep_source=self.keep_source)
+                added.setdefault(id(spndx), (spndx, []))[1].extend(scratch.annotations)
+
+        for spndx, annotations in added.values():
+            with tracer.span("spandex.add_annotations", cat="spandex", annotations=len(annotations)):
+                spndx.add_annotations(*annotations)
+
+    def chunk_limit(self) -> Optional[int]:
+        """
+        Return the length above which texts are chunked, or None if they never are
+        """
+        if self.chunk_size:
+            return self.chunk_size
+        return getattr(self.spacy_pipeline, "max_length", None)
+
+    @staticmethod
+    def stitch_chunks(text: str, bounds: List[Tuple[int, int]], spacy_docs: List
+                      ) -> Tuple[List[Tuple[int, object, Tuple[int, int]]], List[Tuple[int, int]]]:
+        """
+        Decide which part of each overlapping chunk to keep.  Chunks are visited in order while tracking a
+        frontier up to which text has been covered, which always lies on a sentence boundary.  From every
+        chunk the sentences starting at or after the frontier are accepted, except for sentences that may
+        have been cut off: the last sentence of a non-final chunk, and the first sentence of a chunk unless
+        it starts right at the frontier.  Text between the frontier and the first accepted sentence of the
+        next chunk is returned as a gap to be processed separately.  Gaps start and end on sentence
+        boundaries, so they are parsed as they would be as part of the full text.
+
+        Returns:
+            (chunk begin, spacy document, accepted token range) for each chunk, and (begin, end) of each gap
+        """
+        pieces = []
+        gaps = []
+        frontier = 0
+        for i, ((chunk_begin, _), spacy_doc) in enumerate(zip(bounds, spacy_docs)):
+            sents = [(sent.start, sent.end) for sent in spacy_doc.sents]
+            starts = [chunk_begin + spacy_doc[start].idx for start, _ in sents]
+            first = next((j for j, start in enumerate(starts) if start >= frontier), len(sents))
+            if first == 0 and starts[0] != frontier:
+                # the chunk starts inside a sentence covered by the frontier or the next gap
+                first = 1
+
+            stop = len(sents) if i == len(bounds) - 1 else len(sents) - 1
+            if first >= stop:
+                continue
+
+            if starts[first] > frontier and text[frontier:starts[first]].strip():
+                gaps.append((frontier, starts[first]))
+
+            pieces.append((chunk_begin, spacy_doc, (sents[first][0], sents[stop - 1][1])))
+            # a token's trailing space belongs to it, further whitespace starts the next sentence
+            end_token = spacy_doc[sents[stop - 1][1] - 1]
+            frontier = chunk_begin + end_token.idx + len(end_token.text_with_ws)
+
+        if text[frontier:].strip():
+            gaps.append((frontier, len(text)))
+        return pieces, gaps
+
+    def process_gaps(self, text: str, gaps: List[Tuple[int, int]], limit: int,
+                     annotation_layers: AnnotationLayers) -> List[Tuple[int, object, Optional[Tuple[int, int]]]]:
+        """
+        Parse the gaps left by `stitch_chunks`.  Gaps start on a sentence boundary, so gaps of up to `limit`
+        characters are parsed together in one go.  Longer gaps are parsed one chunk at a time, each chunk
+        starting at the last, possibly cut off, sentence of the previous one.  Only sentences longer than the
+        limit end up split.
+
+        Returns:
+            (begin, spacy document, accepted token range or None for all tokens) for each parsed piece
+        """
+        short = [(begin, end) for begin, end in gaps if end - begin <= limit]
+        spacy_docs = self.pipe_texts([text[begin:end] for begin, end in short], annotation_layers)
+        pieces = [(begin, spacy_doc, None) for (begin, _), spacy_doc in zip(short, spacy_docs)]
+
+        for begin, gap_end in gaps:
+            if gap_end - begin <= limit:
+                continue
+            while gap_end - begin > limit:
+                end = safe_boundary(text, begin + limit // 2, begin + limit)
+                spacy_doc = self.pipe_texts([text[begin:end]], annotation_layers)[0]
+                last_start = list(spacy_doc.sents)[-1].start
+                if last_start == 0:
+                    # a single sentence spans the whole chunk
+                    end_token = spacy_doc[len(spacy_doc) - 1]
+                    pieces.append((begin, spacy_doc, None))
+                    begin += end_token.idx + len(end_token.text_with_ws)
+                else:
+                    pieces.append((begin, spacy_doc, (0, last_start)))
+                    begin += spacy_doc[last_start].idx
+            if text[begin:gap_end].strip():
+                pieces.append((begin, self.pipe_texts([text[begin:gap_end]], annotation_layers)[0], None))
+        return pieces
+
+    def process_chunked(self, spndx: Spandex, window: Optional[Span], text: str, limit: int,
+                        annotation_layers: AnnotationLayers):
+        """
+        Process a text longer than `limit` characters in overlapping chunks and stitch the results together.
+        All annotations are inserted into the view at once.
+        """
+        tracer = get_tracer()
+        base = window.begin if window else 0
+        # sentence boundaries are needed to stitch chunks even if sentences are not requested
+        chunk_layers = annotation_layers | AnnotationLayers.SENTENCE
+        bounds = chunk_bounds(text, limit, self.chunk_overlap)
+
+        with tracer.span("spacy.parse", cat="spacy", texts=len(bounds), characters=len(text), chunked=True):
+            spacy_docs = self.pipe_texts([text[begin:end] for begin, end in bounds], chunk_layers)
+            pieces, gaps = self.stitch_chunks(text, bounds, spacy_docs)
+
+            pieces.extend(self.process_gaps(text, gaps, limit, chunk_layers))
+
+        with tracer.span("spacy.convert", cat="spacy", chunks=len(pieces)):
+            annotations = []
+            if annotation_layers & AnnotationLayers.DOCUMENT:
+                annotations.append(Document(begin=base, end=base + len(text)))
+
+            piece_layers = annotation_layers & ~AnnotationLayers.DOCUMENT
+            for chunk_begin, spacy_doc, token_range in pieces:
+                scratch = Spandex(parent=None, content_string=spndx.content_string)
+                SpacyToSpandexUtils.spacy_to_spandex_arrays(spacy_doc, scratch, piece_layers,
+                                                            keep_source=self.keep_source, token_range=token_range,
+                                                            offset=base + chunk_begin)
+                annotations.extend(scratch.annotations)
+            spndx.add_annotations(*annotations)
 
     @process_default_view
     def process(self, spndx: Spandex, **kwargs):
@@ -273,26 +1100,12 @@ class SpacyAnalyzer(AnalysisFunction):
             annotation_layers (:obj:`AnnotationLayer`): Bitwise mask of AnnotationLayers
                 indicating which layers to populate in Spandex.  Default value is
                 AnnotationLayers.ALL()
-
-            window_type (str or type): Class Type of object to run processing
-                over.  A common use case would be to run on boundaries already
-                defined prior to processing.  For example processing a document
-                by subsection boundaries  Default of None means to process the
-                full contents of the Spandex.
         """
+        self.process_views([spndx], **kwargs)
 
-        # FIXME, better in init or as kwargs?
-        # window_type = kwargs.get('window_type', None)
-        annotation_layers = kwargs.get('annotation_layers', AnnotationLayers.ALL())
-
-        if not self.window_type:
-            # process full document
-            spacy_doc = self.spacy_pipeline(spndx.content_string)
-            SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, spndx, annotation_layers)
-        else:
-            # process over windows
-            for window in spndx.select(self.window_type):
-                window_text = spndx.spanned_text(window)
-                spacy_doc = self.spacy_pipeline(window_text)
-                SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, spndx, annotation_layers, window)
-
+    def process_batch(self, jemdocs: Iterable[JembatanDoc], **kwargs):
+        """
+        Process the default views of several documents with batched calls to `nlp.pipe`.  Takes the
+        same keyword arguments as `process`.
+        """
+        self.process_views([jemdoc.default_view for jemdoc in jemdocs], **kwargs)
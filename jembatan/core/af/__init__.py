@@ -1,6 +1,7 @@
 from functools import wraps
-from typing import Dict, Optional, Union
+from typing import Dict, Iterable, Optional, Union
 import jembatan.core.spandex as spandex
+from jembatan.core.trace import get_tracer
 
 
 def process_default_view(f):
@@ -23,6 +24,10 @@ class AnalysisFunction(object):
     __call__(self, spndx) will work as well.
     """
 
+    # Annotation types this analysis function reads.  Pipelines use this to decide which annotation
+    # layers can be dropped early.  None indicates any annotation may be read.
+    input_types = None
+
     def process(self, jemdoc: spandex.JembatanDoc, **kwargs):
         """
         Override this method to define Annotator behavior.  Typically this is used to add annotation or data to the
@@ -36,6 +41,19 @@ class AnalysisFunction(object):
         """
         pass
 
+    def process_batch(self, jemdocs: Iterable[spandex.JembatanDoc], **kwargs):
+        """
+        Process several documents at once.  Override this method when an analysis function can
+        amortize work across documents, e.g. by batching calls to an underlying model.  By default
+        documents are processed one at a time.
+
+        Args:
+            jemdocs(:obj:`list` of :obj:`JembatanDoc`) - JembatanDoc objects to process
+            **kwargs - Arbitrary keyword arguments passed on as with `process`
+        """
+        for jemdoc in jemdocs:
+            self.process(jemdoc, **kwargs)
+
     def __call__(self, jemdoc: spandex.JembatanDoc, **kwargs):
         """ Processes Spandex object.  In most cases this should not be 
         overridden.  Instead subclasses should override the `process` method.
@@ -97,6 +115,20 @@ class AggregateAnalysisFunction(AnalysisFunction):
         self.view_maps = []
         self.af_kwargs_list = []
 
+    @property
+    def input_types(self):
+        """
+        Union of annotation types read by the aggregated analysis functions, or None if any
+        of them may read any annotation
+        """
+        input_types = []
+        for annotator in self.annotators:
+            annotator_input_types = getattr(annotator, 'input_types', None)
+            if annotator_input_types is None:
+                return None
+            input_types.extend(t for t in annotator_input_types if t not in input_types)
+        return tuple(input_types)
+
     def add(self, analysis_func: AnalysisFunction, view_map: Optional[Dict[str, str]]=None, **kwargs):
         """ Add analysis function to pipeline
 
@@ -137,4 +169,6 @@ class AggregateAnalysisFunction(AnalysisFunction):
             else:
                 mapped_jemdoc = jemdoc
 
-            annotator(mapped_jemdoc, **af_kwargs)
+            with get_tracer().span(getattr(annotator, '__qualname__', annotator.__class__.__name__),
+                                   cat="analysis_function", step=step):
+                annotator(mapped_jemdoc, **af_kwargs)
@@ -15,6 +15,7 @@ class ViewCreator(AnalysisFunction):
     your annotator (when it asks for the default view) will not be created
     unless you have explicitly created it.
     """
+    input_types = ()
 
     def process(self, jemdoc: JembatanDoc, viewname, **kwargs):
         self.create_view_safely(jemdoc, viewname)
@@ -25,6 +26,7 @@ class ViewCreator(AnalysisFunction):
 
 
 class ViewTextCopier(AnalysisFunction):
+    input_types = ()
 
     def process(self, jemdoc: JembatanDoc, src_viewname, tgt_viewname, **kwargs):
         srcview = jemdoc.get_view(src_viewname)
@@ -4,7 +4,10 @@ import json as json_
 from collections import namedtuple
 from jembatan.core.spandex.typesys_base import Span, Annotation, AnnotationScope
 from pathlib import Path
-from typing import ClassVar, Dict, Iterable, Optional, Tuple, Union
+from typing import ClassVar, Dict, Iterable, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jembatan.core.spandex.align import Alignment
 
 
 SpandexConstants = namedtuple("SpandexContstants", ["SPANDEX_DEFAULT_VIEW", "SPANDEX_URI_VIEW"])
@@ -68,6 +71,33 @@ class Spandex(object):
         self._annotations = items
         self._annotation_keys = keys
 
+    def retain_types(self, types: Tuple[type, ...]) -> int:
+        """
+        Remove all annotations that are not instances of one of `types`.  Returns the number of
+        annotations removed.
+        """
+        kept = [(a, k) for (a, k) in zip(self._annotations, self._annotation_keys) if isinstance(a, types)]
+        removed = len(self._annotations) - len(kept)
+        if removed:
+            # filtering preserves sort order so there is no need to re-sort
+            self._annotations = [a for a, _ in kept]
+            self._annotation_keys = [k for _, k in kept]
+        return removed
+
+    def snapshot(self) -> Tuple:
+        """
+        Capture content and annotations so they can be put back with `restore`
+        """
+        return self._content_string, self._content_mime, list(self._annotations), list(self._annotation_keys)
+
+    def restore(self, snapshot: Tuple):
+        """
+        Undo all changes made since `snapshot` was taken
+        """
+        self._content_string, self._content_mime, annotations, keys = snapshot
+        self._annotations = list(annotations)
+        self._annotation_keys = list(keys)
+
     def index_annotations(self, *annotations: Annotation):
         return self.add_annotations(annotations)
 
@@ -184,6 +214,17 @@ class JembatanDoc(object):
     def views(self):
         return self._views
 
+    def align(self, left_view: str, right_view: str, annotation_type: ClassVar[Annotation]) -> "Alignment":
+        """
+        Align annotations of annotation_type between two views, e.g. a gold and a system view.
+        Returns exact, overlapping and unmatched annotations, see `jembatan.core.spandex.align`.
+        """
+        from jembatan.core.spandex.align import align_annotations
+
+        left = self.get_view(left_view).select(annotation_type)
+        right = self.get_view(right_view).select(annotation_type)
+        return align_annotations(left, right)
+
 
 class ViewMappedSpandex(object):
 
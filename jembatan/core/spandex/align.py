@@ -0,0 +1,183 @@
+from collections import deque
+from jembatan.core.spandex.typesys_base import Annotation, Span
+from typing import ClassVar, Iterable, Iterator, List, NamedTuple, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jembatan.core.spandex import JembatanDoc
+
+
+Bounds = Sequence[Tuple[int, int]]
+
+
+class Alignment(NamedTuple):
+    """
+    Result of aligning the annotations of two views.
+
+    exact - (left, right) pairs with the same begin and end
+    overlap - (left, right) pairs of annotations without an exact match which overlap
+    left_unmatched, right_unmatched - annotations neither matching nor overlapping any from the other side
+    """
+    exact: List[Tuple[Annotation, Annotation]]
+    overlap: List[Tuple[Annotation, Annotation]]
+    left_unmatched: List[Annotation]
+    right_unmatched: List[Annotation]
+
+
+class OffsetAlignment(NamedTuple):
+    """
+    `Alignment` in terms of indices into the aligned sequences
+    """
+    exact: List[Tuple[int, int]]
+    overlap: List[Tuple[int, int]]
+    left_unmatched: List[int]
+    right_unmatched: List[int]
+
+
+def align_offsets(left: Bounds, right: Bounds) -> OffsetAlignment:
+    """
+    Align two sequences of (begin, end) offsets with sorted sweeps, in time linear in the number of offsets
+    and overlapping pairs when the offsets are already sorted, as layers of a `Spandex` are.
+
+    Offsets with the same begin and end are paired one to one in order.  Offsets left without an exact match
+    are then paired with every offset without an exact match they overlap.
+    """
+    left_order = sorted(range(len(left)), key=left.__getitem__)
+    right_order = sorted(range(len(right)), key=right.__getitem__)
+
+    # merge join on (begin, end)
+    exact = []
+    left_rest, right_rest = [], []
+    i = j = 0
+    while i < len(left_order) and j < len(right_order):
+        li, rj = left_order[i], right_order[j]
+        if left[li] == right[rj]:
+            exact.append((li, rj))
+            i += 1
+            j += 1
+        elif left[li] < right[rj]:
+            left_rest.append(li)
+            i += 1
+        else:
+            right_rest.append(rj)
+            j += 1
+    left_rest.extend(left_order[i:])
+    right_rest.extend(right_order[j:])
+
+    # sweep over the remaining offsets by begin, pairing each one with the still open offsets of the other side
+    overlap = []
+    left_overlapped, right_overlapped = set(), set()
+    left_open, right_open = deque(), deque()
+    i = j = 0
+    while i < len(left_rest) or j < len(right_rest):
+        take_left = j == len(right_rest) or (i < len(left_rest) and left[left_rest[i]] <= right[right_rest[j]])
+        if take_left:
+            index = left_rest[i]
+            begin = left[index][0]
+            i += 1
+            others, own, bounds = right_open, left_open, right
+        else:
+            index = right_rest[j]
+            begin = right[index][0]
+            j += 1
+            others, own, bounds = left_open, right_open, left
+
+        # open offsets all begin at or before this one, so those still ending after its begin overlap it
+        open_now = [o for o in others if bounds[o][1] > begin]
+        others.clear()
+        others.extend(open_now)
+        for other in open_now:
+            pair = (index, other) if take_left else (other, index)
+            overlap.append(pair)
+            left_overlapped.add(pair[0])
+            right_overlapped.add(pair[1])
+        own.append(index)
+
+    overlap.sort()
+    return OffsetAlignment(
+        exact=exact,
+        overlap=overlap,
+        left_unmatched=sorted(i for i in left_rest if i not in left_overlapped),
+        right_unmatched=sorted(j for j in right_rest if j not in right_overlapped),
+    )
+
+
+def annotation_bounds(annotations: Iterable[Span]) -> List[Tuple[int, int]]:
+    return [(a.begin, a.end) for a in annotations]
+
+
+def resolve_alignment(left: Sequence[Annotation], right: Sequence[Annotation],
+                      offsets: OffsetAlignment) -> Alignment:
+    """
+    Turn an `OffsetAlignment` of two annotation sequences into an `Alignment` of the annotations
+    """
+    return Alignment(
+        exact=[(left[i], right[j]) for i, j in offsets.exact],
+        overlap=[(left[i], right[j]) for i, j in offsets.overlap],
+        left_unmatched=[left[i] for i in offsets.left_unmatched],
+        right_unmatched=[right[j] for j in offsets.right_unmatched],
+    )
+
+
+def align_annotations(left: Sequence[Annotation], right: Sequence[Annotation]) -> Alignment:
+    """
+    Align two sequences of spanned annotations, see `align_offsets`
+    """
+    return resolve_alignment(left, right, align_offsets(annotation_bounds(left), annotation_bounds(right)))
+
+
+def _align_offsets_batch(pairs: List[Tuple[Bounds, Bounds]]) -> List[OffsetAlignment]:
+    return [align_offsets(left, right) for left, right in pairs]
+
+
+def align_corpus(jemdocs: Iterable["JembatanDoc"], left_view: str, right_view: str,
+                 annotation_type: ClassVar[Annotation], n_workers: int = 1,
+                 batch_size: int = 64) -> Iterator[Tuple["JembatanDoc", Alignment]]:
+    """
+    Align annotations of `annotation_type` between two views of every document, yielding
+    (document, alignment) pairs in document order.
+
+    With `n_workers > 1` batches of documents are aligned in worker processes.  Only offsets are sent to the
+    workers and only indices come back, so the cost of shipping documents does not eat the gain.  At most
+    two batches per worker are in flight, so corpora need not fit in memory.
+
+    Args:
+        jemdocs: documents to align
+        left_view, right_view: names of the views to align, e.g. gold and system views
+        annotation_type: annotation type to align
+        n_workers: number of worker processes
+        batch_size: number of documents sent to a worker at a time
+    """
+    def batches():
+        batch = []
+        for jemdoc in jemdocs:
+            left = jemdoc.get_view(left_view).select(annotation_type)
+            right = jemdoc.get_view(right_view).select(annotation_type)
+            batch.append((jemdoc, left, right))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def resolve(batch, offsets):
+        for (jemdoc, left, right), doc_offsets in zip(batch, offsets):
+            yield jemdoc, resolve_alignment(left, right, doc_offsets)
+
+    if n_workers <= 1:
+        for batch in batches():
+            yield from ((jemdoc, align_annotations(left, right)) for jemdoc, left, right in batch)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = deque()
+        for batch in batches():
+            bounds = [(annotation_bounds(left), annotation_bounds(right)) for _, left, right in batch]
+            pending.append((batch, executor.submit(_align_offsets_batch, bounds)))
+            if len(pending) >= 2 * n_workers:
+                batch, future = pending.popleft()
+                yield from resolve(batch, future.result())
+        while pending:
+            batch, future = pending.popleft()
+            yield from resolve(batch, future.result())
@@ -0,0 +1,206 @@
+import contextlib
+import gc
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+
+def _now_us() -> float:
+    # perf_counter is backed by a system wide monotonic clock on Linux, so timestamps
+    # from worker processes on the same host line up with the parent's
+    return time.perf_counter_ns() / 1000.0
+
+
+class _TraceSpan(object):
+    """
+    Context manager recording a single complete ("X") trace event
+    """
+
+    __slots__ = ("_tracer", "_name", "_cat", "_args", "_start")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: Dict):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = _now_us()
+        args = self._args
+        if exc_type is not None:
+            args = dict(args, error=exc_type.__name__)
+        self._tracer.add_event({
+            "name": self._name,
+            "cat": self._cat,
+            "ph": "X",
+            "ts": self._start,
+            "dur": end - self._start,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+        return False
+
+
+class NullTracer(object):
+    """
+    Tracer that records nothing.  This is what instrumented code sees when tracing is not enabled.
+    """
+    enabled = False
+    _span = contextlib.nullcontext()
+
+    def span(self, name: str, cat: str = "jembatan", **args):
+        return self._span
+
+    def instant(self, name: str, cat: str = "jembatan", **args):
+        pass
+
+
+class Tracer(object):
+    """
+    Opt-in tracer that records spans as Chrome trace events.  The resulting JSON can be loaded in
+    chrome://tracing or Perfetto to inspect where time goes within a pipeline run.
+
+    Usage:
+        with Tracer() as tracer:
+            SimplePipeline.run(collection, stages)
+        tracer.to_json("pipeline_trace.json")
+
+    While a tracer is active, `SimplePipeline`, `AggregateAnalysisFunction` and the bundled analyzers
+    record one span per document per stage, as well as nested spans for their internal phases.  Time spent
+    waiting on the input collection is recorded as `read` spans and garbage collections as `gc` spans.
+
+    Worker processes can run their own tracer and hand `tracer.events` back to the parent, which merges
+    them with `add_events`.
+    """
+    enabled = True
+
+    def __init__(self, trace_gc: bool = True):
+        """
+        Args:
+            trace_gc: record garbage collection pauses as spans
+        """
+        self.trace_gc = trace_gc
+        self._events = []
+        self._lock = threading.Lock()
+        self._gc_start = {}
+        self._previous = None
+
+    def span(self, name: str, cat: str = "jembatan", **args) -> _TraceSpan:
+        """
+        Return a context manager which records a span covering its body
+        """
+        return _TraceSpan(self, name, cat, args)
+
+    def instant(self, name: str, cat: str = "jembatan", **args):
+        """
+        Record an instantaneous event
+        """
+        self.add_event({
+            "name": name, "cat": cat, "ph": "i", "s": "t", "ts": _now_us(),
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        })
+
+    def add_event(self, event: Dict):
+        with self._lock:
+            self._events.append(event)
+
+    def add_events(self, events: Iterable[Dict]):
+        """
+        Merge events recorded elsewhere, e.g. by a tracer running in a worker process
+        """
+        with self._lock:
+            self._events.extend(events)
+
+    @property
+    def events(self) -> List[Dict]:
+        with self._lock:
+            return list(self._events)
+
+    def _gc_callback(self, phase: str, info: Dict):
+        tid = threading.get_ident()
+        if phase == "start":
+            self._gc_start[tid] = _now_us()
+        elif phase == "stop" and tid in self._gc_start:
+            start = self._gc_start.pop(tid)
+            self.add_event({
+                "name": "gc", "cat": "gc", "ph": "X", "ts": start, "dur": _now_us() - start,
+                "pid": os.getpid(), "tid": tid,
+                "args": {"generation": info.get("generation"), "collected": info.get("collected")},
+            })
+
+    def start(self) -> "Tracer":
+        """
+        Make this the active tracer for the process
+        """
+        global _active_tracer
+        self._previous = _active_tracer
+        _active_tracer = self
+        if self.trace_gc:
+            gc.callbacks.append(self._gc_callback)
+        return self
+
+    def stop(self):
+        """
+        Deactivate this tracer, restoring whichever tracer was active before it
+        """
+        global _active_tracer
+        if self.trace_gc and self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        _active_tracer = self._previous if self._previous is not None else _null_tracer
+        self._previous = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+    def to_dict(self) -> Dict:
+        events = self.events
+        metadata = []
+        for pid, tid in sorted({(e["pid"], e["tid"]) for e in events}):
+            metadata.append({
+                "name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                "args": {"name": f"worker-{pid}-{tid}"},
+            })
+        return {
+            "traceEvents": metadata + sorted(events, key=lambda e: e["ts"]),
+            "displayTimeUnit": "ms",
+        }
+
+    def to_json(self, path: Union[str, Path, None] = None) -> Optional[str]:
+        """Creates Chrome trace-event JSON of recorded events
+        Args:
+            path: File path, if `None` is provided the result is returned as a string
+        Returns:
+            If `path` is None, then the JSON trace is returned as a string
+        """
+        if path is None:
+            return json.dumps(self.to_dict())
+        elif isinstance(path, (str, Path)):
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f)
+        else:
+            raise TypeError("`path` needs to be one of [str, None, Path], but was <{0}>".format(type(path)))
+
+
+_null_tracer = NullTracer()
+_active_tracer = _null_tracer
+
+
+def get_tracer() -> Union[Tracer, NullTracer]:
+    """
+    Return the active tracer, or a tracer that records nothing if tracing is not enabled
+    """
+    return _active_tracer
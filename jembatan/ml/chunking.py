@@ -1,13 +1,168 @@
 from copy import deepcopy
-from jembatan.core.af import AnalysisFunction
-from jembatan.core.spandex import Span, Spandex
+from jembatan.core.spandex import Spandex
 from jembatan.typesys import Annotation
-from typing import Iterable
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy
+
+
+class BioCodec:
+    """
+    Integer codec for BIO and BILOU chunk outcomes over a sequence of subchunks.
+
+    Code 0 is "O".  Every label takes one code per tag of the scheme, so with the BIO scheme label `k` is
+    encoded as `1 + 2 * k` (B) and `2 + 2 * k` (I).  The label vocabulary only grows, so codes handed out
+    stay valid.  The empty label gives bare "B"/"I" outcomes.
+    """
+
+    SCHEMES = {"BIO": ("B", "I"), "BILOU": ("B", "I", "L", "U")}
+
+    def __init__(self, labels: Iterable[str] = (), scheme: str = "BIO"):
+        if scheme not in self.SCHEMES:
+            raise ValueError(f"Unknown chunking scheme {scheme}, expected one of {sorted(self.SCHEMES)}")
+        self.scheme = scheme
+        self.tags = self.SCHEMES[scheme]
+        self.labels: List[str] = []
+        self.label_ids: Dict[str, int] = {}
+        self._outcomes: List[str] = ["O"]
+        self._outcome_codes: Dict[str, int] = {"O": 0}
+        for label in labels:
+            self.label_id(label)
+
+    @property
+    def outcomes(self) -> List[str]:
+        """
+        Outcome strings indexed by code
+        """
+        return self._outcomes
+
+    def label_id(self, label: str) -> int:
+        """
+        Return the id of label, adding it to the vocabulary if it is new
+        """
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            label_id = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+            for tag in self.tags:
+                outcome = f"{tag}-{label}" if label else tag
+                self._outcome_codes[outcome] = len(self._outcomes)
+                self._outcomes.append(outcome)
+        return label_id
+
+    def code(self, outcome: str) -> int:
+        """
+        Return the code of an outcome string such as "B-PER"
+        """
+        code = self._outcome_codes.get(outcome)
+        if code is None:
+            tag, _, label = outcome.partition('-')
+            if tag not in self.tags:
+                raise ValueError(f"Outcome {outcome} is not valid for the {self.scheme} scheme")
+            self.label_id(label)
+            code = self._outcome_codes[outcome]
+        return code
+
+    def encode(self, begins: numpy.ndarray, ends: numpy.ndarray, chunk_begins: numpy.ndarray,
+               chunk_ends: numpy.ndarray, chunk_labels: numpy.ndarray) -> numpy.ndarray:
+        """
+        Return an array with the code of every subchunk.
+
+        Args:
+            begins, ends: offsets of non-overlapping subchunks, sorted by begin
+            chunk_begins, chunk_ends: offsets of chunks, sorted by begin
+            chunk_labels: label id of every chunk
+
+        A chunk covers the subchunks lying entirely inside it.  Chunks covering no subchunk are dropped, as
+        are chunks overlapping an earlier chunk, since overlaps cannot be represented.
+        """
+        codes = numpy.zeros(len(begins), dtype=numpy.int32)
+        # sorted merge of chunk offsets into the subchunk offsets
+        starts = numpy.searchsorted(begins, chunk_begins, side="left")
+        stops = numpy.searchsorted(ends, chunk_ends, side="right")
+        keep = stops > starts
+        starts, stops = starts[keep], stops[keep]
+        labels = numpy.asarray(chunk_labels, dtype=numpy.int64)[keep]
+        if not len(starts):
+            return codes
+
+        if numpy.any(starts[1:] < numpy.maximum.accumulate(stops)[:-1]):
+            starts, stops, labels = self._drop_overlaps(starts, stops, labels)
+
+        width = len(self.tags)
+        base = 1 + labels * width
+        lengths = stops - starts
+        # positions of all covered subchunks, chunk by chunk
+        positions = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths) + numpy.arange(lengths.sum())
+        codes[positions] = numpy.repeat(base + 1, lengths)
+        codes[starts] = base
+        if self.scheme == "BILOU":
+            single = lengths == 1
+            codes[stops[~single] - 1] = base[~single] + 2
+            codes[starts[single]] = base[single] + 3
+        return codes
+
+    @staticmethod
+    def _drop_overlaps(starts, stops, labels):
+        kept = []
+        covered = 0
+        for i, (start, stop) in enumerate(zip(starts.tolist(), stops.tolist())):
+            if start >= covered:
+                kept.append(i)
+                covered = stop
+        return starts[kept], stops[kept], labels[kept]
+
+    def decode(self, codes: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Return (starts, stops, label ids) of the chunks in a code array, with subchunk indices `starts` and
+        exclusive `stops`.  Codes of 0 or below, such as padding, are outside chunks.  Ill-formed sequences are
+        decoded leniently: an I (or L) which does not continue a chunk of the same label starts a new chunk.
+        """
+        codes = numpy.asarray(codes)
+        inside = codes > 0
+        width = len(self.tags)
+        tags = numpy.where(inside, (codes - 1) % width, -1)
+        labels = numpy.where(inside, (codes - 1) // width, -1)
+
+        prev_tags = numpy.concatenate(([-1], tags[:-1]))
+        prev_labels = numpy.concatenate(([-1], labels[:-1]))
+        if self.scheme == "BILOU":
+            continues = (inside & ((tags == 1) | (tags == 2)) & (prev_labels == labels)
+                         & ((prev_tags == 0) | (prev_tags == 1)))
+        else:
+            continues = inside & (tags == 1) & (prev_labels == labels)
+
+        next_continues = numpy.concatenate((continues[1:], [False]))
+        starts = numpy.flatnonzero(inside & ~continues)
+        stops = numpy.flatnonzero(inside & ~next_continues) + 1
+        return starts, stops, labels[starts]
+
+    @staticmethod
+    def pad(sequences: Sequence[numpy.ndarray], pad_value: int = -1) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Stack code arrays of different lengths into a (documents, max length) matrix
+        Returns the matrix and the length of every row.
+        """
+        lengths = numpy.array([len(s) for s in sequences], dtype=numpy.int64)
+        matrix = numpy.full((len(sequences), lengths.max(initial=0)), pad_value, dtype=numpy.int32)
+        for row, sequence in zip(matrix, sequences):
+            row[:len(sequence)] = sequence
+        return matrix, lengths
 
 
 class BioChunking:
     """
     Helper class for converting between subchunks and chunks for BIO chunking tasks.
+
+    Outcomes are handled as integer arrays by a `BioCodec`, with strings such as "B-PER" available through
+    `create_outcomes`.
+
+    Usage:
+        chunking = BioChunking(Token, Entity, suffix_func=lambda e: f"-{e.label}",
+                               attrib_func=lambda e, o: setattr(e, "label", o.split("-", 1)[1]))
+        codes, lengths = chunking.encode_batch(spndxs)
+        ...
+        chunking.decode_batch(spndxs, predicted, lengths)
     """
 
     def _empty_suffix(self, chunk):
@@ -16,62 +171,107 @@ class BioChunking:
     def _no_attribute(self, chunk, outcome):
         return
 
-    def __init__(self, subchunk_type: Annotation, chunk_type: Annotation, suffix_func=None, attrib_func=None):
-
+    def __init__(self, subchunk_type: Annotation, chunk_type: Annotation, suffix_func=None, attrib_func=None,
+                 labels: Iterable[str] = (), scheme: str = "BIO"):
+        """
+        Args:
+            subchunk_type: annotation type chunks are made of, e.g. `Token`
+            chunk_type: annotation type of chunks
+            suffix_func: function returning the outcome suffix of a chunk, e.g. "-PER", or "" for no label
+            attrib_func: function called with each decoded chunk and the outcome of its first subchunk
+            labels: known chunk labels, fixing their codes
+            scheme: "BIO" or "BILOU"
+        """
         self.subchunk_type = subchunk_type
         self.chunk_type = chunk_type
         self.suffix_func = self._empty_suffix if suffix_func is None else suffix_func
         self.attrib_func = self._no_attribute if attrib_func is None else attrib_func
+        self.codec = BioCodec(labels, scheme=scheme)
 
     def parse_outcome(self, outcome):
-        parts = outcome.split('-')
-        prefix = parts[0]
-        label = parts[1] if len(parts) > 1 else ""
+        prefix, _, label = outcome.partition('-')
         return prefix, label
 
-    def create_outcomes(self, spndx: Spandex,
-                        subchunks: Iterable[Annotation], chunks: Iterable[Annotation]):
+    @staticmethod
+    def offsets(annotations: Sequence[Annotation]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        begins = numpy.fromiter((a.begin for a in annotations), dtype=numpy.int64, count=len(annotations))
+        ends = numpy.fromiter((a.end for a in annotations), dtype=numpy.int64, count=len(annotations))
+        return begins, ends
+
+    def encode(self, spndx: Spandex, subchunks: Sequence[Annotation] = None,
+               chunks: Sequence[Annotation] = None) -> numpy.ndarray:
+        """
+        Return the outcome code of every subchunk in the view
         """
+        subchunks = spndx.select(self.subchunk_type) if subchunks is None else subchunks
+        chunks = spndx.select(self.chunk_type) if chunks is None else chunks
+        begins, ends = self.offsets(subchunks)
+        chunk_begins, chunk_ends = self.offsets(chunks)
+        chunk_labels = numpy.fromiter(
+            (self.codec.label_id(self.parse_outcome(f"B{self.suffix_func(chunk)}")[1]) for chunk in chunks),
+            dtype=numpy.int64, count=len(chunks))
+        return self.codec.encode(begins, ends, chunk_begins, chunk_ends, chunk_labels)
+
+    def create_outcomes(self, spndx: Spandex, subchunks: Sequence[Annotation] = None,
+                        chunks: Sequence[Annotation] = None) -> List[str]:
         """
-        subchunk_outcomes = self.map_subchunks_to_outcome(spndx, chunks)
+        Return the outcome string of every subchunk in the view
+        """
+        outcomes = self.codec.outcomes
+        return [outcomes[code] for code in self.encode(spndx, subchunks, chunks).tolist()]
 
-        return [subchunk_outcomes.get((subchunk_span.begin, subchunk_span.end), 'O') for subchunk_span, subchunk in subchunks]
+    def decode(self, spndx: Spandex, codes: Sequence, subchunks: Sequence[Annotation] = None) -> List[Annotation]:
+        """
+        Return chunks for outcome codes, or outcome strings, of the subchunks in the view without adding them
+        """
+        subchunks = spndx.select(self.subchunk_type) if subchunks is None else subchunks
+        if len(codes) and isinstance(codes[0], str):
+            codes = [self.codec.code(outcome) for outcome in codes]
+        codes = numpy.asarray(codes)[:len(subchunks)]
 
-    def create_chunks(self, spndx: Spandex, subchunks: Iterable[Annotation], outcomes: Iterable[str]):
+        outcomes = self.codec.outcomes
+        chunks = []
+        starts, stops, _ = self.codec.decode(codes)
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            chunk = self.chunk_type(begin=subchunks[start].begin, end=subchunks[stop - 1].end)
+            self.attrib_func(chunk, outcomes[codes[start]])
+            chunks.append(chunk)
+        return chunks
+
+    def create_chunks(self, spndx: Spandex, subchunks: Sequence[Annotation] = None, outcomes: Sequence = None):
         """
+        Add chunks for outcome codes, or outcome strings, of the subchunks in the view.  Subchunks default to
+        all subchunks in the view, e.g. `create_chunks(spndx, outcomes=outcomes)`.
         attrib_func - function to parse tags and apply functions to output chunk type
         """
-        chunks = []
-        texts = [spndx.spanned_text(span) for span, _ in subchunks]
-        prev_prefix = "O"
-        prev_label = ""
-        for text, subchunk, outcome in zip(texts, subchunks, outcomes):
-
-            prefix, label = self.parse_outcome(outcome)
-
-            if prefix != "O":
-                if label != prev_label:
-                    span = Span(begin=subchunk.begin, end=subchunk.end)
-                    chunk = self.chunk_type()
-                    self.attrib_func(chunk, outcome)
-                    chunks.append((span, chunk))
-                else:
-                    chunk.end = subchunk.end
-            else:
-                chunk = None
-            prev_prefix, prev_label = prefix, label
-
-        spndx.add_layer(self.chunk_type, chunks)
-
-    def map_subchunks_to_outcome(self, spndx: Spandex, chunks: Iterable[Annotation]):
-        subchunk_outcomes = {}
-        for chunk_span, chunk in chunks:
-            for i, (subchunk_span, subchunk) in enumerate(spndx.covered(self.subchunk_type, chunk_span)):
-                tag = 'B' if i == 0 else 'I'
-                suffix = self.suffix_func(chunk)
-                subchunk_outcomes[(subchunk_span.begin, subchunk_span.end)] = f"{tag}{suffix}"
-        return subchunk_outcomes
+        if outcomes is None:
+            raise TypeError("create_chunks() requires outcomes")
+        chunks = self.decode(spndx, outcomes, subchunks)
+        spndx.add_annotations(*chunks)
+        return chunks
+
+    def map_subchunks_to_outcome(self, spndx: Spandex, chunks: Sequence[Annotation] = None):
+        subchunks = spndx.select(self.subchunk_type)
+        outcomes = self.create_outcomes(spndx, subchunks, chunks)
+        return {(s.begin, s.end): o for s, o in zip(subchunks, outcomes) if o != 'O'}
+
+    def encode_batch(self, spndxs: Iterable[Spandex], pad_value: int = -1) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Encode several views into a padded (documents, max subchunks) matrix of codes.
+        Returns the matrix and the number of subchunks of every view.
+        """
+        return self.codec.pad([self.encode(spndx) for spndx in spndxs], pad_value=pad_value)
 
+    def decode_batch(self, spndxs: Sequence[Spandex], codes: numpy.ndarray,
+                     lengths: Sequence[int] = None) -> List[List[Annotation]]:
+        """
+        Add chunks decoded from a matrix of codes, one row per view, as returned by `encode_batch`
+        """
+        chunks = []
+        for i, spndx in enumerate(spndxs):
+            row = codes[i] if lengths is None else codes[i][:lengths[i]]
+            chunks.append(self.create_chunks(spndx, outcomes=row))
+        return chunks
 
     def merge_outcomes(self, outcomes1, outcomes2):
 
@@ -96,48 +296,287 @@ class BioChunking:
         return merged
 
 
+class ChunkResults:
+    """
+    Counts of a chunk evaluation, overall and by chunk type, for the strict, ent_type, partial and exact
+    schemes.  Results of separate documents or shards are combined with `+` or `merge`, so evaluation can
+    be spread over worker processes and reduced at the end.
+    """
+
+    SCHEMES = ('strict', 'ent_type', 'partial', 'exact')
+    COUNTS = ('correct', 'incorrect', 'partial', 'missed', 'spurious', 'possible', 'actual')
+
+    def __init__(self, results: Dict[str, Dict[str, int]] = None,
+                 by_type: Dict[str, Dict[str, Dict[str, int]]] = None):
+        self.results = results if results is not None else self.empty()
+        self.by_type = by_type if by_type is not None else {}
+
+    @classmethod
+    def empty(cls) -> Dict[str, Dict[str, int]]:
+        return {scheme: {count: 0 for count in cls.COUNTS} for scheme in cls.SCHEMES}
+
+    def type_results(self, label: str) -> Dict[str, Dict[str, int]]:
+        results = self.by_type.get(label)
+        if results is None:
+            results = self.by_type[label] = self.empty()
+        return results
+
+    def add(self, other: "ChunkResults") -> "ChunkResults":
+        """
+        Add the counts of other to these results in place
+        """
+        self._add_counts(self.results, other.results)
+        for label, results in other.by_type.items():
+            self._add_counts(self.type_results(label), results)
+        return self
+
+    @staticmethod
+    def _add_counts(totals, results):
+        for scheme, counts in results.items():
+            scheme_totals = totals[scheme]
+            for count, value in counts.items():
+                scheme_totals[count] += value
+
+    def __iadd__(self, other: "ChunkResults") -> "ChunkResults":
+        return self.add(other)
+
+    def __add__(self, other: "ChunkResults") -> "ChunkResults":
+        return ChunkResults().add(self).add(other)
+
+    @classmethod
+    def merge(cls, results: Iterable["ChunkResults"]) -> "ChunkResults":
+        merged = cls()
+        for result in results:
+            merged.add(result)
+        return merged
+
+    def scores(self, scheme: str = 'strict', label: str = None) -> Dict[str, float]:
+        """
+        Return precision, recall and f1 of a scheme, overall or for one chunk type.  Partial matches count
+        half for the partial scheme.
+        """
+        counts = (self.results if label is None else self.by_type.get(label, self.empty()))[scheme]
+        correct = counts['correct']
+        if scheme == 'partial':
+            correct += 0.5 * counts['partial']
+        precision = correct / counts['actual'] if counts['actual'] else 0.0
+        recall = correct / counts['possible'] if counts['possible'] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {'precision': precision, 'recall': recall, 'f1': f1}
+
+    def to_dict(self) -> Dict:
+        return {'results': deepcopy(self.results), 'by_type': deepcopy(self.by_type)}
+
+
+# outcome of a predicted chunk in each scheme, in ChunkResults.SCHEMES order
+_MATCH_OUTCOMES = {
+    'correct': ('correct', 'correct', 'correct', 'correct'),
+    'boundary': ('incorrect', 'incorrect', 'correct', 'correct'),
+    'overlap_type': ('incorrect', 'correct', 'partial', 'incorrect'),
+    'overlap': ('incorrect', 'incorrect', 'partial', 'incorrect'),
+    'spurious': ('spurious', 'spurious', 'spurious', 'spurious'),
+}
+
+
 class ChunkMetrics:
+    """
+    Chunk evaluation following the MUC inspired schemes of SemEval 2013 task 9.1, as popularised by
+    nervaluate:
+
+        strict - exact boundaries and type
+        exact - exact boundaries regardless of type
+        partial - overlapping boundaries regardless of type, partial matches counting half
+        ent_type - overlapping boundaries and matching type
+
+    Each predicted chunk is compared with the gold chunk of the same boundaries and type if there is one,
+    otherwise with the first overlapping gold chunk.  Matching is done with sorted sweeps over begin and end
+    arrays, so a document costs O(n log n) in its number of chunks.  Incorrect and partial matches count
+    towards the type of the gold chunk, spurious ones towards the type of the predicted chunk.
+
+    Usage:
+        metrics = ChunkMetrics({"PER": Person, "LOC": Location})
+        for gold, pred in documents:
+            metrics.evaluate(gold.default_view, pred.default_view)
+        print(metrics.totals.scores('strict'))
+    """
 
-    def __init__(self, schema_annotation_map):
+    def __init__(self, schema_annotation_map, label_func=None):
+        """
+        Args:
+            schema_annotation_map: mapping of chunk type name to annotation type
+            label_func: optional function returning the chunk type of an annotation, e.g. its `label`
+                field.  By default the chunk type is the schema name of its annotation type.
+        """
         self.schema_annotation_map = schema_annotation_map
+        self.label_func = label_func
 
-        self. metrics_results = {
-            'correct': 0, 'incorrect': 0, 'partial': 0,
-            'missed': 0, 'spurious': 0, 'possible': 0, 'actual': 0
-        }
+        self.metrics_results = {count: 0 for count in ChunkResults.COUNTS}
 
         # overall results
-        self.results_template = {
-            'strict': deepcopy(self.metrics_results),
-            'ent_type': deepcopy(self.metrics_results),
-            'partial': deepcopy(self.metrics_results),
-            'exact': deepcopy(self.metrics_results)
-        }
+        self.results_template = ChunkResults.empty()
+
+        # running totals over all evaluated documents
+        names = schema_annotation_map if label_func is None else ()
+        self.totals = ChunkResults(by_type={name: ChunkResults.empty() for name in names})
 
-        self.results = deepcopy(self.results_template)
+        self.labels: List[str] = []
+        self.label_ids: Dict[str, int] = {}
 
-        # results aggregated by entity type
-        self.evaluation_agg_entities_type = {
-            name: deepcopy(self.results_template) for name, _ in schema_annotation_map.items()
+    @property
+    def results(self):
+        return self.totals.results
+
+    @property
+    def evaluation_agg_entities_type(self):
+        return self.totals.by_type
+
+    def label_id(self, label: str) -> int:
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            label_id = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    def chunk_arrays(self, spndx: Spandex) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Return begins, ends and label ids of the chunks of a view, sorted by begin and end
+        """
+        seen = set()
+        begins, ends, labels = [], [], []
+        for name, annotation_type in self.schema_annotation_map.items():
+            for annotation in spndx.select(annotation_type):
+                # an annotation may be an instance of several schema types, count it once
+                if id(annotation) in seen:
+                    continue
+                seen.add(id(annotation))
+                label = name if self.label_func is None else self.label_func(annotation)
+                begins.append(annotation.begin)
+                ends.append(annotation.end)
+                labels.append(self.label_id(label))
+
+        begins = numpy.array(begins, dtype=numpy.int64)
+        ends = numpy.array(ends, dtype=numpy.int64)
+        labels = numpy.array(labels, dtype=numpy.int64)
+        order = numpy.lexsort((labels, ends, begins))
+        return begins[order], ends[order], labels[order]
+
+    def evaluate(self, gold: Spandex, pred: Spandex) -> ChunkResults:
+        """
+        Compare the chunks of a predicted view with those of a gold view.
+        Returns the results of the document and adds them to `totals`.
+        """
+        results = self.compare(self.chunk_arrays(gold), self.chunk_arrays(pred))
+        self.totals.add(results)
+        return results
+
+    def evaluate_all(self, pairs: Iterable[Tuple[Spandex, Spandex]]) -> ChunkResults:
+        """
+        Evaluate (gold, predicted) view pairs, returning their merged results
+        """
+        return ChunkResults.merge(self.evaluate(gold, pred) for gold, pred in pairs)
+
+    def compare(self, gold: Tuple[numpy.ndarray, ...], pred: Tuple[numpy.ndarray, ...]) -> ChunkResults:
+        """
+        Compare gold and predicted chunk arrays as returned by `chunk_arrays`
+        """
+        gold_begins, gold_ends, gold_labels = gold
+        pred_begins, pred_ends, pred_labels = pred
+        n_gold = len(gold_begins)
+
+        # exact matches of boundaries and type, by binary search over packed (begin, end, label) keys
+        width = int(max(gold_ends.max(initial=0), pred_ends.max(initial=0))) + 1
+        n_labels = max(len(self.labels), 1)
+        gold_keys = (gold_begins * width + gold_ends) * n_labels + gold_labels
+        pred_keys = (pred_begins * width + pred_ends) * n_labels + pred_labels
+        found = numpy.searchsorted(gold_keys, pred_keys)
+        exact = found < n_gold
+        exact[exact] = gold_keys[found[exact]] == pred_keys[exact]
+
+        # gold chunks with the same boundaries but another type.  With nested or overlapping gold chunks these
+        # take precedence over the first overlapping gold chunk.  Gold chunks already matched exactly are only
+        # used if there is no other one with the same boundaries.
+        gold_bounds = gold_begins * width + gold_ends
+        pred_bounds = pred_begins * width + pred_ends
+        bounds_lo = numpy.searchsorted(gold_bounds, pred_bounds, side='left')
+        bounds_hi = numpy.searchsorted(gold_bounds, pred_bounds, side='right')
+        same_boundaries = (bounds_lo < bounds_hi) & ~exact
+        bounds_match = bounds_lo.copy()
+        exact_gold = set(found[exact].tolist())
+        for i in numpy.flatnonzero(same_boundaries & (bounds_hi - bounds_lo > 1)).tolist():
+            bounds_match[i] = next((j for j in range(bounds_lo[i], bounds_hi[i]) if j not in exact_gold),
+                                   bounds_lo[i])
+
+        # otherwise the first gold chunk, in begin order, overlapping each prediction.  Gold chunks beginning
+        # before the prediction ends overlap it if they also end after it begins; the running maximum of gold
+        # ends finds the first one that does.
+        max_ends = numpy.maximum.accumulate(gold_ends) if n_gold else gold_ends
+        first = numpy.searchsorted(max_ends, pred_begins, side='right')
+        before_end = numpy.searchsorted(gold_begins, pred_ends, side='left')
+        overlaps = ((first < before_end) | same_boundaries) & ~exact
+        matched = numpy.where(exact, found, numpy.where(same_boundaries, bounds_match,
+                                                        numpy.where(overlaps, first, -1)))
+
+        safe = numpy.clip(matched, 0, max(n_gold - 1, 0))
+        if n_gold:
+            same_bounds = (gold_begins[safe] == pred_begins) & (gold_ends[safe] == pred_ends)
+            same_type = gold_labels[safe] == pred_labels
+        else:
+            same_bounds = same_type = numpy.zeros(len(pred_begins), dtype=bool)
+
+        kinds = {
+            'correct': exact,
+            'boundary': overlaps & same_bounds,
+            'overlap_type': overlaps & ~same_bounds & same_type,
+            'overlap': overlaps & ~same_bounds & ~same_type,
+            'spurious': matched < 0,
         }
 
+        results = ChunkResults()
+        for kind, mask in kinds.items():
+            # spurious and correct predictions count towards their own type, the rest towards the gold type
+            labels = pred_labels[mask] if kind in ('correct', 'spurious') else gold_labels[matched[mask]]
+            self._count(results, _MATCH_OUTCOMES[kind], labels)
+
+        gold_matched = numpy.zeros(n_gold, dtype=bool)
+        gold_matched[matched[matched >= 0]] = True
+        self._count(results, ('missed',) * len(ChunkResults.SCHEMES), gold_labels[~gold_matched])
+
+        for scheme_results in [results.results] + list(results.by_type.values()):
+            for counts in scheme_results.values():
+                self.compute_actual_possible(counts)
+        return results
+
+    def _count(self, results: ChunkResults, outcomes: Tuple[str, ...], labels: numpy.ndarray):
+        if not len(labels):
+            return
+        label_counts = numpy.bincount(labels)
+        for label_id in numpy.flatnonzero(label_counts).tolist():
+            type_results = results.type_results(self.labels[label_id])
+            n = int(label_counts[label_id])
+            for scheme, outcome in zip(ChunkResults.SCHEMES, outcomes):
+                results.results[scheme][outcome] += n
+                type_results[scheme][outcome] += n
+
     def find_overlap(self, actual_range, pred_range):
         """Find the overlap between two ranges
         Find the overlap between two ranges. Return the overlapping values if
-        present, else return an empty set().
+        present, else return an empty collection.  Ranges are intersected
+        arithmetically and give a range, other iterables give a set().
         Examples:
+        >>> find_overlap(range(1, 3), range(2, 4))
+        range(2, 3)
         >>> find_overlap((1, 2), (2, 3))
-        2
+        {2}
         >>> find_overlap((1, 2), (3, 4))
         set()
         """
+        if isinstance(actual_range, range) and isinstance(pred_range, range) \
+                and actual_range.step == pred_range.step == 1:
+            begin = max(actual_range.start, pred_range.start)
+            end = min(actual_range.stop, pred_range.stop)
+            return range(begin, max(begin, end))
 
-        actual_set = set(actual_range)
-        pred_set = set(pred_range)
-
-        overlaps = actual_set.intersection(pred_set)
-
-        return overlaps
+        return set(actual_range).intersection(pred_range)
 
     def compute_actual_possible(self, results):
         """
@@ -167,5 +606,3 @@ class ChunkMetrics:
         results["possible"] = possible
 
         return results
-
-    
@@ -0,0 +1,310 @@
+import json
+import os
+import random
+
+from jembatan.core.spandex import JembatanDoc, Spandex
+from jembatan.core.spandex import constants as jemconst
+from jembatan.ml.chunking import BioChunking
+from jembatan.typesys import Annotation
+from jembatan.typesys.segmentation import Sentence, Token
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+import numpy
+
+
+PAD_ID = 0
+UNKNOWN_ID = 1
+
+_FIELDS = ("token_ids", "begins", "ends", "labels", "sentence_starts")
+
+
+class Example(NamedTuple):
+    """
+    Token arrays of one document.  Arrays read from a `Dataset` are slices of memory mapped shards.
+    """
+    doc: int
+    token_ids: numpy.ndarray
+    begins: numpy.ndarray
+    ends: numpy.ndarray
+    labels: Optional[numpy.ndarray]
+    sentence_starts: numpy.ndarray
+
+    def __len__(self):
+        return len(self.token_ids)
+
+
+class DatasetExporter(object):
+    """
+    Writes token level model inputs of a corpus in a single pass, as shards of `.npy` arrays which
+    `Dataset` memory maps:
+
+        token_ids - vocabulary id of every token
+        begins, ends - character offsets of every token
+        labels - BIO codes of every token, when a `BioChunking` is given
+        sentence_starts - 1 for the first token of every sentence
+        doc_offsets - first token of every document of the shard
+
+    `index.json`, which lists the shards, the vocabulary and the label outcomes, is written last, so a
+    directory with an index holds a complete dataset.
+
+    Usage:
+        with DatasetExporter("train.ds", chunking=BioChunking(Token, Entity, ...)) as exporter:
+            for jemdoc in corpus:
+                exporter.add(jemdoc)
+    """
+
+    def __init__(self, path: Union[str, Path], token_type: Annotation = Token, sentence_type: Annotation = Sentence,
+                 chunking: BioChunking = None, vocabulary: Dict[str, int] = None, grow_vocabulary: bool = True,
+                 lower: bool = False, viewname: str = jemconst.SPANDEX_DEFAULT_VIEW, shard_tokens: int = 1 << 24):
+        """
+        Args:
+            path: directory to write the dataset to
+            token_type: annotation type of tokens
+            sentence_type: annotation type of sentences
+            chunking: BIO chunking used to encode labels, if any
+            vocabulary: mapping of token text to id.  Ids 0 and 1 are reserved for padding and unknown tokens.
+            grow_vocabulary: add unseen tokens to the vocabulary, rather than mapping them to the unknown id
+            lower: lower case token text before looking it up
+            viewname: view of each document to export
+            shard_tokens: number of tokens after which a shard is closed
+        """
+        self.path = Path(path)
+        self.token_type = token_type
+        self.sentence_type = sentence_type
+        self.chunking = chunking
+        self.vocabulary = dict(vocabulary) if vocabulary is not None else {}
+        reserved = [text for text, token_id in self.vocabulary.items() if token_id <= UNKNOWN_ID]
+        if reserved:
+            raise ValueError(f"vocabulary ids must be above {UNKNOWN_ID}, ids 0 and 1 are reserved for padding "
+                             f"and unknown tokens, but got {reserved[:5]}")
+        self._next_id = max(self.vocabulary.values(), default=UNKNOWN_ID) + 1
+        self.grow_vocabulary = grow_vocabulary
+        self.lower = lower
+        self.viewname = viewname
+        self.shard_tokens = shard_tokens
+
+        self.shards: List[Dict] = []
+        self._pending: Dict[str, List[numpy.ndarray]] = {field: [] for field in _FIELDS}
+        self._pending_lengths: List[int] = []
+        self._pending_tokens = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def token_ids(self, texts: Iterable[str]) -> numpy.ndarray:
+        vocabulary = self.vocabulary
+        ids = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            token_id = vocabulary.get(text)
+            if token_id is None:
+                if self.grow_vocabulary:
+                    token_id = vocabulary[text] = self._next_id
+                    self._next_id += 1
+                else:
+                    token_id = UNKNOWN_ID
+            ids.append(token_id)
+        return numpy.array(ids, dtype=numpy.int32)
+
+    def arrays(self, spndx: Spandex) -> Dict[str, numpy.ndarray]:
+        """
+        Return the token arrays of a view
+        """
+        tokens = spndx.select(self.token_type)
+        n = len(tokens)
+        begins = numpy.fromiter((t.begin for t in tokens), dtype=numpy.int32, count=n)
+        ends = numpy.fromiter((t.end for t in tokens), dtype=numpy.int32, count=n)
+        text = spndx.content_string
+        arrays = {
+            "token_ids": self.token_ids(text[t.begin:t.end] for t in tokens),
+            "begins": begins,
+            "ends": ends,
+        }
+
+        # sentence of every token by sorted merge, a sentence starts where it changes
+        sentence_begins = numpy.fromiter((s.begin for s in spndx.select(self.sentence_type)), dtype=numpy.int64)
+        sentence_ids = numpy.searchsorted(sentence_begins, begins, side="right")
+        starts = numpy.ones(n, dtype=numpy.uint8)
+        starts[1:] = sentence_ids[1:] != sentence_ids[:-1]
+        arrays["sentence_starts"] = starts
+
+        if self.chunking is not None:
+            arrays["labels"] = self.chunking.encode(spndx, subchunks=tokens).astype(numpy.int16)
+        return arrays
+
+    def add(self, jemdoc: JembatanDoc):
+        """
+        Add the tokens of a document to the dataset
+        """
+        arrays = self.arrays(jemdoc.get_view(self.viewname))
+        for field, array in arrays.items():
+            self._pending[field].append(array)
+        n = len(arrays["token_ids"])
+        self._pending_lengths.append(n)
+        self._pending_tokens += n
+        if self._pending_tokens >= self.shard_tokens:
+            self.flush()
+
+    def export(self, jemdocs: Iterable[JembatanDoc]) -> int:
+        """
+        Add documents and close the dataset.  Returns the number of documents in the dataset.
+        """
+        for jemdoc in jemdocs:
+            self.add(jemdoc)
+        self.close()
+        return sum(shard["docs"] for shard in self.shards)
+
+    def flush(self):
+        """
+        Write documents added since the last flush as a shard
+        """
+        if not self._pending_lengths:
+            return
+        name = "shard-{:05d}".format(len(self.shards))
+        for field, arrays in self._pending.items():
+            if arrays:
+                numpy.save(str(self.path / f"{name}.{field}.npy"), numpy.concatenate(arrays))
+        doc_offsets = numpy.zeros(len(self._pending_lengths) + 1, dtype=numpy.int64)
+        numpy.cumsum(self._pending_lengths, out=doc_offsets[1:])
+        numpy.save(str(self.path / f"{name}.doc_offsets.npy"), doc_offsets)
+
+        self.shards.append({"name": name, "docs": len(self._pending_lengths), "tokens": self._pending_tokens})
+        self._pending = {field: [] for field in _FIELDS}
+        self._pending_lengths = []
+        self._pending_tokens = 0
+
+    def close(self):
+        """
+        Write the last shard and the index
+        """
+        self.flush()
+        vocabulary = sorted(self.vocabulary.items(), key=lambda item: item[1])
+        index = {
+            "format": 1,
+            "shards": self.shards,
+            "labels": self.chunking is not None,
+            "outcomes": self.chunking.codec.outcomes if self.chunking is not None else None,
+            "vocabulary": [text for text, _ in vocabulary],
+            "vocabulary_ids": [token_id for _, token_id in vocabulary],
+        }
+        tmp_path = self.path / "index.json.tmp"
+        with tmp_path.open("w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.path / "index.json")
+
+
+class Dataset(object):
+    """
+    Dataset written by `DatasetExporter`.  Shards are memory mapped, and examples and batches are slices
+    of the shard arrays, so nothing is decoded or copied when iterating over epochs.
+
+    Usage:
+        dataset = Dataset("train.ds")
+        for batch in dataset.batches(batch_tokens=4096, shuffle=True, seed=epoch):
+            ...
+    """
+
+    def __init__(self, path: Union[str, Path], mmap_mode: Optional[str] = "r"):
+        self.path = Path(path)
+        with (self.path / "index.json").open() as f:
+            self.index = json.load(f)
+        self.outcomes = self.index["outcomes"]
+        self.vocabulary = dict(zip(self.index["vocabulary"], self.index["vocabulary_ids"]))
+
+        fields = _FIELDS if self.index["labels"] else tuple(f for f in _FIELDS if f != "labels")
+        self.shards = []
+        doc_shards, doc_starts, doc_ends = [], [], []
+        for shard_number, shard in enumerate(self.index["shards"]):
+            name = shard["name"]
+            arrays = {field: numpy.load(str(self.path / f"{name}.{field}.npy"), mmap_mode=mmap_mode)
+                      for field in fields}
+            offsets = numpy.load(str(self.path / f"{name}.doc_offsets.npy"))
+            self.shards.append(arrays)
+            doc_shards.append(numpy.full(len(offsets) - 1, shard_number, dtype=numpy.int32))
+            doc_starts.append(offsets[:-1])
+            doc_ends.append(offsets[1:])
+
+        # shard, first token and end token of every document
+        self.doc_shards = numpy.concatenate(doc_shards) if doc_shards else numpy.zeros(0, dtype=numpy.int32)
+        self.doc_starts = numpy.concatenate(doc_starts) if doc_starts else numpy.zeros(0, dtype=numpy.int64)
+        self.doc_ends = numpy.concatenate(doc_ends) if doc_ends else numpy.zeros(0, dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.doc_shards)
+
+    @property
+    def lengths(self) -> numpy.ndarray:
+        """
+        Number of tokens of every document
+        """
+        return self.doc_ends - self.doc_starts
+
+    def __getitem__(self, doc: int) -> Example:
+        arrays = self.shards[self.doc_shards[doc]]
+        window = slice(int(self.doc_starts[doc]), int(self.doc_ends[doc]))
+        labels = arrays.get("labels")
+        return Example(
+            doc=doc,
+            token_ids=arrays["token_ids"][window],
+            begins=arrays["begins"][window],
+            ends=arrays["ends"][window],
+            labels=labels[window] if labels is not None else None,
+            sentence_starts=arrays["sentence_starts"][window],
+        )
+
+    def __iter__(self) -> Iterator[Example]:
+        return (self[doc] for doc in range(len(self)))
+
+    def batches(self, batch_size: int = 32, batch_tokens: int = None, shuffle: bool = False,
+                seed: int = None) -> Iterator[List[Example]]:
+        """
+        Yield batches of documents of similar length, so padding them wastes little.  Documents are sorted
+        by length and cut into batches of at most `batch_size` documents and, if given, at most
+        `batch_tokens` tokens once padded to the longest document of the batch.
+
+        Args:
+            batch_size: maximum number of documents per batch
+            batch_tokens: maximum of documents times length of the longest document per batch
+            shuffle: shuffle the order of the batches, and the order of documents of the same length
+            seed: random seed for shuffling, e.g. the epoch number
+        """
+        lengths = self.lengths
+        rng = numpy.random.RandomState(seed) if shuffle else None
+        # lexsort sorts by its last key first, a random first key shuffles documents of the same length
+        tiebreak = rng.permutation(len(lengths)) if shuffle else numpy.arange(len(lengths))
+        order = numpy.lexsort((tiebreak, lengths))
+
+        bounds = []
+        start = 0
+        while start < len(order):
+            stop = min(start + batch_size, len(order))
+            if batch_tokens is not None:
+                # documents are sorted, so the last one of a batch is its longest
+                padded = lengths[order[start:stop]] * numpy.arange(1, stop - start + 1)
+                stop = start + max(1, int(numpy.searchsorted(padded, batch_tokens, side="right")))
+            bounds.append((start, stop))
+            start = stop
+
+        if shuffle:
+            random.Random(seed).shuffle(bounds)
+        for start, stop in bounds:
+            yield [self[doc] for doc in order[start:stop].tolist()]
+
+    @staticmethod
+    def pad(examples: List[Example], field: str = "token_ids", pad_value: int = PAD_ID) -> numpy.ndarray:
+        """
+        Stack one field of a batch into a (documents, longest document) matrix
+        """
+        arrays = [getattr(example, field) for example in examples]
+        matrix = numpy.full((len(arrays), max((len(a) for a in arrays), default=0)), pad_value,
+                            dtype=arrays[0].dtype if arrays else numpy.int32)
+        for row, array in zip(matrix, arrays):
+            row[:len(array)] = array
+        return matrix
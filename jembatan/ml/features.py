@@ -0,0 +1,309 @@
+import zlib
+
+from jembatan.core.spandex import Spandex
+from jembatan.typesys import Annotation
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+
+TEXT = "text"
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def stable_hash(value: str) -> int:
+    """
+    Hash of a string which, unlike `hash`, is the same in every process
+    """
+    return zlib.crc32(value.encode("utf-8"))
+
+
+def mix(hashes: numpy.ndarray, seed: int) -> numpy.ndarray:
+    """
+    Combine value hashes with a template seed into well spread 64 bit hashes (splitmix64 finaliser)
+    """
+    x = hashes.astype(numpy.uint64) ^ numpy.uint64(seed & _MASK64)
+    x = x * numpy.uint64(0x9E3779B97F4A7C15)
+    x ^= x >> numpy.uint64(30)
+    x = x * numpy.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> numpy.uint64(27)
+    x = x * numpy.uint64(0x94D049BB133111EB)
+    x ^= x >> numpy.uint64(31)
+    return x
+
+
+class FeatureMatrix(NamedTuple):
+    """
+    Sparse (tokens, n_features) matrix in CSR layout: the feature ids of row `i` are
+    `indices[indptr[i]:indptr[i + 1]]` with values in `data` at the same positions.  Hash collisions can
+    put the same id twice in a row; CSR consumers such as scipy.sparse sum duplicates.
+
+    `doc_offsets` gives the first row of every document, with a final entry equal to the number of rows.
+    """
+    indptr: numpy.ndarray
+    indices: numpy.ndarray
+    data: numpy.ndarray
+    shape: Tuple[int, int]
+    doc_offsets: numpy.ndarray
+
+    def rows(self, doc: int) -> "FeatureMatrix":
+        """
+        Return the rows of one document of a batch, sharing memory with the batch
+        """
+        begin, end = int(self.doc_offsets[doc]), int(self.doc_offsets[doc + 1])
+        lo, hi = int(self.indptr[begin]), int(self.indptr[end])
+        return FeatureMatrix(self.indptr[begin:end + 1] - lo, self.indices[lo:hi], self.data[lo:hi],
+                             (end - begin, self.shape[1]), numpy.array([0, end - begin], dtype=numpy.int64))
+
+    def to_scipy(self):
+        """
+        Return a `scipy.sparse.csr_matrix`.  Requires scipy.
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    @classmethod
+    def concatenate(cls, matrices: Sequence["FeatureMatrix"], n_features: int) -> "FeatureMatrix":
+        """
+        Stack matrices of several documents into one batch
+        """
+        rows = numpy.array([m.shape[0] for m in matrices], dtype=numpy.int64)
+        nnz = numpy.array([len(m.indices) for m in matrices], dtype=numpy.int64)
+        indptr = numpy.zeros(rows.sum() + 1, dtype=numpy.int64)
+        row_offsets = numpy.concatenate(([0], numpy.cumsum(rows)))
+        nnz_offsets = numpy.concatenate(([0], numpy.cumsum(nnz)))
+        for m, row, offset in zip(matrices, row_offsets[:-1], nnz_offsets[:-1]):
+            indptr[row:row + m.shape[0] + 1] = m.indptr + offset
+        indices = numpy.concatenate([m.indices for m in matrices]) if matrices else numpy.zeros(0, numpy.int64)
+        data = numpy.concatenate([m.data for m in matrices]) if matrices else numpy.zeros(0, numpy.float32)
+        return cls(indptr, indices, data, (int(rows.sum()), n_features), row_offsets)
+
+
+class TokenLayer(object):
+    """
+    Token layer of a view as flat arrays, shared by the templates of a `Featurizer`
+    """
+
+    def __init__(self, spndx: Spandex, tokens: Sequence[Annotation], window_type: Annotation = None):
+        self.spndx = spndx
+        self.tokens = tokens
+        self.begins = numpy.fromiter((t.begin for t in tokens), dtype=numpy.int64, count=len(tokens))
+        self.ends = numpy.fromiter((t.end for t in tokens), dtype=numpy.int64, count=len(tokens))
+
+        # index of the window each token is in, or -1 for tokens outside any window.  Context features do not
+        # cross windows, and tokens outside windows have no context.
+        if window_type is None:
+            self.window_ids = numpy.zeros(len(tokens), dtype=numpy.int64)
+        else:
+            window_begins, window_ends = spans(spndx.select(window_type))
+            window_ids = numpy.searchsorted(window_begins, self.begins, side="right") - 1
+            inside = window_ids >= 0
+            if len(window_begins):
+                inside &= window_ends[numpy.clip(window_ids, 0, None)] >= self.ends
+            self.window_ids = numpy.where(inside, window_ids, -1)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def values(self, field: str) -> List[Optional[str]]:
+        if field == TEXT:
+            text = self.spndx.content_string
+            return [text[t.begin:t.end] for t in self.tokens]
+        return [getattr(t, field) for t in self.tokens]
+
+    def shift(self, offset: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Return the index of the token `offset` positions away from every token and whether it is in the
+        same window.  Tokens outside any window only see themselves.
+        """
+        positions = numpy.arange(len(self)) + offset
+        valid = (positions >= 0) & (positions < len(self))
+        positions = numpy.clip(positions, 0, max(len(self) - 1, 0))
+        valid &= self.window_ids[positions] == self.window_ids
+        if offset != 0:
+            valid &= self.window_ids >= 0
+        return positions, valid
+
+
+def spans(annotations: Sequence[Annotation]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    begins = numpy.fromiter((a.begin for a in annotations), dtype=numpy.int64, count=len(annotations))
+    ends = numpy.fromiter((a.end for a in annotations), dtype=numpy.int64, count=len(annotations))
+    return begins, ends
+
+
+class FeatureTemplate(object):
+    """
+    Base class for feature templates.  `compute` returns a (tokens, columns) array of 64 bit feature
+    hashes and a mask of the same shape telling which of them are set.
+    """
+
+    name: str = None
+
+    def compute(self, layer: TokenLayer, hasher: "ValueHasher") -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Override this method to define the template's features.
+
+        Args:
+            layer(:obj:`TokenLayer`) - tokens of the window being featurized
+            hasher(:obj:`ValueHasher`) - hashes feature values, caching them across windows
+        """
+        pass
+
+    def seed(self, *parts) -> int:
+        return stable_hash("\x1f".join(str(p) for p in (self.name,) + parts))
+
+
+class ValueHasher(object):
+    """
+    Hashes feature values to arrays, hashing every distinct value once
+    """
+
+    BOS = "<s>"
+    EOS = "</s>"
+
+    def __init__(self):
+        self._cache: Dict[str, int] = {}
+
+    def __call__(self, values: Sequence[Optional[str]]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        cache = self._cache
+        hashes = numpy.zeros(len(values), dtype=numpy.uint64)
+        present = numpy.ones(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            if value is None:
+                present[i] = False
+                continue
+            h = cache.get(value)
+            if h is None:
+                h = cache[value] = stable_hash(value)
+            hashes[i] = h
+        return hashes, present
+
+
+class FieldFeature(FeatureTemplate):
+    """
+    Value of a token field, e.g. "pos", or of its text with `TEXT`, at each of `offsets` relative to the
+    token.  Positions outside the token's window get begin or end of window markers.
+
+    Usage:
+        FieldFeature(TEXT, offsets=(-1, 0, 1), transform=str.lower)
+    """
+
+    def __init__(self, field: str, offsets: Iterable[int] = (0,), transform: Callable[[str], str] = None,
+                 name: str = None):
+        self.field = field
+        self.offsets = tuple(offsets)
+        self.transform = transform
+        self.name = name or (field if transform is None else f"{field}:{getattr(transform, '__name__', 'f')}")
+
+    def compute(self, layer, hasher):
+        values = layer.values(self.field)
+        if self.transform is not None:
+            values = [None if v is None else self.transform(v) for v in values]
+        hashes, present = hasher(values)
+        bos, eos = hasher([hasher.BOS, hasher.EOS])[0]
+
+        ids = numpy.empty((len(layer), len(self.offsets)), dtype=numpy.uint64)
+        mask = numpy.empty(ids.shape, dtype=bool)
+        for column, offset in enumerate(self.offsets):
+            positions, valid = layer.shift(offset)
+            shifted = numpy.where(valid, hashes[positions], bos if offset < 0 else eos)
+            ids[:, column] = mix(shifted, self.seed(offset))
+            mask[:, column] = ~valid | present[positions]
+        return ids, mask
+
+
+class CoveringFeature(FeatureTemplate):
+    """
+    Position of a token within the annotation of `annotation_type` covering it: B (first token),
+    I (inside), L (last token) or U (only token), optionally combined with a field of the covering
+    annotation, e.g. an entity's label.  Tokens not covered get no feature.  Covering annotations are
+    expected not to overlap one another, as sentences and entities of one layer do not.
+    """
+
+    def __init__(self, annotation_type: Annotation, field: str = None, name: str = None):
+        self.annotation_type = annotation_type
+        self.field = field
+        self.name = name or (annotation_type.__name__ + (f".{field}" if field else ""))
+
+    def compute(self, layer, hasher):
+        covering = layer.spndx.select(self.annotation_type)
+        begins, ends = spans(covering)
+        # sorted merge of token offsets into covering annotation offsets
+        index = numpy.searchsorted(begins, layer.begins, side="right") - 1
+        safe = numpy.clip(index, 0, None)
+        covered = (index >= 0) & (ends[safe] >= layer.ends) if len(covering) else numpy.zeros(len(layer), bool)
+
+        first = covered & (begins[safe] == layer.begins) if len(covering) else covered
+        last = covered & (ends[safe] == layer.ends) if len(covering) else covered
+        # 0: B, 1: I, 2: L, 3: U
+        positions = numpy.where(first, numpy.where(last, 3, 0), numpy.where(last, 2, 1)).astype(numpy.uint64)
+
+        mask = covered
+        if self.field is not None:
+            field_hashes, present = hasher([getattr(a, self.field) for a in covering])
+            if len(covering):
+                positions = positions ^ (field_hashes[safe] << numpy.uint64(2))
+                mask = mask & present[safe]
+        ids = mix(positions, self.seed())
+        return ids[:, None], mask[:, None]
+
+
+class Featurizer(object):
+    """
+    Extracts hashed token features from a view.  Every template is computed with array operations over
+    the whole token layer, and feature ids are hashes of (template, value) folded into `n_features`
+    columns, so no vocabulary needs to be built or shared between processes.
+
+    Usage:
+        featurizer = Featurizer(Token, [FieldFeature(TEXT, (-1, 0, 1), str.lower), FieldFeature("pos"),
+                                        CoveringFeature(Sentence), CoveringFeature(Entity, "label")],
+                                window_type=Sentence)
+        batch = featurizer.transform_batch(jemdoc.default_view for jemdoc in jemdocs)
+        X = batch.to_scipy()
+    """
+
+    def __init__(self, token_type: Annotation, templates: Sequence[FeatureTemplate], n_features: int = 1 << 20,
+                 window_type: Annotation = None):
+        """
+        Args:
+            token_type: annotation type of the rows of the feature matrix
+            templates: feature templates to compute
+            n_features: number of hashed feature columns
+            window_type: annotation type, e.g. `Sentence`, which context features do not look across
+        """
+        self.token_type = token_type
+        self.templates = list(templates)
+        self.n_features = n_features
+        self.window_type = window_type
+        self.hasher = ValueHasher()
+        self.index_dtype = numpy.int32 if n_features <= numpy.iinfo(numpy.int32).max else numpy.int64
+
+    def transform(self, spndx: Spandex) -> FeatureMatrix:
+        """
+        Return the feature matrix of the tokens of a view
+        """
+        layer = TokenLayer(spndx, spndx.select(self.token_type), self.window_type)
+        n = len(layer)
+        if not n or not self.templates:
+            return FeatureMatrix(numpy.zeros(n + 1, dtype=numpy.int64), numpy.zeros(0, dtype=self.index_dtype),
+                                 numpy.zeros(0, dtype=numpy.float32), (n, self.n_features),
+                                 numpy.array([0, n], dtype=numpy.int64))
+
+        columns = [template.compute(layer, self.hasher) for template in self.templates]
+        ids = numpy.concatenate([c[0] for c in columns], axis=1)
+        mask = numpy.concatenate([c[1] for c in columns], axis=1)
+
+        # row major boolean indexing keeps the features of each token together, as CSR wants them
+        indices = (ids[mask] % numpy.uint64(self.n_features)).astype(self.index_dtype)
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(mask.sum(axis=1), out=indptr[1:])
+        data = numpy.ones(len(indices), dtype=numpy.float32)
+        return FeatureMatrix(indptr, indices, data, (n, self.n_features), numpy.array([0, n], dtype=numpy.int64))
+
+    def transform_batch(self, spndxs: Iterable[Spandex]) -> FeatureMatrix:
+        """
+        Return the feature matrix of the tokens of several views, stacked in order.  Use `rows` to get the
+        rows of one view.
+        """
+        return FeatureMatrix.concatenate([self.transform(spndx) for spndx in spndxs], self.n_features)
@@ -1,6 +1,14 @@
-from typing import Iterable
+import time
+
+from typing import Iterable, Iterator, List, Optional
 
 from jembatan.core.spandex import JembatanDoc
+from jembatan.core.trace import get_tracer
+from jembatan.pipeline.deadlines import (SlowLaneEntry, TimeBudget, can_interrupt, deadline, restore_document,
+                                         snapshot_document)
+from jembatan.pipeline.errors import DeadlineExceeded
+from jembatan.pipeline.liveness import LivenessPlan, OutputSchema
+from jembatan.pipeline.metrics import PipelineProfiler, stage_name
 
 
 class SimplePipeline:
@@ -9,40 +17,207 @@ class SimplePipeline:
     """
 
     @classmethod
-    def iterate(cls, collection: Iterable[JembatanDoc], stages: Iterable):
+    def process_stage(cls, index: int, stage, jemdoc: JembatanDoc, profiler=None, document: int = None,
+                      timeout: Optional[float] = None):
+        """
+        Run a single stage over a document, recording measurements if a profiler is given.  When `timeout`
+        is given the stage is cancelled with `DeadlineExceeded` once it runs out, and the timer is stopped
+        as soon as the stage itself returns.
+        """
+        def run():
+            with deadline(timeout, stage_index=index):
+                stage.process(jemdoc)
+
+        with get_tracer().span(stage_name(stage), cat="stage", stage=index, document=document):
+            if profiler is not None:
+                profiler.measure(index, stage, [jemdoc], run)
+            else:
+                run()
+
+    @classmethod
+    def process_stage_batch(cls, index: int, stage, jemdocs: List[JembatanDoc], profiler=None):
+        """
+        Run a single stage over a batch of documents, using the stage's `process_batch` method if it has one
+        """
+        with get_tracer().span(stage_name(stage), cat="stage", stage=index, documents=len(jemdocs)):
+            if profiler is not None:
+                profiler.run_stage_batch(index, stage, jemdocs)
+            elif hasattr(stage, "process_batch"):
+                stage.process_batch(jemdocs)
+            else:
+                for jemdoc in jemdocs:
+                    stage.process(jemdoc)
+
+    @classmethod
+    def process_document(cls, doc_index: int, jemdoc: JembatanDoc, stages: Iterable, profiler=None,
+                         plan: Optional[LivenessPlan] = None, budget: Optional[TimeBudget] = None,
+                         first_stage: int = 0) -> bool:
+        """
+        Run stages over a single document, starting with stage `first_stage`.  Returns False if the document
+        ran over its time budget and was routed to the slow lane.
+        """
+        doc_start = time.perf_counter()
+        for i, stage in enumerate(stages):
+            if i < first_stage:
+                continue
+
+            if budget is None:
+                cls.process_stage(i, stage, jemdoc, profiler, document=doc_index)
+            else:
+                stage_start = time.perf_counter()
+                timeout = budget.stage_timeout(stage_start - doc_start)
+                # only stages that can actually be cancelled midway need to be rolled back
+                interruptible = budget.interrupt and timeout is not None and can_interrupt()
+                snapshot = snapshot_document(jemdoc) if interruptible else None
+                try:
+                    if timeout is not None and timeout <= 0:
+                        raise DeadlineExceeded(stage_index=i, elapsed=0.0)
+                    cls.process_stage(i, stage, jemdoc, profiler, document=doc_index,
+                                      timeout=timeout if budget.interrupt else None)
+                except DeadlineExceeded:
+                    if snapshot is not None:
+                        # the stage may have been cancelled halfway through adding annotations
+                        restore_document(jemdoc, snapshot)
+                    now = time.perf_counter()
+                    return budget.handle_timeout(jemdoc, doc_index, i, now - stage_start, now - doc_start)
+
+                now = time.perf_counter()
+                is_last = i == len(stages) - 1
+                if not is_last and budget.exceeded(now - stage_start, now - doc_start):
+                    # stage could not be interrupted, so skip the remaining ones
+                    return budget.handle_timeout(jemdoc, doc_index, i + 1, now - stage_start, now - doc_start)
+
+            if plan is not None:
+                plan.prune(i, jemdoc)
+        return True
+
+    @classmethod
+    def read_collection(cls, collection: Iterable[JembatanDoc]) -> Iterator[JembatanDoc]:
+        """
+        Iterate over collection, tracing time spent waiting on the collection to produce documents
+        """
+        iterator = iter(collection)
+        while True:
+            with get_tracer().span("read", cat="io"):
+                try:
+                    jemdoc = next(iterator)
+                except StopIteration:
+                    return
+            yield jemdoc
+
+    @classmethod
+    def read_batches(cls, collection: Iterable[JembatanDoc], batch_size: int) -> Iterator[List[JembatanDoc]]:
+        batch = []
+        for jemdoc in cls.read_collection(collection):
+            batch.append(jemdoc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def liveness_plan(cls, stages: Iterable, output_schema: Optional[OutputSchema]) -> Optional[LivenessPlan]:
+        if output_schema is None:
+            return None
+        if not isinstance(output_schema, OutputSchema):
+            output_schema = OutputSchema(output_schema)
+        return LivenessPlan(stages, output_schema)
+
+    @classmethod
+    def iterate(cls, collection: Iterable[JembatanDoc], stages: Iterable, profiler=None, output_schema=None,
+                budget=None, batch_size=None):
         """
         Process Spandex collection
         Iterator over processed Spandexes.  Useful if you want to work with the Spandex objects beyond just
         processing the pipeline.  This is one way to instrument collection of results for evaluation
         without putting it into your pipeline.
 
+        Args:
+            collection: iterable of JembatanDocs to process
+            stages: analysis functions to run over each document
+            profiler (:obj:`PipelineProfiler`, optional): collects per-stage measurements
+            output_schema (:obj:`OutputSchema` or dict, optional): views and annotation types wanted in
+                the output.  When given, annotation layers no remaining stage reads are dropped as soon
+                as possible.
+            budget (:obj:`TimeBudget`, optional): per-document and per-stage time budgets.  Documents
+                exceeding their budget are routed to `budget.slow_lane` or yielded partially processed.
+            batch_size (int, optional): when given, documents are grouped into batches of this size and
+                each stage processes a whole batch at once via its `process_batch` method.  This allows
+                stages like `SpacyAnalyzer` to batch model calls across documents.
         """
-        for jemdoc in collection:
-            for stage in stages:
-                stage.process(jemdoc)
-            yield jemdoc
+        stages = list(stages)
+        plan = cls.liveness_plan(stages, output_schema)
+
+        if batch_size:
+            if budget is not None:
+                raise ValueError("time budgets apply to single documents and can not be combined with batch_size")
+            for batch in cls.read_batches(collection, batch_size):
+                for i, stage in enumerate(stages):
+                    cls.process_stage_batch(i, stage, batch, profiler)
+                    if plan is not None:
+                        for jemdoc in batch:
+                            plan.prune(i, jemdoc)
+                yield from batch
+            return
+
+        for doc_index, jemdoc in enumerate(cls.read_collection(collection)):
+            with get_tracer().span("document", cat="document", document=doc_index):
+                completed = cls.process_document(doc_index, jemdoc, stages, profiler, plan, budget)
+            if completed:
+                yield jemdoc
+
+    @classmethod
+    def resume(cls, entries: Iterable[SlowLaneEntry], stages: Iterable, profiler=None, output_schema=None,
+               budget=None):
+        """
+        Finish processing documents routed to a slow lane, starting at the stage each one timed out in.
+        Stages are rerun from the start of the stage that was cancelled.
+        """
+        stages = list(stages)
+        plan = cls.liveness_plan(stages, output_schema)
+        for entry in entries:
+            with get_tracer().span("document", cat="document", document=entry.document_index):
+                completed = cls.process_document(entry.document_index, entry.jemdoc, stages, profiler, plan, budget,
+                                                 first_stage=entry.stage_index)
+            if completed:
+                yield entry.jemdoc
 
     @classmethod
-    def iterate_by_stage(cls, collection: Iterable[JembatanDoc], stages: Iterable):
-        for i, jemdoc in enumerate(collection):
+    def iterate_by_stage(cls, collection: Iterable[JembatanDoc], stages: Iterable, profiler=None,
+                         output_schema=None):
+        plan = cls.liveness_plan(stages, output_schema)
+        for i, jemdoc in enumerate(cls.read_collection(collection)):
             path = []
-            for stage in stages:
+            for j, stage in enumerate(stages):
                 path.append(str(stage))
-                stage.process(jemdoc)
+                cls.process_stage(j, stage, jemdoc, profiler, document=i)
+                if plan is not None:
+                    plan.prune(j, jemdoc)
                 yield i, '/'.join(path), jemdoc
 
     @classmethod
-    def run(cls, collection: Iterable[JembatanDoc], stages: Iterable):
+    def run(cls, collection: Iterable[JembatanDoc], stages: Iterable, profiler=None, output_schema=None,
+            budget=None, batch_size=None):
         """
-        Executes a linear pipeline of stages and runs collection_process_complete on those stages
+        Executes a linear pipeline of stages and runs collection_process_complete on those stages.
+
+        Returns the profiler used for the run.  When a time budget is given without a profiler one is created
+        so per-stage latency percentiles are available.
         """
-        for jemdoc in cls.iterate(collection, stages):
-            pass
+        if budget is not None and profiler is None:
+            profiler = PipelineProfiler(count_annotations=False)
 
-        for stage in stages:
-            # allow annotators to do cleanup
-            try:
-                getattr(stage, 'collect_process_complete')
-                stage.collection_process_complete()
-            except AttributeError:
+        stages = list(stages)
+        try:
+            for jemdoc in cls.iterate(collection, stages, profiler=profiler, output_schema=output_schema,
+                                      budget=budget, batch_size=batch_size):
                 pass
+        finally:
+            for stage in stages:
+                # allow annotators to do cleanup, e.g. shut down worker processes
+                complete = getattr(stage, 'collection_process_complete', None)
+                if complete is not None:
+                    complete()
+
+        return profiler
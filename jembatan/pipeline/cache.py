@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import re
+
+from collections import OrderedDict
+from enum import Enum
+from jembatan.core.af import AnalysisFunction
+from jembatan.core.spandex import JembatanDoc, Spandex, constants
+from jembatan.core.spandex.json import JembatanDocJsonDecoder, JembatanDocJsonEncoder
+from jembatan.core.spandex.typesys_base import Annotation, generate_annotation_id
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+
+_MAX_FINGERPRINT_DEPTH = 4
+
+
+class StageResultStore:
+    """
+    Local on-disk store for cached stage results with an in-memory LRU in front of it.
+
+    Entries are JSON documents named by their content hash.  The disk store is bounded by `max_bytes`,
+    when exceeded the least recently used entries (by modification time, which is refreshed on every hit)
+    are removed.  The memory cache is bounded by `max_memory_entries`.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 1 << 30, max_memory_entries: int = 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()
+        self._disk_bytes = sum(p.stat().st_size for p in self.path.glob("*.json"))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def _remember(self, key: str, entry: Dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Return the entry stored under `key` or None if there is no such entry
+        """
+        entry = self._memory.get(key, None)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        entry_path = self._entry_path(key)
+        try:
+            with entry_path.open("r") as f:
+                entry = json.load(f)
+            # refresh modification time so eviction is least-recently-used
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self._remember(key, entry)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict):
+        """
+        Store entry under `key` in memory and on disk, evicting old entries as needed
+        """
+        self._remember(key, entry)
+
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(entry, f)
+
+        old_size = entry_path.stat().st_size if entry_path.exists() else 0
+        os.replace(tmp_path, entry_path)
+        self._disk_bytes += entry_path.stat().st_size - old_size
+
+        if self._disk_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries from disk until the store fits within `max_bytes`
+        """
+        entries = []
+        for p in self.path.glob("*.json"):
+            try:
+                stat = p.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort(key=lambda e: (e[0], e[2].name))
+
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if self._disk_bytes <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            self._memory.pop(p.stem, None)
+            self._disk_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        for p in self.path.glob("*.json"):
+            p.unlink()
+        self._memory.clear()
+        self._disk_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+def _fingerprint_value(val: Any, depth: int = 0) -> Any:
+    """
+    Convert configuration values into a stable, JSON serializable representation
+    """
+    if depth > _MAX_FINGERPRINT_DEPTH:
+        return f"{val.__class__.__module__}.{val.__class__.__qualname__}"
+    elif val is None or isinstance(val, (str, int, float, bool)):
+        return val
+    elif isinstance(val, Enum):
+        return repr(val)
+    elif isinstance(val, type):
+        return f"{val.__module__}.{val.__qualname__}"
+    elif isinstance(val, re.Pattern):
+        return {"pattern": val.pattern, "flags": val.flags}
+    elif isinstance(val, (list, tuple)):
+        return [_fingerprint_value(v, depth + 1) for v in val]
+    elif isinstance(val, dict):
+        return {str(k): _fingerprint_value(v, depth + 1) for k, v in sorted(val.items(), key=lambda kv: str(kv[0]))}
+    elif isinstance(getattr(val, "meta", None), dict):
+        # spacy models and similar objects describe themselves via meta data
+        meta = val.meta
+        return {
+            "type": f"{val.__class__.__module__}.{val.__class__.__qualname__}",
+            "meta": {k: meta.get(k, None) for k in ("lang", "name", "version")},
+            "pipeline": list(getattr(val, "pipe_names", [])),
+        }
+    elif isinstance(val, AnalysisFunction) or hasattr(val, "__dict__"):
+        return stage_fingerprint(val, depth + 1)
+    return f"{val.__class__.__module__}.{val.__class__.__qualname__}"
+
+
+def stage_fingerprint(stage: Any, depth: int = 0) -> Dict:
+    """
+    Describe an analysis function's configuration.  This is built from the class name and the
+    public instance attributes of the stage.  Stages holding configuration in private attributes (e.g. a
+    loaded model) describe it with a `fingerprint_config` method, otherwise an explicit `config` should be
+    passed to `CachedAnalysisFunction`
+    """
+    fingerprint = {"type": f"{stage.__class__.__module__}.{stage.__class__.__qualname__}"}
+    if hasattr(stage, "__dict__"):
+        fingerprint["attrs"] = {
+            k: _fingerprint_value(v, depth + 1) for k, v in sorted(vars(stage).items()) if not k.startswith("_")
+        }
+    if callable(getattr(stage, "fingerprint_config", None)):
+        fingerprint["config"] = _fingerprint_value(stage.fingerprint_config(), depth + 1)
+    if callable(stage) and hasattr(stage, "__qualname__"):
+        fingerprint["name"] = f"{stage.__module__}.{stage.__qualname__}"
+    return fingerprint
+
+
+def annotation_fingerprint(annotation: Annotation) -> Any:
+    """
+    Describe an annotation by type and field values, excluding the (randomly generated) annotation ids.
+    Referenced annotations are described by type and span rather than recursively.
+    """
+    def encode_field(val):
+        if isinstance(val, Annotation):
+            return [f"{val.__class__.__module__}.{val.__class__.__qualname__}",
+                    getattr(val, "begin", None), getattr(val, "end", None)]
+        elif isinstance(val, (list, tuple)):
+            return [encode_field(v) for v in val]
+        elif isinstance(val, dict):
+            return {str(k): encode_field(v) for k, v in val.items()}
+        return _fingerprint_value(val)
+
+    return [
+        f"{annotation.__class__.__module__}.{annotation.__class__.__qualname__}",
+        [(name, encode_field(getattr(annotation, name))) for name in annotation.__dataclass_fields__ if name != "id"]
+    ]
+
+
+class CachedAnalysisFunction(AnalysisFunction):
+    """
+    Wraps an analysis function so that its results are cached in a `StageResultStore`.
+
+    The cache key is a hash over the content of the processed views, the stage configuration,
+    the runtime keyword arguments and the annotations the stage reads.  On a cache hit the annotations
+    the stage added previously are replayed into the views instead of running the stage.
+
+    Only annotations added to the views listed in `viewnames` are cached.  Stages that modify view content
+    or create views should not be cached.  Stages that edit existing annotations should have a false
+    `cacheable` attribute, and are refused.
+
+    Usage:
+        store = StageResultStore("/tmp/jembatan-cache", max_bytes=10 * 1024 ** 3)
+        spacy_stage = CachedAnalysisFunction(SpacyAnalyzer(), store, input_types=[])
+        SimplePipeline.run(collection, [spacy_stage])
+        print(store.stats)
+    """
+
+    def __init__(self, analysis_func: AnalysisFunction, store: StageResultStore,
+                 input_types: Optional[Iterable[type]] = None,
+                 viewnames: Optional[Iterable[str]] = None, config: Any = None):
+        """
+        Args:
+            analysis_func: analysis function to wrap
+            store: store to hold cached results
+            input_types (optional): annotation types the analysis function reads.  Defaults to the
+                `input_types` attribute of `analysis_func`.  A value of None means the analysis function
+                may read any annotation, so all annotations in the view are part of the key.
+            viewnames (optional): views the analysis function reads and writes.  Defaults to the default view.
+            config (optional): JSON serializable description of the stage configuration.  Defaults to a
+                fingerprint of the analysis function's attributes.
+        """
+        if not getattr(analysis_func, "cacheable", True):
+            raise ValueError(f"{analysis_func} modifies existing annotations, so its results can not be cached")
+        self.analysis_func = analysis_func
+        self.store = store
+        if input_types is None:
+            input_types = getattr(analysis_func, "input_types", None)
+        self.input_types = tuple(input_types) if input_types is not None else None
+        self.viewnames = list(viewnames) if viewnames else [constants.SPANDEX_DEFAULT_VIEW]
+        self.config = config if config is not None else stage_fingerprint(analysis_func)
+        self._config_str = json.dumps(_fingerprint_value(self.config), sort_keys=True)
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self.analysis_func})"
+
+    def read_annotations(self, spndx: Spandex) -> Iterable[Annotation]:
+        if self.input_types is None:
+            return list(spndx.annotations)
+        if not self.input_types:
+            return []
+        return [a for a in spndx.annotations if isinstance(a, self.input_types)]
+
+    def compute_key(self, jemdoc: JembatanDoc, **kwargs) -> str:
+        h = hashlib.sha256()
+        h.update(self._config_str.encode("utf-8"))
+        h.update(json.dumps(_fingerprint_value(kwargs), sort_keys=True).encode("utf-8"))
+        for viewname in self.viewnames:
+            spndx = jemdoc.get_view(viewname)
+            view_header = [viewname, spndx.content_mime, len(spndx.content_string or "")]
+            h.update(json.dumps(view_header).encode("utf-8"))
+            h.update((spndx.content_string or "").encode("utf-8", "surrogatepass"))
+            for annotation in self.read_annotations(spndx):
+                h.update(json.dumps(annotation_fingerprint(annotation)).encode("utf-8"))
+        return h.hexdigest()
+
+    def run_stage(self, jemdoc: JembatanDoc, **kwargs):
+        process = getattr(self.analysis_func, "process", self.analysis_func)
+        process(jemdoc, **kwargs)
+
+    def replay(self, jemdoc: JembatanDoc, entry: Dict):
+        """
+        Add annotations from a cache entry into the views of `jemdoc`.  References to annotations
+        the stage read are resolved against the annotations currently in the view.
+        """
+        decoder = JembatanDocJsonDecoder()
+        for viewname in self.viewnames:
+            spndx = jemdoc.get_view(viewname)
+            stored_input_ids = entry["inputs"][viewname]
+            decoder.layer_registry = dict(zip(stored_input_ids, self.read_annotations(spndx)))
+
+            replayed = []
+            for annotation_obj in entry["outputs"][viewname]:
+                annotation = decoder.decode_annotation(annotation_obj)
+                decoder.layer_registry[annotation.id] = annotation
+                replayed.append(annotation)
+
+            # give replayed annotations fresh identities so they are distinct from other documents' replays
+            for annotation in replayed:
+                annotation.id = generate_annotation_id()
+
+            if replayed:
+                spndx.add_annotations(*replayed)
+
+    def process(self, jemdoc: JembatanDoc, **kwargs):
+        key = self.compute_key(jemdoc, **kwargs)
+        entry = self.store.get(key)
+        if entry is not None:
+            self.replay(jemdoc, entry)
+            return
+
+        inputs = {}
+        before = {}
+        for viewname in self.viewnames:
+            spndx = jemdoc.get_view(viewname)
+            inputs[viewname] = [a.id for a in self.read_annotations(spndx)]
+            before[viewname] = {id(a) for a in spndx.annotations}
+
+        self.run_stage(jemdoc, **kwargs)
+
+        encoder = JembatanDocJsonEncoder()
+        outputs = {}
+        for viewname in self.viewnames:
+            spndx = jemdoc.get_view(viewname)
+            seen = before[viewname]
+            outputs[viewname] = [encoder.encode_obj(a) for a in spndx.annotations if id(a) not in seen]
+
+        self.store.put(key, {"inputs": inputs, "outputs": outputs})
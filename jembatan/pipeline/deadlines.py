@@ -0,0 +1,145 @@
+import contextlib
+import signal
+import threading
+import time
+
+from collections import namedtuple
+from jembatan.core.spandex import JembatanDoc
+from jembatan.pipeline.errors import DeadlineExceeded
+from typing import Dict, List, MutableMapping, Optional
+
+
+SlowLaneEntry = namedtuple("SlowLaneEntry", ["jemdoc", "stage_index", "document_index", "elapsed"])
+
+TimeoutRecord = namedtuple("TimeoutRecord", ["document_index", "stage_index", "stage_elapsed", "document_elapsed"])
+
+PARTIAL_METADATA_KEY = "jembatan.partial"
+
+
+def can_interrupt() -> bool:
+    """
+    Running stages can only be interrupted from the main thread on platforms with interval timers
+    """
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float], stage_index: int = None):
+    """
+    Context manager raising `DeadlineExceeded` inside its body once `seconds` have elapsed.  This uses
+    SIGALRM, so it is a no-op outside of the main thread or on platforms without `signal.setitimer`.
+    Native code that does not return to the interpreter (e.g. a single long Cython call) is interrupted
+    as soon as control comes back to Python.
+    """
+    if seconds is None or not can_interrupt():
+        yield
+        return
+
+    start = time.perf_counter()
+
+    def on_alarm(signum, frame):
+        raise DeadlineExceeded(f"stage {stage_index} exceeded its {seconds:.3f}s budget",
+                               stage_index=stage_index, elapsed=time.perf_counter() - start)
+
+    previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(seconds, 1e-6))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def snapshot_document(jemdoc: JembatanDoc) -> Dict:
+    """
+    Capture the state of every view of a document before running a stage that may be cancelled
+    """
+    return {viewname: view.snapshot() for viewname, view in jemdoc.views.items()}
+
+
+def restore_document(jemdoc: JembatanDoc, snapshot: Dict):
+    """
+    Roll a document back to `snapshot`, dropping views created since and partial annotations left behind
+    by a cancelled stage, so rerunning the stage does not add them twice
+    """
+    for viewname in [v for v in jemdoc.views if v not in snapshot]:
+        del jemdoc.views[viewname]
+    for viewname, view_snapshot in snapshot.items():
+        jemdoc.views[viewname].restore(view_snapshot)
+
+
+class TimeBudget:
+    """
+    Per-document and per-stage time budgets for `SimplePipeline`.
+
+    When a document runs over budget its remaining stages are skipped and, depending on `on_timeout`, it is either
+    routed to the `slow_lane` instead of being yielded, or yielded marked as partially processed.  Documents in the
+    slow lane can be finished later with `SimplePipeline.resume`, e.g. with a larger budget or on another worker.
+
+    Usage:
+        budget = TimeBudget(document=30.0, stage=20.0)
+        profiler = SimplePipeline.run(collection, stages, budget=budget)
+        print(profiler.to_json(pretty_print=True))   # includes p50/p95/p99 latencies per stage
+
+        for jemdoc in SimplePipeline.resume(budget.slow_lane, stages):
+            ...
+    """
+    SLOW_LANE = "slow_lane"
+    PARTIAL = "partial"
+
+    def __init__(self, document: Optional[float] = None, stage: Optional[float] = None,
+                 on_timeout: str = SLOW_LANE, slow_lane: Optional[List] = None, interrupt: bool = True):
+        """
+        Args:
+            document: seconds a document may spend across all stages
+            stage: seconds a document may spend in any single stage
+            on_timeout: either `TimeBudget.SLOW_LANE` or `TimeBudget.PARTIAL`
+            slow_lane: list-like collection receiving `SlowLaneEntry` records.  Defaults to a new list.
+            interrupt: cancel stages while they run.  When False, or when interruption is not possible,
+                budgets are only checked between stages.
+        """
+        if on_timeout not in (self.SLOW_LANE, self.PARTIAL):
+            raise ValueError(f"on_timeout must be one of {self.SLOW_LANE!r}, {self.PARTIAL!r}, not {on_timeout!r}")
+        self.document = document
+        self.stage = stage
+        self.on_timeout = on_timeout
+        self.slow_lane = slow_lane if slow_lane is not None else []
+        self.interrupt = interrupt
+        self.timeouts = []
+
+    def stage_timeout(self, document_elapsed: float) -> Optional[float]:
+        """
+        Return the number of seconds the next stage may run for, or None if unbounded
+        """
+        remaining = [t for t in (self.stage, None if self.document is None else self.document - document_elapsed)
+                     if t is not None]
+        return min(remaining) if remaining else None
+
+    def exceeded(self, stage_elapsed: float, document_elapsed: float) -> bool:
+        return (self.stage is not None and stage_elapsed > self.stage) or \
+            (self.document is not None and document_elapsed > self.document)
+
+    def handle_timeout(self, jemdoc: JembatanDoc, document_index: int, stage_index: int,
+                       stage_elapsed: float, document_elapsed: float) -> bool:
+        """
+        Record a timeout and route the document.  Returns True if the document should still be yielded
+        """
+        self.timeouts.append(TimeoutRecord(document_index, stage_index, stage_elapsed, document_elapsed))
+
+        if self.on_timeout == self.SLOW_LANE:
+            entry = SlowLaneEntry(jemdoc, stage_index, document_index, document_elapsed)
+            if hasattr(self.slow_lane, "put"):
+                self.slow_lane.put(entry)
+            else:
+                self.slow_lane.append(entry)
+            return False
+
+        if jemdoc.metadata is None:
+            jemdoc.metadata = {}
+        if isinstance(jemdoc.metadata, MutableMapping):
+            jemdoc.metadata[PARTIAL_METADATA_KEY] = {
+                "stage_index": stage_index,
+                "stage_elapsed": stage_elapsed,
+                "document_elapsed": document_elapsed,
+            }
+        return True
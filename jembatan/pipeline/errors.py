@@ -0,0 +1,13 @@
+class PipelineError(Exception):
+    pass
+
+
+class DeadlineExceeded(PipelineError):
+    """
+    Raised when a document or stage runs past its time budget
+    """
+
+    def __init__(self, message: str = "time budget exceeded", stage_index: int = None, elapsed: float = None):
+        super().__init__(message)
+        self.stage_index = stage_index
+        self.elapsed = elapsed
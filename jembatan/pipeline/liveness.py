@@ -0,0 +1,93 @@
+from jembatan.core.spandex import JembatanDoc, constants
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+
+class OutputSchema:
+    """
+    Declares which views and annotation types are wanted at the end of a pipeline.  Annotation types are
+    matched with `isinstance`, so declaring a base type keeps its subtypes as well.
+
+    Types referenced from kept annotations (e.g. the `DependencyNode`s of a `DependencyParse`) should be
+    declared too, otherwise the references will point at annotations no longer indexed in the view.
+
+    Usage:
+        # keep only sentences and entities in the default view, leave the "gold" view untouched
+        schema = OutputSchema({
+            constants.SPANDEX_DEFAULT_VIEW: [Sentence, Entity],
+            "gold": None
+        })
+    """
+
+    def __init__(self, views: Mapping[str, Optional[Iterable[type]]]):
+        """
+        Args:
+            views: mapping of view name to the annotation types to keep in that view.  A value of None keeps
+                every annotation in the view.  Annotations in views not present in the mapping are dropped
+                once no remaining stage reads them.
+        """
+        self.views = {
+            viewname: (tuple(types) if types is not None else None) for viewname, types in views.items()
+        }
+
+    @classmethod
+    def default_view(cls, *types: type) -> "OutputSchema":
+        """
+        Create a schema keeping `types` in the default view
+        """
+        return cls({constants.SPANDEX_DEFAULT_VIEW: types})
+
+    def types_for(self, viewname: str) -> Optional[Tuple[type, ...]]:
+        return self.views.get(viewname, ())
+
+
+class LivenessPlan:
+    """
+    Computes, for each stage of a linear pipeline, which annotation types are still read by the stages
+    after it and drops everything else.
+
+    Stages declare what they read via an `input_types` attribute (see `AnalysisFunction.input_types`).  A stage
+    without the declaration may read anything, so no annotations are dropped before it runs.  Declared types
+    apply to every view since stages may be view mapped.
+    """
+
+    def __init__(self, stages: Sequence, output_schema: OutputSchema):
+        self.output_schema = output_schema
+        self.live_after = self.compute_live_types(stages)
+
+    @staticmethod
+    def compute_live_types(stages: Sequence) -> List[Optional[Tuple[type, ...]]]:
+        """
+        Return for every stage the types read by later stages, or None if unknown
+        """
+        live_after = []
+        live = ()
+        for stage in reversed(list(stages)):
+            live_after.append(live)
+            input_types = getattr(stage, 'input_types', None)
+            if live is None or input_types is None:
+                live = None
+            else:
+                live = live + tuple(t for t in input_types if t not in live)
+        live_after.reverse()
+        return live_after
+
+    def keep_types(self, index: int, viewname: str) -> Optional[Tuple[type, ...]]:
+        """
+        Return types to keep in view after stage `index` has run, or None if everything should be kept
+        """
+        live = self.live_after[index]
+        schema_types = self.output_schema.types_for(viewname)
+        if live is None or schema_types is None:
+            return None
+        return live + tuple(t for t in schema_types if t not in live)
+
+    def prune(self, index: int, jemdoc: JembatanDoc) -> Dict[str, int]:
+        """
+        Drop annotations no longer needed after stage `index`.  Returns the number of annotations removed per view
+        """
+        removed = {}
+        for viewname, view in jemdoc.views.items():
+            keep = self.keep_types(index, viewname)
+            if keep is not None:
+                removed[viewname] = view.retain_types(keep)
+        return removed
@@ -0,0 +1,364 @@
+import cProfile
+import gc
+import json
+import math
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+from array import array
+from collections import Counter, OrderedDict
+from jembatan.core.spandex import JembatanDoc
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+def peak_rss_bytes() -> int:
+    """
+    Return the peak resident set size of this process in bytes, or 0 if it can not be determined
+    """
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def stage_name(stage: Any) -> str:
+    """
+    Return a stable human readable name for a stage
+    """
+    name = getattr(stage, "name", None)
+    if isinstance(name, str):
+        return name
+    if hasattr(stage, "__qualname__"):
+        # functions and classes
+        return stage.__qualname__
+    return stage.__class__.__name__
+
+
+def count_annotation_types(jemdoc: JembatanDoc) -> Counter:
+    counts = Counter()
+    for view in jemdoc.views.values():
+        counts.update(a.__class__.__name__ for a in view.annotations)
+    return counts
+
+
+def document_characters(jemdoc: JembatanDoc) -> int:
+    content_string = jemdoc.default_view.content_string
+    return len(content_string) if content_string else 0
+
+
+def nearest_rank(ordered: List[float], q: float) -> float:
+    """
+    Return the q-th percentile (0-100) of already sorted values
+    """
+    if not ordered:
+        return 0.0
+    rank = max(int(math.ceil(q / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+class StageMetrics:
+    """
+    Aggregate measurements for a single pipeline stage
+    """
+
+    def __init__(self, index: int, name: str):
+        self.index = index
+        self.name = name
+        self.documents = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.characters = 0
+        self.peak_rss_delta = 0
+        self.retained_bytes = 0
+        self.annotations_added = Counter()
+        # per document wall times, kept compact for large runs
+        self.latencies = array('d')
+
+    def __repr__(self):
+        return "<{} {}:{} documents={} wall_time={:.3f}s>".format(
+            self.__class__.__name__, self.index, self.name, self.documents, self.wall_time)
+
+    @property
+    def mean_wall_time(self) -> float:
+        return self.wall_time / self.documents if self.documents else 0.0
+
+    @property
+    def retained_bytes_per_document(self) -> float:
+        return self.retained_bytes / self.documents if self.documents else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Return the q-th percentile (0-100) of per-document latencies using the nearest-rank method
+        """
+        return self.latency_percentiles((q,))[f"p{q:g}"]
+
+    def latency_percentiles(self, quantiles: Tuple[float, ...] = (50, 95, 99)) -> Dict[str, float]:
+        ordered = sorted(self.latencies)
+        return {f"p{q:g}": nearest_rank(ordered, q) for q in quantiles}
+
+    def to_dict(self) -> Dict:
+        return {
+            "index": self.index,
+            "name": self.name,
+            "documents": self.documents,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "characters": self.characters,
+            "peak_rss_delta": self.peak_rss_delta,
+            "retained_bytes": self.retained_bytes,
+            "retained_bytes_per_document": self.retained_bytes_per_document,
+            "annotations_added": dict(self.annotations_added),
+            "latency": self.latency_percentiles(),
+        }
+
+
+class PipelineProfiler:
+    """
+    Collects per-stage measurements while running a pipeline.  Pass an instance to `SimplePipeline`
+    to instrument a run:
+
+        profiler = PipelineProfiler(profile_slowest=True)
+        SimplePipeline.run(collection, stages, profiler=profiler)
+
+        for stage_metrics in profiler.stages:
+            print(stage_metrics.name, stage_metrics.wall_time)
+
+        profiler.to_json("metrics.json", pretty_print=True)
+        profiler.write_prometheus("metrics.prom")
+        profiler.profile_stats().sort_stats("cumulative").print_stats(20)
+
+    For every stage it records wall and CPU time, document count, characters processed, annotations added
+    per type and growth of the process's peak resident set size.  When `profile_slowest` is enabled the stage
+    with the most wall time after `profile_after` documents is profiled with cProfile for the rest of the run.
+
+    When `trace_memory` is enabled, memory still allocated after each stage finishes (and garbage has been
+    collected) is recorded as `retained_bytes`.  This is memory the stage leaves behind, e.g. in annotations
+    or objects they reference, and shows whether a stage keeps per-document data alive.
+    """
+
+    def __init__(self, count_annotations: bool = True, profile_slowest: bool = False, profile_after: int = 10,
+                 trace_memory: bool = False):
+        """
+        Args:
+            count_annotations: count annotations added per type.  This requires a scan of all
+                annotations before and after each stage.
+            profile_slowest: capture a cProfile profile of the slowest stage
+            profile_after: number of documents to process before picking the slowest stage
+            trace_memory: measure memory retained by each stage with tracemalloc.  This slows down
+                allocation heavy code considerably and runs a garbage collection after every stage.
+        """
+        self.count_annotations = count_annotations
+        self.profile_slowest = profile_slowest
+        self.profile_after = profile_after
+        self.trace_memory = trace_memory
+        self._started_tracemalloc = False
+
+        self._stages = OrderedDict()
+        self._profiler = None
+        self.profiled_stage = None
+
+    @property
+    def stages(self) -> List[StageMetrics]:
+        return list(self._stages.values())
+
+    @property
+    def documents(self) -> int:
+        return max((s.documents for s in self._stages.values()), default=0)
+
+    def stage_metrics(self, index: int, stage: Any) -> StageMetrics:
+        metrics = self._stages.get(index, None)
+        if metrics is None:
+            metrics = StageMetrics(index, stage_name(stage))
+            self._stages[index] = metrics
+        return metrics
+
+    def _maybe_start_profiling(self):
+        if not self.profile_slowest or self.profiled_stage is not None or not self._stages:
+            return
+        if self.documents < self.profile_after:
+            return
+        slowest = max(self._stages.values(), key=lambda s: s.wall_time)
+        self.profiled_stage = slowest.index
+        self._profiler = cProfile.Profile()
+
+    def run_stage(self, index: int, stage: Any, jemdoc: JembatanDoc, **kwargs):
+        """
+        Run stage on jemdoc and record measurements for it
+        """
+        self.measure(index, stage, [jemdoc], lambda: stage.process(jemdoc, **kwargs))
+
+    def run_stage_batch(self, index: int, stage: Any, jemdocs: List[JembatanDoc], **kwargs):
+        """
+        Run stage over a batch of documents and record measurements for it.  Per document latencies
+        are recorded as the batch time divided evenly over its documents.
+        """
+        process_batch = getattr(stage, "process_batch", None)
+        if process_batch is None:
+            def run():
+                for jemdoc in jemdocs:
+                    stage.process(jemdoc, **kwargs)
+        else:
+            def run():
+                process_batch(jemdocs, **kwargs)
+        self.measure(index, stage, jemdocs, run)
+
+    def measure(self, index: int, stage: Any, jemdocs: List[JembatanDoc], run):
+        """
+        Record measurements for stage `index` while calling `run`, which processes `jemdocs`
+        """
+        metrics = self.stage_metrics(index, stage)
+        self._maybe_start_profiling()
+        profiler = self._profiler if self.profiled_stage == index else None
+
+        before_counts = [count_annotation_types(jemdoc) for jemdoc in jemdocs] if self.count_annotations else None
+        traced_before = self._traced_memory() if self.trace_memory else None
+        rss_before = peak_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        if profiler is not None:
+            profiler.enable()
+        try:
+            run()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            elapsed = time.perf_counter() - wall_start
+            metrics.wall_time += elapsed
+            metrics.latencies.extend([elapsed / len(jemdocs)] * len(jemdocs))
+            metrics.cpu_time += time.process_time() - cpu_start
+            metrics.peak_rss_delta += peak_rss_bytes() - rss_before
+            metrics.documents += len(jemdocs)
+            metrics.characters += sum(document_characters(jemdoc) for jemdoc in jemdocs)
+
+        if traced_before is not None:
+            metrics.retained_bytes += self._traced_memory() - traced_before
+
+        if before_counts is not None:
+            for jemdoc, before in zip(jemdocs, before_counts):
+                added = count_annotation_types(jemdoc)
+                added.subtract(before)
+                metrics.annotations_added.update(+added)
+
+    def _traced_memory(self) -> int:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+
+    def stop_memory_tracing(self):
+        """
+        Stop tracemalloc if it was started by this profiler
+        """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def profile_stats(self) -> Optional[pstats.Stats]:
+        """
+        Return cProfile statistics captured for the slowest stage or None if nothing was profiled
+        """
+        if self._profiler is None:
+            return None
+        return pstats.Stats(self._profiler)
+
+    def dump_profile(self, path: Union[str, Path]):
+        if self._profiler is not None:
+            self._profiler.dump_stats(str(path))
+
+    def to_dict(self) -> Dict:
+        profiled = self._stages.get(self.profiled_stage, None)
+        return {
+            "documents": self.documents,
+            "profiled_stage": profiled.name if profiled else None,
+            "stages": [s.to_dict() for s in self._stages.values()],
+        }
+
+    def to_json(self, path: Union[str, Path, None] = None, pretty_print: bool = False) -> Optional[str]:
+        """Creates a JSON report of collected metrics
+        Args:
+            path: File path, if `None` is provided the result is returned as a string
+            pretty_print: `True` if the resulting JSON should be pretty-printed, else `False`
+        Returns:
+            If `path` is None, then the JSON report is returned as a string
+        """
+        indent = 4 if pretty_print else None
+        if path is None:
+            return json.dumps(self.to_dict(), indent=indent)
+        elif isinstance(path, (str, Path)):
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=indent)
+        else:
+            raise TypeError("`path` needs to be one of [str, None, Path], but was <{0}>".format(type(path)))
+
+    def to_prometheus(self, prefix: str = "jembatan_stage") -> str:
+        """
+        Render collected metrics in the Prometheus text exposition format
+        """
+        def escape(val):
+            return str(val).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+        def labels(stage_metrics, **extra):
+            pairs = [("index", stage_metrics.index), ("stage", stage_metrics.name)] + sorted(extra.items())
+            return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+        metric_defs = [
+            ("documents_total", "counter", "Documents processed by pipeline stage", "documents"),
+            ("wall_seconds_total", "counter", "Wall clock time spent in pipeline stage", "wall_time"),
+            ("cpu_seconds_total", "counter", "CPU time spent in pipeline stage", "cpu_time"),
+            ("characters_total", "counter", "Characters processed by pipeline stage", "characters"),
+            ("peak_rss_delta_bytes", "gauge", "Growth of peak resident set size during pipeline stage",
+             "peak_rss_delta"),
+            ("retained_bytes", "gauge", "Memory left allocated by pipeline stage (requires trace_memory)",
+             "retained_bytes"),
+        ]
+
+        lines = []
+        for suffix, metric_type, help_text, attr in metric_defs:
+            metric = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for stage_metrics in self._stages.values():
+                lines.append(f"{metric}{labels(stage_metrics)} {getattr(stage_metrics, attr)}")
+
+        metric = f"{prefix}_latency_seconds"
+        lines.append(f"# HELP {metric} Per document latency of pipeline stage")
+        lines.append(f"# TYPE {metric} summary")
+        for stage_metrics in self._stages.values():
+            percentiles = stage_metrics.latency_percentiles((50, 95, 99))
+            for q in (50, 95, 99):
+                lines.append(f"{metric}{labels(stage_metrics, quantile=q / 100)} {percentiles[f'p{q}']}")
+            lines.append(f"{metric}_sum{labels(stage_metrics)} {stage_metrics.wall_time}")
+            lines.append(f"{metric}_count{labels(stage_metrics)} {stage_metrics.documents}")
+
+        metric = f"{prefix}_annotations_added_total"
+        lines.append(f"# HELP {metric} Annotations added by pipeline stage")
+        lines.append(f"# TYPE {metric} counter")
+        for stage_metrics in self._stages.values():
+            for type_name, count in sorted(stage_metrics.annotations_added.items()):
+                lines.append(f"{metric}{labels(stage_metrics, type=type_name)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Union[str, Path], prefix: str = "jembatan_stage"):
+        """
+        Write metrics in Prometheus text format to a local file.  The file is replaced atomically
+        so it can be picked up by a textfile collector while a run is in progress.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
@@ -0,0 +1,13 @@
+class ReaderError(Exception):
+    pass
+
+
+class FetchError(ReaderError):
+    """
+    Raised when a URI can not be fetched, after retries
+    """
+
+    def __init__(self, message: str, uri: str = None, status: int = None):
+        super().__init__(message)
+        self.uri = uri
+        self.status = status
@@ -0,0 +1,115 @@
+import glob
+import mmap
+import os
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from jembatan.core.spandex import JembatanDoc
+from pathlib import Path
+from typing import Iterable, Iterator, List, Union
+
+
+def expand_paths(patterns: Iterable[Union[str, Path]]) -> Iterator[Path]:
+    """
+    Yield files matching glob patterns in sorted order per pattern.  Directories, whether given or
+    matched, yield all files below them.  `**` matches any number of directories.
+    """
+    for pattern in patterns:
+        pattern = str(pattern)
+        matches = sorted(glob.iglob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            path = Path(match)
+            if path.is_dir():
+                yield from sorted(p for p in path.rglob("*") if p.is_file())
+            elif path.is_file():
+                yield path
+
+
+def read_text(path: Union[str, Path], encoding: str = "utf-8", errors: str = "strict",
+              mmap_threshold: int = 1 << 20) -> str:
+    """
+    Read and decode a file.  Files of at least `mmap_threshold` bytes are memory mapped and decoded straight
+    from the mapping, instead of being read into an intermediate bytes object.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < mmap_threshold or size == 0:
+            return f.read().decode(encoding, errors)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(mapped, encoding, errors)
+
+
+def file_to_jembatan_doc(path: Union[str, Path], encoding: str = "utf-8", errors: str = "strict",
+                         mmap_threshold: int = 1 << 20, content_mime: str = "text/plain") -> JembatanDoc:
+    """
+    Create Jembatan with the text of a file populating the default view, and path, size and mtime of the file
+    as metadata
+    """
+    path = Path(path)
+    stat = path.stat()
+    text = read_text(path, encoding=encoding, errors=errors, mmap_threshold=mmap_threshold)
+    metadata = {"path": str(path), "size": stat.st_size, "mtime": stat.st_mtime}
+    return JembatanDoc(metadata=metadata, content_string=text, content_mime=content_mime)
+
+
+class FileJemdocCollection():
+    """
+    Collection of JembatanDocs read from local files matching glob patterns.
+
+    Files are read and decoded on a pool of background threads, keeping up to `read_ahead` documents
+    ahead of the consumer, so reading overlaps with processing without holding the whole corpus in
+    memory.  Documents are yielded in path order.
+
+    Usage:
+        for jemdoc in FileJemdocCollection(["corpus/**/*.txt"], n_threads=8):
+            pipeline.process(jemdoc)
+    """
+
+    def __init__(self, patterns: Union[str, Path, Iterable[Union[str, Path]]], encoding: str = "utf-8",
+                 errors: str = "strict", n_threads: int = 4, read_ahead: int = 32, mmap_threshold: int = 1 << 20,
+                 content_mime: str = "text/plain"):
+        """
+        @param patterns - glob pattern, file or directory path, or iterable of them
+        @param encoding - text encoding of the files
+        @param errors - how to handle decoding errors, as for `bytes.decode`
+        @param n_threads - number of reader threads
+        @param read_ahead - maximum number of documents read but not yet consumed
+        @param mmap_threshold - size in bytes from which files are memory mapped
+        @param content_mime - mime type of the default view
+        """
+        self.patterns = [patterns] if isinstance(patterns, (str, Path)) else list(patterns)
+        self.encoding = encoding
+        self.errors = errors
+        self.n_threads = n_threads
+        self.read_ahead = max(read_ahead, 1)
+        self.mmap_threshold = mmap_threshold
+        self.content_mime = content_mime
+
+    def paths(self) -> List[Path]:
+        return list(expand_paths(self.patterns))
+
+    def read(self, path: Path) -> JembatanDoc:
+        return file_to_jembatan_doc(path, encoding=self.encoding, errors=self.errors,
+                                    mmap_threshold=self.mmap_threshold, content_mime=self.content_mime)
+
+    def __iter__(self) -> Iterator[JembatanDoc]:
+        paths = expand_paths(self.patterns)
+        if self.n_threads <= 1:
+            for path in paths:
+                yield self.read(path)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.n_threads, thread_name_prefix="jembatan-reader")
+        pending = deque()
+        try:
+            for path in paths:
+                pending.append(executor.submit(self.read, path))
+                if len(pending) >= self.read_ahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # the consumer may stop early, do not keep reading files nobody will see
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,405 @@
+import asyncio
+import codecs
+import random
+import ssl
+
+from collections import deque
+from email.message import Message
+from jembatan.core.spandex import JembatanDoc, constants
+from jembatan.readers.errors import FetchError
+from jembatan.readers.filereader import read_text
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+# responses that never have a body, whatever their headers say, besides informational 1xx ones
+NO_BODY_STATUSES = frozenset((204, 304))
+
+
+def content_charset(content_type: Optional[str], default: str = "utf-8") -> str:
+    if not content_type:
+        return default
+    message = Message()
+    message["content-type"] = content_type
+    charset = message.get_content_charset()
+    try:
+        return codecs.lookup(charset).name if charset else default
+    except LookupError:
+        return default
+
+
+def content_mime(content_type: Optional[str], default: str = "text/plain") -> str:
+    return content_type.split(";", 1)[0].strip().lower() if content_type else default
+
+
+class Response(NamedTuple):
+    uri: str
+    status: int
+    headers: Dict[str, str]
+    text: str
+
+
+class _Connection(object):
+
+    __slots__ = ("reader", "writer", "requests")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+class HostPool(object):
+    """
+    Keep-alive connections to one (scheme, host, port), at most `max_connections` of them in use at a time
+    """
+
+    def __init__(self, host: str, port: int, use_ssl: bool, max_connections: int):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if use_ssl else None
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(max_connections)
+        self.opened = 0
+
+    async def acquire(self) -> _Connection:
+        await self.slots.acquire()
+        while self.idle:
+            connection = self.idle.pop()
+            if not connection.reader.at_eof():
+                return connection
+            connection.close()
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        except BaseException:
+            self.slots.release()
+            raise
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    def release(self, connection: _Connection, reusable: bool):
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection.close()
+        self.slots.release()
+
+    def close(self) -> List[_Connection]:
+        closed = list(self.idle)
+        self.idle.clear()
+        for connection in closed:
+            connection.close()
+        return closed
+
+
+class _StaleConnection(Exception):
+    """
+    A reused keep-alive connection was closed by the server before sending a response
+    """
+
+
+class AsyncHttpFetcher(object):
+    """
+    Minimal asyncio HTTP/1.1 client for fetching documents, using only the standard library.
+    Connections are kept alive and pooled per host, the number of requests in flight is limited overall
+    and per host, and failed requests are retried with exponential backoff.
+
+    Usage:
+        async with AsyncHttpFetcher(concurrency=32) as fetcher:
+            response = await fetcher.fetch("http://example.com/doc.txt")
+    """
+
+    USER_AGENT = "jembatan"
+
+    def __init__(self, concurrency: int = 16, per_host: int = 4, retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 30.0, max_redirects: int = 5, read_size: int = 1 << 16,
+                 retry_statuses: Iterable[int] = RETRY_STATUSES):
+        """
+        Args:
+            concurrency: maximum number of requests in flight
+            per_host: maximum number of connections per host
+            retries: number of times a failed request is retried
+            backoff: delay before the first retry in seconds, doubled for every further retry
+            timeout: time limit for a single attempt in seconds
+            max_redirects: maximum number of redirects followed
+            read_size: size of the blocks response bodies are read and decoded in
+            retry_statuses: HTTP statuses for which requests are retried
+        """
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.read_size = read_size
+        self.retry_statuses = frozenset(retry_statuses)
+        self.pools: Dict[Tuple[str, str, int], HostPool] = {}
+        self._slots = None
+        self._opened_by_closed_pools = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def close(self) -> List[_Connection]:
+        """
+        Close idle connections and drop the pools, which are bound to the running event loop
+        """
+        closed = []
+        for pool in self.pools.values():
+            closed.extend(pool.close())
+            self._opened_by_closed_pools += pool.opened
+        self.pools.clear()
+        self._slots = None
+        return closed
+
+    async def aclose(self):
+        """
+        Close idle connections and wait for them to be closed
+        """
+        for connection in self.close():
+            await connection.wait_closed()
+
+    @property
+    def connections_opened(self) -> int:
+        return self._opened_by_closed_pools + sum(pool.opened for pool in self.pools.values())
+
+    def pool(self, scheme: str, host: str, port: int) -> HostPool:
+        key = (scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = HostPool(host, port, scheme == "https", self.per_host)
+        return pool
+
+    async def fetch(self, uri: str) -> Response:
+        """
+        Fetch a URI, following redirects and retrying failures.  Raises `FetchError` when the URI can not
+        be fetched or the final response is not successful.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            for _ in range(self.max_redirects + 1):
+                response = await self._fetch_with_retries(uri)
+                location = response.headers.get("location")
+                if response.status in REDIRECT_STATUSES and location:
+                    uri = urljoin(uri, location)
+                    continue
+                if response.status >= 400:
+                    raise FetchError(f"GET {uri} returned {response.status}", uri=uri, status=response.status)
+                return response
+            raise FetchError(f"Too many redirects fetching {uri}", uri=uri)
+
+    async def _fetch_with_retries(self, uri: str) -> Response:
+        attempt = 0
+        while True:
+            try:
+                response = await asyncio.wait_for(self._request(uri), self.timeout)
+                if response.status not in self.retry_statuses or attempt >= self.retries:
+                    return response
+            except _StaleConnection:
+                # not the server's fault, try again straight away on a fresh connection
+                continue
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                if attempt >= self.retries:
+                    raise FetchError(f"GET {uri} failed: {e!r}", uri=uri) from e
+            # jitter keeps retries of many documents from arriving in waves
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _request(self, uri: str) -> Response:
+        parts = urlsplit(uri)
+        if parts.scheme not in ("http", "https"):
+            raise FetchError(f"Unsupported scheme in {uri}", uri=uri)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        pool = self.pool(parts.scheme, parts.hostname, port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+
+        connection = await pool.acquire()
+        reusable = False
+        try:
+            reused = connection.requests > 0
+            connection.requests += 1
+            connection.writer.write(
+                f"GET {target} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {self.USER_AGENT}\r\n"
+                f"Accept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n".encode("latin-1"))
+            await connection.writer.drain()
+
+            while True:
+                status_line = await connection.reader.readline()
+                if not status_line:
+                    if reused:
+                        raise _StaleConnection()
+                    raise asyncio.IncompleteReadError(b"", None)
+                version, status, _ = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+                status = int(status)
+                headers = await self._read_headers(connection.reader)
+                # interim responses, e.g. 103 Early Hints, are followed by the actual one
+                if not 100 <= status < 200 or status == 101:
+                    break
+
+            text, complete = await self._read_body(connection.reader, status, headers)
+            reusable = complete and status != 101 and version == "HTTP/1.1" and \
+                headers.get("connection", "").lower() != "close"
+            return Response(uri=uri, status=status, headers=headers, text=text)
+        finally:
+            pool.release(connection, reusable)
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read_body(self, reader: asyncio.StreamReader, status: int,
+                         headers: Dict[str, str]) -> Tuple[str, bool]:
+        """
+        Read and decode the body block by block.  Returns the text and whether the connection is positioned
+        after the body, and so can be reused.
+        """
+        if status < 200 or status in NO_BODY_STATUSES:
+            return "", True
+
+        decoder = codecs.getincrementaldecoder(content_charset(headers.get("content-type")))(errors="replace")
+        parts: List[str] = []
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size = int((await reader.readline()).split(b";", 1)[0].strip(), 16)
+                if size == 0:
+                    # skip trailers
+                    await self._read_headers(reader)
+                    break
+                while size:
+                    block = await reader.readexactly(min(size, self.read_size))
+                    parts.append(decoder.decode(block))
+                    size -= len(block)
+                await reader.readexactly(2)
+            complete = True
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining:
+                block = await reader.readexactly(min(remaining, self.read_size))
+                parts.append(decoder.decode(block))
+                remaining -= len(block)
+            complete = True
+        else:
+            while True:
+                block = await reader.read(self.read_size)
+                if not block:
+                    break
+                parts.append(decoder.decode(block))
+            complete = False
+
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), complete
+
+
+class AsyncUriJemdocCollection(object):
+    """
+    Collection of JembatanDocs fetched from URIs with an `AsyncHttpFetcher`.  Each document has a URI view
+    holding the URI, and the fetched text in the target view.  Local paths and file URIs are read on a
+    thread.  Up to `read_ahead` documents are fetched concurrently ahead of the consumer, and documents are
+    yielded in URI order.
+
+    Use `async for` inside a running event loop, or plain `for`, which runs its own event loop and closes
+    the fetcher's connections when done.
+
+    Usage:
+        for jemdoc in AsyncUriJemdocCollection(uris, concurrency=64, per_host=8):
+            pipeline.process(jemdoc)
+    """
+
+    def __init__(self, uris: Iterable[str], tgt_viewname: str = None, read_ahead: int = 64,
+                 raise_errors: bool = True, fetcher: AsyncHttpFetcher = None, **fetcher_args):
+        """
+        Args:
+            uris: URIs or local paths to fetch
+            tgt_viewname: view to store fetched text in, by default the default view
+            read_ahead: maximum number of documents fetched ahead of the consumer
+            raise_errors: raise `FetchError` for documents that can not be fetched.  Otherwise such
+                documents are yielded with the error in their `error` metadata and no text.
+            fetcher: fetcher to use, by default one is created with `fetcher_args`
+        """
+        self.uris = uris
+        self.tgt_viewname = tgt_viewname if tgt_viewname else constants.SPANDEX_DEFAULT_VIEW
+        self.read_ahead = max(read_ahead, 1)
+        self.raise_errors = raise_errors
+        self.fetcher = fetcher
+        self.fetcher_args = fetcher_args
+
+    async def fetch_jemdoc(self, fetcher: AsyncHttpFetcher, uri: str) -> JembatanDoc:
+        jemdoc = JembatanDoc(metadata={"uri": uri})
+        jemdoc.create_view(constants.SPANDEX_URI_VIEW, content_string=uri, content_mime="text/uri")
+        tgt_view = jemdoc.get_or_create_view(self.tgt_viewname)
+
+        parts = urlsplit(uri)
+        try:
+            if parts.scheme in ("", "file"):
+                path = parts.path if parts.scheme else uri
+                tgt_view.content_string = await asyncio.get_running_loop().run_in_executor(None, read_text, path)
+                tgt_view.content_mime = "text/plain"
+            else:
+                response = await fetcher.fetch(uri)
+                jemdoc.metadata.update(status=response.status, final_uri=response.uri)
+                tgt_view.content_string = response.text
+                tgt_view.content_mime = content_mime(response.headers.get("content-type"))
+        except (FetchError, OSError, UnicodeDecodeError) as e:
+            # local files are decoded strictly, so undecodable bytes fail the document rather than the collection
+            if self.raise_errors:
+                raise
+            jemdoc.metadata["error"] = str(e)
+        return jemdoc
+
+    async def __aiter__(self) -> AsyncIterator[JembatanDoc]:
+        fetcher = self.fetcher if self.fetcher is not None else AsyncHttpFetcher(**self.fetcher_args)
+        pending = deque()
+        try:
+            for uri in self.uris:
+                pending.append(asyncio.ensure_future(self.fetch_jemdoc(fetcher, uri)))
+                if len(pending) >= self.read_ahead:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            if self.fetcher is None:
+                await fetcher.aclose()
+
+    def __iter__(self) -> Iterator[JembatanDoc]:
+        loop = asyncio.new_event_loop()
+        jemdocs = self.__aiter__()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(jemdocs.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(jemdocs.aclose())
+            if self.fetcher is not None:
+                # connections of the fetcher belong to this loop
+                loop.run_until_complete(self.fetcher.aclose())
+            loop.close()
@@ -11,14 +11,14 @@ def text_to_jembatan_doc(text):
 
 class TextJemdocCollection():
     """
-    Given collection of texts transform into collection of Spandexes
+    Given collection of texts transform into collection of JembatanDocs
     """
 
     def __init__(self, texts):
         """
-        @param uris - iterable of uri or local path strings
+        @param texts - iterable of text strings
         """
-        self.texts
+        self.texts = texts
 
     def __iter__(self):
         for text in self.texts:
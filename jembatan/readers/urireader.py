@@ -1,17 +1,29 @@
 import urllib.request
-from jembatan.core.spandex import Spandex, constants
+from jembatan.core.spandex import JembatanDoc, constants
+from jembatan.readers.httpreader import content_charset
+
+
+def read_uri(uri: str) -> str:
+    """
+    Read the text at a URI or local path, closing the handle afterwards
+    """
+    url = urllib.request.urlparse(uri)
+    if not url.scheme:
+        with open(uri) as fh:
+            return fh.read()
+    with urllib.request.urlopen(uri) as fh:
+        return fh.read().decode(content_charset(fh.headers.get("content-type")), errors="replace")
+
 
 def uri_to_spndx(uri, viewname=None):
     if not viewname:
         viewname = constants.SPANDEX_DEFAULT_VIEW
-    url = urllib.request.urlparse(uri)
-    fh = open(uri) if not url.scheme else urllib.request.urlopen(uri)
 
-    spndx = Spandex()
-    view = spndx.get_or_create_view(viewname)
-    view.content_string = fh.read()
+    jemdoc = JembatanDoc()
+    view = jemdoc.get_or_create_view(viewname)
+    view.content_string = read_uri(uri)
     view.content_mime = "text/plain"
-    return spndx
+    return jemdoc
 
 
 class UriSpandexCollection:
@@ -24,9 +36,9 @@ class UriSpandexCollection:
 
     def __iter__(self):
         for uri in self.uris:
-            spndx = Spandex()
-            view = spndx.create_view(constants.SPANDEX_URI_VIEW, content_string=uri, content_mime="text/uri")
-            yield spndx
+            jemdoc = JembatanDoc()
+            jemdoc.create_view(constants.SPANDEX_URI_VIEW, content_string=uri, content_mime="text/uri")
+            yield jemdoc
 
 
 class UriToPlainTextAnalyzer:
@@ -39,8 +51,6 @@ class UriToPlainTextAnalyzer:
         uri_view = spndx.get_view(constants.SPANDEX_URI_VIEW)
 
         uri = uri_view.content_string
-        url = urllib.request.urlparse(uri)
-        fh = open(uri) if not url.scheme else urllib.request.urlopen(uri)
         tgt_view = spndx.get_or_create_view(self.tgt_viewname)
-        tgt_view.content_string = fh.read()
+        tgt_view.content_string = read_uri(uri)
         tgt_view.content_mime = "text/plain"
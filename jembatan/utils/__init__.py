@@ -16,6 +16,7 @@ class ViewCopier(AnalysisFunction):
     """
     Wraps copy_view function in an AnalysisFunction
     """
+    input_types = ()
 
     def __init__(self, src_viewname: str, tgt_viewname: str):
         self.src_viewname = src_viewname
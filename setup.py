@@ -9,6 +9,7 @@ setup(name='jembatan',
       packages=find_packages(),
       install_requires=[
           "bson",
+          "numpy",
           "spacy",
           "dataclasses-json",
           "typing_inspect"
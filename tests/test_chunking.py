@@ -0,0 +1,114 @@
+from jembatan.analyzers.simple import SimpleTokenizer
+from jembatan.ml.chunking import BioChunking, BioCodec, ChunkMetrics
+from jembatan.readers.textreader import text_to_jembatan_doc
+from jembatan.typesys.chunking import Entity
+from jembatan.typesys.segmentation import Token
+
+import numpy
+import pickle
+
+
+def label_chunking(scheme="BIO"):
+    def set_label(entity, outcome):
+        entity.label = outcome.split("-", 1)[1]
+    return BioChunking(Token, Entity, suffix_func=lambda e: f"-{e.label}", attrib_func=set_label,
+                       labels=["PER", "LOC"], scheme=scheme)
+
+
+def entity_doc(text, entities):
+    jemdoc = text_to_jembatan_doc(text)
+    SimpleTokenizer().process(jemdoc)
+    spndx = jemdoc.default_view
+    spndx.add_annotations(*[Entity(begin=text.index(t), end=text.index(t) + len(t), label=label)
+                            for t, label in entities])
+    return jemdoc
+
+
+def test_bio_codec_round_trip():
+    codec = BioCodec(["PER", ""], scheme="BILOU")
+    begins = numpy.array([0, 4, 8, 12, 16])
+    ends = numpy.array([3, 7, 11, 15, 19])
+    codes = codec.encode(begins, ends, numpy.array([0, 4, 8]), numpy.array([7, 15, 11]), numpy.array([0, 0, 1]))
+    assert [codec.outcomes[c] for c in codes] == ["B-PER", "L-PER", "U", "O", "O"]
+
+    starts, stops, labels = codec.decode(codes)
+    assert starts.tolist() == [0, 2]
+    assert stops.tolist() == [2, 3]
+    assert [codec.labels[label] for label in labels] == ["PER", ""]
+
+    # lenient decoding of ill-formed sequences and padding
+    codec = BioCodec(["PER", "LOC"])
+    codes = numpy.array([codec.code(o) for o in ["I-PER", "I-PER", "I-LOC", "B-LOC", "O", "I-PER"]] + [-1])
+    starts, stops, _ = codec.decode(codes)
+    assert list(zip(starts.tolist(), stops.tolist())) == [(0, 2), (2, 3), (3, 4), (5, 6)]
+
+
+def test_bio_chunking_views():
+    chunking = label_chunking()
+    doc1 = entity_doc("Ada Lovelace moved to London", [("Ada Lovelace", "PER"), ("London", "LOC")])
+    doc2 = entity_doc("Paris", [("Paris", "LOC")])
+    views = [doc1.default_view, doc2.default_view]
+
+    assert chunking.create_outcomes(views[0]) == ["B-PER", "I-PER", "O", "O", "B-LOC"]
+    codes, lengths = chunking.encode_batch(views)
+    assert codes.shape == (2, 5)
+    assert lengths.tolist() == [5, 1]
+    assert codes[1].tolist() == [chunking.codec.code("B-LOC"), -1, -1, -1, -1]
+
+    expected = [[(e.begin, e.end, e.label) for e in view.select(Entity)] for view in views]
+    predicted = [entity_doc("Ada Lovelace moved to London", []).default_view, entity_doc("Paris", []).default_view]
+    chunking.decode_batch(predicted, codes, lengths)
+    assert [[(e.begin, e.end, e.label) for e in view.select(Entity)] for view in predicted] == expected
+
+    # outcome strings decode the same way
+    view = doc1.default_view
+    assert [(e.begin, e.end) for e in chunking.decode(view, ["B-PER", "I-PER", "O", "O", "B-LOC"])] == \
+        [(0, 12), (22, 28)]
+
+    # create_chunks takes subchunks before outcomes, and defaults to all subchunks in the view
+    view = entity_doc("Ada Lovelace moved to London", []).default_view
+    tokens = view.select(Token)
+    assert [(e.begin, e.end) for e in chunking.create_chunks(view, tokens[:2], ["B-PER", "I-PER"])] == [(0, 12)]
+    chunking.create_chunks(view, outcomes=["O", "O", "O", "O", "B-LOC"])
+    assert [(e.begin, e.end, e.label) for e in view.select(Entity)] == [(0, 12, "PER"), (22, 28, "LOC")]
+
+
+def test_chunk_metrics():
+    text = "Ada Lovelace met Charles Babbage in London"
+    gold = entity_doc(text, [("Ada Lovelace", "PER"), ("Charles Babbage", "PER"), ("London", "LOC")])
+    pred = entity_doc(text, [("Ada Lovelace", "PER"), ("Babbage", "PER"), ("in", "LOC"), ("London", "PER")])
+    metrics = ChunkMetrics({"Entity": Entity}, label_func=lambda e: e.label)
+
+    results = metrics.evaluate(gold.default_view, pred.default_view)
+    assert results.results["strict"] == {"correct": 1, "incorrect": 2, "partial": 0, "missed": 0,
+                                         "spurious": 1, "possible": 3, "actual": 4}
+    assert results.results["exact"]["correct"] == 2
+    assert results.results["partial"]["partial"] == 1
+    assert results.results["ent_type"]["correct"] == 2
+    assert results.by_type["LOC"]["strict"]["incorrect"] == 1
+    assert results.by_type["LOC"]["strict"]["spurious"] == 1
+    assert results.scores("partial")["precision"] == 2.5 / 4
+
+    # results merge across documents as if they had been evaluated together
+    empty = entity_doc(text, [])
+    other = metrics.evaluate(gold.default_view, empty.default_view)
+    assert other.results["exact"]["missed"] == 3
+    merged = pickle.loads(pickle.dumps(results)) + other
+    assert merged.to_dict() == metrics.totals.to_dict()
+    assert merged.results["strict"]["possible"] == 6
+
+    # with nested gold chunks, a prediction is matched to the gold chunk with its boundaries before any other
+    # overlapping one
+    nested = entity_doc(text, [("Ada Lovelace met", "PER"), ("Lovelace", "LOC")])
+    pred = entity_doc(text, [("Lovelace", "PER")])
+    results = metrics.evaluate(nested.default_view, pred.default_view)
+    assert results.results["exact"]["correct"] == results.results["partial"]["correct"] == 1
+    assert results.results["strict"]["incorrect"] == 1
+    assert results.by_type["LOC"]["exact"]["correct"] == 1
+    assert results.by_type["PER"]["exact"]["missed"] == 1
+
+    assert metrics.find_overlap(range(1, 3), range(2, 4)) == range(2, 3)
+    assert not metrics.find_overlap(range(1, 3), range(3, 5))
+    # other iterables are intersected as sets of positions, as before
+    assert metrics.find_overlap((1, 2), (2, 3)) == {2}
+    assert metrics.find_overlap((1, 2), (3, 4)) == set()
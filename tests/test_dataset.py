@@ -0,0 +1,78 @@
+from jembatan.analyzers.simple import SimpleTokenizer
+from jembatan.ml.chunking import BioChunking
+from jembatan.ml.dataset import Dataset, DatasetExporter, PAD_ID, UNKNOWN_ID
+from jembatan.readers.textreader import text_to_jembatan_doc
+from jembatan.typesys.chunking import Entity
+from jembatan.typesys.segmentation import Sentence, Token
+
+import numpy
+import pytest
+
+
+def corpus(n):
+    for i in range(n):
+        text = "Ada met Bob . " * (i % 4 + 1) + "End"
+        jemdoc = text_to_jembatan_doc(text)
+        SimpleTokenizer().process(jemdoc)
+        spndx = jemdoc.default_view
+        sentence_begins = [0] + [j + 2 for j in range(len(text)) if text[j] == "."]
+        spndx.add_annotations(*[Sentence(begin=b, end=e)
+                                for b, e in zip(sentence_begins, sentence_begins[1:] + [len(text)])])
+        spndx.add_annotations(Entity(begin=0, end=3, label="PER"))
+        yield jemdoc
+
+
+def test_dataset_export(tmp_path):
+    chunking = BioChunking(Token, Entity, suffix_func=lambda e: f"-{e.label}")
+    docs = list(corpus(10))
+    exporter = DatasetExporter(tmp_path / "train.ds", chunking=chunking, shard_tokens=20)
+    assert exporter.export(docs) == 10
+    assert len(exporter.shards) > 1
+
+    dataset = Dataset(tmp_path / "train.ds")
+    assert len(dataset) == 10
+    assert dataset.lengths.tolist() == [len(doc.default_view.select(Token)) for doc in docs]
+    assert dataset.outcomes == ["O", "B-PER", "I-PER"]
+
+    example = dataset[5]
+    tokens = docs[5].default_view.select(Token)
+    assert isinstance(example.token_ids, numpy.memmap)
+    assert example.begins.tolist() == [t.begin for t in tokens]
+    assert example.labels.tolist() == [1] + [0] * (len(tokens) - 1)
+    # "Ada met Bob" sentences followed by "End"
+    assert example.sentence_starts.tolist() == [1, 0, 0, 1, 0, 0, 1]
+    assert example.token_ids[0] == dataset.vocabulary["Ada"]
+
+    # vocabularies can be fixed, e.g. to export a test set with the training vocabulary
+    exporter = DatasetExporter(tmp_path / "test.ds", vocabulary={"Ada": 2}, grow_vocabulary=False)
+    exporter.export(corpus(1))
+    test = Dataset(tmp_path / "test.ds")
+    assert test[0].labels is None
+    assert test[0].token_ids.tolist() == [2, UNKNOWN_ID, UNKNOWN_ID, UNKNOWN_ID]
+
+    # grown vocabularies continue after the largest given id, and reserved ids are rejected
+    exporter = DatasetExporter(tmp_path / "grown.ds", vocabulary={"Ada": 2, "met": 7})
+    assert exporter.token_ids(["Bob", "met", "End"]).tolist() == [8, 7, 9]
+    with pytest.raises(ValueError):
+        DatasetExporter(tmp_path / "reserved.ds", vocabulary={"Ada": UNKNOWN_ID})
+
+
+def test_dataset_batches(tmp_path):
+    DatasetExporter(tmp_path / "train.ds", shard_tokens=15).export(corpus(12))
+    dataset = Dataset(tmp_path / "train.ds")
+
+    batches = list(dataset.batches(batch_size=4, batch_tokens=24))
+    assert sorted(example.doc for batch in batches for example in batch) == list(range(12))
+    for batch in batches:
+        lengths = [len(example) for example in batch]
+        assert len(batch) <= 4
+        assert max(lengths) * len(batch) <= 24
+        assert max(lengths) - min(lengths) <= 3
+
+    shuffled = [[e.doc for e in batch] for batch in dataset.batches(batch_size=4, shuffle=True, seed=1)]
+    assert sorted(doc for batch in shuffled for doc in batch) == list(range(12))
+    assert shuffled == [[e.doc for e in batch] for batch in dataset.batches(batch_size=4, shuffle=True, seed=1)]
+
+    padded = Dataset.pad(batches[-1])
+    assert padded.shape == (len(batches[-1]), max(len(e) for e in batches[-1]))
+    assert (padded[:, -1] != PAD_ID).any()
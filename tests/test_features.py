@@ -0,0 +1,80 @@
+from jembatan.analyzers.simple import SimpleTokenizer
+from jembatan.ml.features import CoveringFeature, FeatureMatrix, Featurizer, FieldFeature, TEXT, TokenLayer
+from jembatan.readers.textreader import text_to_jembatan_doc
+from jembatan.typesys.chunking import Entity
+from jembatan.typesys.segmentation import Sentence, Token
+
+import numpy
+
+
+def featurized_doc(text, entities=()):
+    jemdoc = text_to_jembatan_doc(text)
+    SimpleTokenizer().process(jemdoc)
+    spndx = jemdoc.default_view
+    end = text.index(".") + 1
+    spndx.add_annotations(Sentence(begin=0, end=end), Sentence(begin=end + 1, end=len(text)))
+    spndx.add_annotations(*[Entity(begin=text.index(t), end=text.index(t) + len(t), label=label)
+                            for t, label in entities])
+    return spndx
+
+
+def row_features(matrix, row):
+    return set(matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]].tolist())
+
+
+def test_featurizer_rows():
+    spndx = featurized_doc("Ada Lovelace wrote . Babbage built", [("Ada Lovelace", "PER"), ("Babbage", "PER")])
+    tokens = spndx.select(Token)
+    featurizer = Featurizer(Token, [FieldFeature(TEXT, (-1, 0, 1), str.lower), CoveringFeature(Entity, "label")],
+                            n_features=1 << 18, window_type=Sentence)
+    matrix = featurizer.transform(spndx)
+
+    # three context features per token, one entity feature per covered token; "." is not a token
+    assert matrix.shape == (len(tokens), 1 << 18)
+    assert numpy.diff(matrix.indptr).tolist() == [4, 4, 3, 4, 3]
+    assert matrix.indices.max() < 1 << 18
+
+    # the same context gives the same features, across views and featurizer instances
+    other = featurized_doc("Ada Lovelace ran . Babbage built", [("Ada Lovelace", "PER"), ("Babbage", "PER")])
+    other_matrix = Featurizer(Token, featurizer.templates, n_features=1 << 18, window_type=Sentence).transform(other)
+    assert row_features(matrix, 0) == row_features(other_matrix, 0)
+    assert row_features(matrix, 1) != row_features(other_matrix, 1)
+    assert row_features(matrix, 4) == row_features(other_matrix, 4)
+
+    # context does not cross sentences, "babbage" starts a sentence as "ada" does
+    assert len(row_features(matrix, 0) & row_features(matrix, 3)) == 1
+
+
+def test_featurizer_tokens_between_windows():
+    text = "Ada wrote . gap words . Babbage built"
+    jemdoc = text_to_jembatan_doc(text)
+    SimpleTokenizer().process(jemdoc)
+    spndx = jemdoc.default_view
+    spndx.add_annotations(Sentence(begin=0, end=11), Sentence(begin=text.index("Babbage"), end=len(text)))
+
+    layer = TokenLayer(spndx, spndx.select(Token), Sentence)
+    assert layer.window_ids.tolist() == [0, 0, -1, -1, 1, 1]
+
+    # tokens outside any window get no context from their neighbours, only window markers
+    featurizer = Featurizer(Token, [FieldFeature(TEXT, (-1, 1))], n_features=1 << 18, window_type=Sentence)
+    matrix = featurizer.transform(spndx)
+    outside = row_features(matrix, 2)
+    assert outside == row_features(matrix, 3)
+    assert len(outside & row_features(matrix, 0)) == len(outside & row_features(matrix, 5)) == 1
+
+
+def test_featurizer_batch():
+    featurizer = Featurizer(Token, [FieldFeature(TEXT), FieldFeature("pos"), CoveringFeature(Sentence)])
+    spndxs = [featurized_doc("One two . Three"), featurized_doc("Four . Five six seven")]
+    batch = featurizer.transform_batch(spndxs)
+
+    assert batch.doc_offsets.tolist() == [0, 3, 7]
+    # tokens have no pos, so only text and sentence position features
+    assert batch.indptr[-1] == 2 * 7
+    for i, spndx in enumerate(spndxs):
+        single = featurizer.transform(spndx)
+        rows = batch.rows(i)
+        assert rows.shape == single.shape
+        assert rows.indptr.tolist() == single.indptr.tolist()
+        assert rows.indices.tolist() == single.indices.tolist()
+    assert FeatureMatrix.concatenate([], 8).shape == (0, 8)
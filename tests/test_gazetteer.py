@@ -0,0 +1,46 @@
+from jembatan.analyzers.gazetteer import GazetteerAnnotator, GazetteerAutomaton
+from jembatan.analyzers.simple import SimpleTokenizer
+from jembatan.readers.textreader import text_to_jembatan_doc
+from jembatan.typesys.namedentity import NamedEntity
+from jembatan.typesys.segmentation import Token
+
+import re
+
+
+def test_automaton_finds_all_occurrences():
+    terms = ["he", "she", "his", "hers", "ushers", "éa"]
+    automaton = GazetteerAutomaton.build(terms)
+    text = "ushers saw his éa; she hers"
+
+    expected = sorted((m.start(), m.start() + len(term), i)
+                      for i, term in enumerate(terms) for m in re.finditer(f"(?={re.escape(term)})", text))
+    assert sorted(automaton.find(text)) == expected
+    assert automaton.find(text, 7, 14) == [(11, 14, 2)]
+
+
+def test_automaton_save_load(tmp_path):
+    automaton = GazetteerAutomaton.build({"Aspirin": "D001", "ibuprofen": "D002"}, case_fold=True)
+    automaton.save(tmp_path / "drugs.gaz")
+
+    loaded = GazetteerAutomaton.load(tmp_path / "drugs.gaz")
+    assert loaded.case_fold
+    assert loaded.states == automaton.states
+    matches = loaded.find("Take ASPIRIN or Ibuprofen.")
+    assert [(b, e, loaded.identifier(i)) for b, e, i in matches] == [(5, 12, "D001"), (16, 25, "D002")]
+
+
+def test_gazetteer_annotator():
+    automaton = GazetteerAutomaton.build([("new york", "NY"), ("york", "YK"), ("new york city", "NYC"), ("ark", "AR")],
+                                         case_fold=True)
+    text = "New York City is not York; Newark is not New York."
+    jemdoc = text_to_jembatan_doc(text)
+    SimpleTokenizer().process(jemdoc)
+
+    GazetteerAnnotator(automaton, value="LOC", token_type=Token).process(jemdoc)
+    entities = jemdoc.default_view.select(NamedEntity)
+    assert [(text[e.begin:e.end], e.identifier, e.value) for e in entities] == [
+        ("New York City", "NYC", "LOC"), ("York", "YK", "LOC"), ("New York", "NY", "LOC")]
+
+    jemdoc = text_to_jembatan_doc(text)
+    GazetteerAnnotator(automaton, longest_match=False).process(jemdoc)
+    assert [e.identifier for e in jemdoc.default_view.select(NamedEntity)].count("AR") == 1
@@ -0,0 +1,301 @@
+from jembatan.analyzers.simple import RegexMatchAnnotator
+from jembatan.pipeline import SimplePipeline
+from jembatan.pipeline.cache import CachedAnalysisFunction, StageResultStore
+from jembatan.pipeline.metrics import PipelineProfiler
+from jembatan.readers.textreader import text_to_jembatan_doc
+from jembatan.typesys.segmentation import Sentence, Token
+
+import json
+import re
+import time
+
+
+class CountingTokenizer(RegexMatchAnnotator):
+
+    def __init__(self):
+        super().__init__(re.compile(r'\w+'), Token)
+        self._calls = 0
+
+    @property
+    def calls(self):
+        return self._calls
+
+    def process(self, jemdoc, **kwargs):
+        self._calls += 1
+        super().process(jemdoc, **kwargs)
+
+
+def test_cached_analysis_function(tmp_path):
+    texts = ["This has four words", "And this one has five", "This has four words"]
+
+    tokenizer = CountingTokenizer()
+    store = StageResultStore(tmp_path / "cache")
+    cached_tokenizer = CachedAnalysisFunction(tokenizer, store, input_types=[])
+
+    first_run = list(SimplePipeline.iterate([text_to_jembatan_doc(t) for t in texts], [cached_tokenizer]))
+    assert tokenizer.calls == 2
+    assert store.stats["hits"] == 1
+    assert store.stats["misses"] == 2
+
+    # a fresh store over the same directory replays everything from disk
+    store = StageResultStore(tmp_path / "cache")
+    cached_tokenizer = CachedAnalysisFunction(tokenizer, store, input_types=[])
+    second_run = list(SimplePipeline.iterate([text_to_jembatan_doc(t) for t in texts], [cached_tokenizer]))
+    assert tokenizer.calls == 2
+    assert store.stats["hits"] == 3
+
+    for jemdoc_in, jemdoc_out in zip(first_run, second_run):
+        tokens_in = jemdoc_in.default_view.select(Token)
+        tokens_out = jemdoc_out.default_view.select(Token)
+        assert [t.span for t in tokens_in] == [t.span for t in tokens_out]
+        assert {t.id for t in tokens_in}.isdisjoint({t.id for t in tokens_out})
+
+
+def test_cached_analysis_function_keys_on_inputs(tmp_path):
+    store = StageResultStore(tmp_path / "cache")
+    tokenizer = CachedAnalysisFunction(
+        RegexMatchAnnotator(re.compile(r'\w+'), Token, window_type=Sentence), store, input_types=[Sentence])
+
+    jemdoc1 = text_to_jembatan_doc("One two. Three four.")
+    jemdoc1.default_view.add_annotations(Sentence(begin=0, end=8))
+    tokenizer.process(jemdoc1)
+
+    jemdoc2 = text_to_jembatan_doc("One two. Three four.")
+    jemdoc2.default_view.add_annotations(Sentence(begin=0, end=8), Sentence(begin=9, end=20))
+    tokenizer.process(jemdoc2)
+
+    assert store.stats["misses"] == 2
+    assert len(jemdoc1.default_view.select(Token)) == 2
+    assert len(jemdoc2.default_view.select(Token)) == 4
+
+
+def test_stage_result_store_eviction(tmp_path):
+    store = StageResultStore(tmp_path / "cache", max_bytes=100, max_memory_entries=2)
+    for i in range(10):
+        store.put(f"key{i}", {"payload": "x" * 40})
+
+    assert store.stats["evictions"] > 0
+    assert store.stats["disk_bytes"] <= 100
+    assert store.stats["memory_entries"] <= 2
+    assert store.get("key9") is not None
+    assert store.get("key0") is None
+
+
+def test_pipeline_profiler(tmp_path):
+    from jembatan.analyzers.simple import SimpleSentenceSegmenter, SimpleTokenizer
+
+    texts = ["This is sentence 1.  This is sentence 2.", "One more sentence."]
+    stages = [SimpleSentenceSegmenter(), SimpleTokenizer()]
+    profiler = PipelineProfiler(profile_slowest=True, profile_after=1)
+
+    SimplePipeline.run([text_to_jembatan_doc(t) for t in texts], stages, profiler=profiler)
+
+    assert profiler.documents == 2
+    segmenter_metrics, tokenizer_metrics = profiler.stages
+    assert segmenter_metrics.name == "SimpleSentenceSegmenter"
+    assert segmenter_metrics.annotations_added == {"Sentence": 3}
+    assert tokenizer_metrics.annotations_added == {"Token": 11}
+    assert tokenizer_metrics.characters == sum(len(t) for t in texts)
+    assert tokenizer_metrics.wall_time > 0
+    assert profiler.profiled_stage is not None
+    assert profiler.profile_stats() is not None
+
+    report = json.loads(profiler.to_json())
+    assert report["documents"] == 2
+    assert [s["name"] for s in report["stages"]] == ["SimpleSentenceSegmenter", "SimpleTokenizer"]
+
+    prom_path = tmp_path / "metrics.prom"
+    profiler.write_prometheus(prom_path)
+    prom_text = prom_path.read_text()
+    assert '# TYPE jembatan_stage_wall_seconds_total counter' in prom_text
+    assert 'jembatan_stage_annotations_added_total{index="1",stage="SimpleTokenizer",type="Token"} 11' in prom_text
+
+
+def test_pipeline_profiler_retained_memory():
+    class RetainingStage:
+        def process(self, jemdoc):
+            jemdoc.metadata = {"payload": bytearray(1 << 20)}
+
+    class ScratchStage:
+        def process(self, jemdoc):
+            scratch = bytearray(1 << 20)
+            del scratch
+
+    jemdocs = [text_to_jembatan_doc("Some text.") for _ in range(3)]
+    profiler = PipelineProfiler(count_annotations=False, trace_memory=True)
+    try:
+        SimplePipeline.run(jemdocs, [RetainingStage(), ScratchStage()], profiler=profiler)
+    finally:
+        profiler.stop_memory_tracing()
+
+    retaining_metrics, scratch_metrics = profiler.stages
+    assert retaining_metrics.retained_bytes_per_document >= 1 << 20
+    assert scratch_metrics.retained_bytes_per_document < 1 << 16
+
+
+def test_tracer(tmp_path):
+    from jembatan.analyzers.simple import SimpleSentenceSegmenter, SimpleTokenizer
+    from jembatan.core.af import AggregateAnalysisFunction
+    from jembatan.core.trace import Tracer, get_tracer
+
+    texts = ["This is sentence 1.  This is sentence 2.", "One more sentence."]
+    aggregate = AggregateAnalysisFunction()
+    aggregate.add(SimpleTokenizer().regex_annotator)
+
+    with Tracer() as tracer:
+        SimplePipeline.run([text_to_jembatan_doc(t) for t in texts], [SimpleSentenceSegmenter(), aggregate])
+    assert not get_tracer().enabled
+
+    events = [e for e in tracer.events if e["ph"] == "X"]
+    stage_events = [e for e in events if e["cat"] == "stage"]
+    assert [(e["name"], e["args"]["document"]) for e in stage_events] == [
+        ("SimpleSentenceSegmenter", 0), ("AggregateAnalysisFunction", 0),
+        ("SimpleSentenceSegmenter", 1), ("AggregateAnalysisFunction", 1),
+    ]
+    assert len([e for e in events if e["cat"] == "analysis_function"]) == 2
+    assert len([e for e in events if e["name"] == "regex.match"]) == 4
+    assert len([e for e in events if e["name"] == "read"]) == 3
+
+    trace_path = tmp_path / "trace.json"
+    tracer.to_json(trace_path)
+    trace = json.loads(trace_path.read_text())
+    assert all("ts" in e for e in trace["traceEvents"] if e["ph"] == "X")
+
+
+def test_liveness_pruning():
+    from jembatan.analyzers.simple import RegexSplitAnnotator, SimpleTokenizer
+    from jembatan.pipeline.liveness import LivenessPlan, OutputSchema
+    from jembatan.typesys.segmentation import Paragraph
+
+    paragraph_splitter = RegexSplitAnnotator(re.compile(r'\n\n'), Paragraph)
+    sentence_segmenter = RegexMatchAnnotator(re.compile(r'[^\s\.][^\.]+'), Sentence, window_type=Paragraph)
+    stages = [paragraph_splitter, sentence_segmenter, SimpleTokenizer()]
+
+    schema = OutputSchema.default_view(Sentence)
+    plan = LivenessPlan(stages, schema)
+    assert plan.live_after == [(Paragraph,), (), ()]
+
+    pruned_stages = []
+    texts = ["First sentence. Second one.\n\nNew paragraph here."]
+    for _, path, jemdoc in SimplePipeline.iterate_by_stage(
+            [text_to_jembatan_doc(t) for t in texts], stages, output_schema=schema):
+        pruned_stages.append({a.__class__.__name__ for a in jemdoc.default_view.annotations})
+
+    assert pruned_stages == [{"Paragraph"}, {"Sentence"}, {"Sentence"}]
+    assert len(jemdoc.default_view.select(Sentence)) == 3
+
+    # stages without declared inputs keep everything alive until they run
+    plan = LivenessPlan([paragraph_splitter, lambda jemdoc: None, SimpleTokenizer()], schema)
+    assert plan.live_after == [None, (), ()]
+
+
+class SlowStage:
+    """
+    Stage that sleeps on documents containing the word 'slow'
+    """
+    input_types = ()
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def process(self, jemdoc):
+        if "slow" in jemdoc.default_view.content_string:
+            time.sleep(self.seconds)
+
+
+def test_time_budget_slow_lane():
+    from jembatan.analyzers.simple import SimpleTokenizer
+    from jembatan.pipeline.deadlines import TimeBudget
+
+    texts = ["fast document", "slow document", "another fast one"]
+    stages = [SlowStage(5.0), SimpleTokenizer()]
+    budget = TimeBudget(stage=0.1)
+    profiler = PipelineProfiler()
+
+    start = time.perf_counter()
+    processed = list(SimplePipeline.iterate([text_to_jembatan_doc(t) for t in texts], stages,
+                                            profiler=profiler, budget=budget))
+    assert time.perf_counter() - start < 2.0
+
+    assert [jemdoc.default_view.content_string for jemdoc in processed] == ["fast document", "another fast one"]
+    assert len(budget.slow_lane) == 1
+    entry = budget.slow_lane[0]
+    assert (entry.document_index, entry.stage_index) == (1, 0)
+
+    latency = profiler.stages[0].latency_percentiles()
+    assert latency["p50"] < 0.1 <= latency["p99"]
+
+    # finish the slow document without a budget, starting at the stage that timed out
+    stages[0].seconds = 0.0
+    resumed = list(SimplePipeline.resume(budget.slow_lane, stages))
+    assert len(resumed[0].default_view.select(Token)) == 2
+
+
+class TokenizeThenStall(SlowStage):
+    """
+    Stage that adds tokens and a view before stalling on 'slow' documents
+    """
+
+    def process(self, jemdoc):
+        spndx = jemdoc.default_view
+        spndx.add_annotations(*[Token(begin=m.start(), end=m.end()) for m in re.finditer(r"\w+", spndx.content_string)])
+        jemdoc.create_view("stalled")
+        super().process(jemdoc)
+
+
+def test_time_budget_rolls_back_cancelled_stage():
+    from jembatan.pipeline.deadlines import TimeBudget
+
+    budget = TimeBudget(stage=0.1)
+    stages = [TokenizeThenStall(5.0)]
+    processed = list(SimplePipeline.iterate([text_to_jembatan_doc(t) for t in ["fast one", "slow one"]], stages,
+                                            budget=budget))
+    assert len(processed[0].default_view.select(Token)) == 2
+
+    # annotations and views added before the stage was cancelled are dropped, so resuming adds them once
+    jemdoc = budget.slow_lane[0].jemdoc
+    assert not jemdoc.default_view.select(Token)
+    assert list(jemdoc.views) == [processed[0].default_view.viewname]
+    stages[0].seconds = 0.0
+    resumed = list(SimplePipeline.resume(budget.slow_lane, stages, budget=TimeBudget(stage=1.0)))
+    assert len(resumed[0].default_view.select(Token)) == 2
+
+
+def test_time_budget_skips_snapshots_off_main_thread(monkeypatch):
+    import threading
+    import jembatan.pipeline
+    from jembatan.pipeline.deadlines import TimeBudget
+
+    snapshots = []
+    monkeypatch.setattr(jembatan.pipeline, "snapshot_document", lambda jemdoc: snapshots.append(jemdoc))
+
+    # stages can not be interrupted outside the main thread, so there is nothing to roll back
+    def run():
+        list(SimplePipeline.iterate([text_to_jembatan_doc("fast one")], [TokenizeThenStall(0.0)],
+                                    budget=TimeBudget(stage=1.0)))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert snapshots == []
+    run()
+    assert len(snapshots) == 1
+
+
+def test_time_budget_partial():
+    from jembatan.analyzers.simple import SimpleTokenizer
+    from jembatan.pipeline.deadlines import PARTIAL_METADATA_KEY, TimeBudget
+
+    texts = ["fast document", "slow document"]
+    budget = TimeBudget(document=0.1, on_timeout=TimeBudget.PARTIAL, interrupt=False)
+    profiler = PipelineProfiler()
+    processed = list(SimplePipeline.iterate([text_to_jembatan_doc(t) for t in texts],
+                                            [SlowStage(0.2), SimpleTokenizer()], profiler=profiler, budget=budget))
+
+    assert len(processed) == 2
+    assert processed[0].metadata is None
+    assert processed[1].metadata[PARTIAL_METADATA_KEY]["stage_index"] == 1
+    assert not processed[1].default_view.select(Token)
+    assert [(t.document_index, t.stage_index) for t in budget.timeouts] == [(1, 1)]
+    assert profiler.stages[1].documents == 1
+    assert "p95" in json.loads(profiler.to_json())["stages"][0]["latency"]
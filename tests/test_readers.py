@@ -0,0 +1,166 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from jembatan.core.spandex import constants as jemconst
+from jembatan.readers.errors import FetchError
+from jembatan.readers.filereader import FileJemdocCollection, read_text
+from jembatan.readers.httpreader import AsyncHttpFetcher, AsyncUriJemdocCollection
+from jembatan.readers.textreader import TextJemdocCollection
+from jembatan.readers.urireader import UriSpandexCollection, UriToPlainTextAnalyzer
+
+import pytest
+import threading
+
+
+def test_text_collections():
+    jemdocs = list(TextJemdocCollection(["one", "two"]))
+    assert [jemdoc.default_view.content_string for jemdoc in jemdocs] == ["one", "two"]
+
+    jemdocs = list(UriSpandexCollection(["http://example.com/a"]))
+    assert jemdocs[0].get_view(jemconst.SPANDEX_URI_VIEW).content_string == "http://example.com/a"
+
+
+def test_file_collection(tmp_path):
+    texts = {}
+    for i in range(20):
+        path = tmp_path / ("sub" if i % 2 else "") / f"doc{i:02d}.txt"
+        path.parent.mkdir(exist_ok=True)
+        texts[str(path)] = f"document {i} é " * (i * 50)
+        path.write_text(texts[str(path)], encoding="utf-8")
+    (tmp_path / "skip.md").write_text("not matched")
+
+    expected = sorted(texts)
+    collection = FileJemdocCollection(str(tmp_path / "**" / "*.txt"), n_threads=4, read_ahead=3, mmap_threshold=512)
+    jemdocs = list(collection)
+    assert [jemdoc.metadata["path"] for jemdoc in jemdocs] == expected
+    for jemdoc in jemdocs:
+        path = jemdoc.metadata["path"]
+        assert jemdoc.default_view.content_string == texts[path]
+        assert jemdoc.metadata["size"] == len(texts[path].encode("utf-8"))
+        assert jemdoc.metadata["mtime"] > 0
+
+    # directories expand to the files below them, and reading can stop early
+    paths = [jemdoc.metadata["path"] for jemdoc in FileJemdocCollection(tmp_path / "sub", n_threads=1)]
+    assert paths == sorted(p for p in expected if "/sub/" in p)
+    first = next(iter(FileJemdocCollection([tmp_path], read_ahead=2)))
+    assert first.metadata["path"] == str(tmp_path / "doc00.txt")
+    assert read_text(tmp_path / "doc00.txt", mmap_threshold=0) == ""
+
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive server stand-in: /doc/<n> serves a document, /chunked/<n> serves it with chunked transfer
+    encoding, /flaky/<n> fails once before serving it, /moved/<n> redirects to /doc/<n>, /early/<n> serves it
+    after a 103 interim response and /empty/<n> responds 204 without a body
+    """
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    failed = set()
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            DocumentHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_text(self, text, chunked=False):
+        body = text.encode("latin-1")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=iso-8859-1")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 7):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(body[i:i + 7]), body[i:i + 7]))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_GET(self):
+        _, kind, n = self.path.split("/")
+        if kind == "flaky":
+            with self.lock:
+                first = self.path not in self.failed
+                self.failed.add(self.path)
+            if first:
+                self.send_error(503)
+                return
+        if kind == "moved":
+            self.send_response(302)
+            self.send_header("Location", f"/doc/{n}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif kind == "missing":
+            self.send_error(404)
+        elif kind == "empty":
+            self.send_response(204)
+            self.end_headers()
+        else:
+            if kind == "early":
+                self.send_response_only(103)
+                self.send_header("Link", "</style.css>; rel=preload")
+                self.end_headers()
+            self.send_text(f"document {n} café " * int(n), chunked=kind == "chunked")
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DocumentHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_uri_collection(http_server, tmp_path):
+    DocumentHandler.connections = 0
+    kinds = ["doc", "chunked", "flaky", "moved"]
+    uris = [f"{http_server}/{kinds[i % 4]}/{i}" for i in range(40)]
+    local = tmp_path / "local.txt"
+    local.write_text("local text")
+
+    fetcher = AsyncHttpFetcher(per_host=4, backoff=0.01)
+    jemdocs = list(AsyncUriJemdocCollection(uris + [str(local)], fetcher=fetcher, read_ahead=16))
+    assert [jemdoc.metadata["uri"] for jemdoc in jemdocs] == uris + [str(local)]
+    for i, jemdoc in enumerate(jemdocs[:-1]):
+        assert jemdoc.default_view.content_string == f"document {i} café " * i
+        assert jemdoc.get_view(jemconst.SPANDEX_URI_VIEW).content_string == uris[i]
+    assert jemdocs[3].metadata["final_uri"] == f"{http_server}/doc/3"
+    assert jemdocs[-1].default_view.content_string == "local text"
+    # keep-alive connections are reused, error responses close theirs
+    assert fetcher.connections_opened <= 4 + 10
+    assert DocumentHandler.connections == fetcher.connections_opened
+
+    with pytest.raises(FetchError) as e:
+        list(AsyncUriJemdocCollection([f"{http_server}/missing/1"]))
+    assert e.value.status == 404
+    jemdocs = list(AsyncUriJemdocCollection([f"{http_server}/missing/1"], raise_errors=False))
+    assert "404" in jemdocs[0].metadata["error"]
+
+    # local files that do not decode are reported the same way
+    invalid = tmp_path / "invalid.txt"
+    invalid.write_bytes(b"caf\xe9")
+    jemdocs = list(AsyncUriJemdocCollection([str(invalid), str(local)], raise_errors=False))
+    assert "utf-8" in jemdocs[0].metadata["error"]
+    assert jemdocs[1].default_view.content_string == "local text"
+
+
+def test_async_uri_collection_bodiless_responses(http_server):
+    # responses without a body must not be read until the connection closes, and keep it reusable
+    uris = [f"{http_server}/empty/1", f"{http_server}/early/2", f"{http_server}/empty/3", f"{http_server}/doc/1"]
+    fetcher = AsyncHttpFetcher(per_host=1, retries=0, timeout=2.0)
+    jemdocs = list(AsyncUriJemdocCollection(uris, fetcher=fetcher))
+    assert [jemdoc.metadata["status"] for jemdoc in jemdocs] == [204, 200, 204, 200]
+    assert [jemdoc.default_view.content_string for jemdoc in jemdocs] == \
+        ["", "document 2 café document 2 café ", "", "document 1 café "]
+    assert fetcher.connections_opened == 1
+
+
+def test_uri_to_plain_text(http_server):
+    jemdoc = next(iter(UriSpandexCollection([f"{http_server}/doc/2"])))
+    UriToPlainTextAnalyzer().process(jemdoc)
+    assert jemdoc.default_view.content_string == "document 2 café document 2 café "
@@ -27,3 +27,100 @@ def test_simple_sentence_segmenter():
     segmenter.process(jemdoc)
     sentences = spndx.select(Sentence)
     assert len(list(sentences)) == 3
+
+
+def test_regex_match_parallel_windows():
+    import re
+    from jembatan.typesys.segmentation import Paragraph
+
+    def run(text, separator, pattern, n_workers):
+        jemdoc = text_to_jembatan_doc(text)
+        simple.RegexSplitAnnotator(re.compile(separator), Paragraph).process(jemdoc)
+        with simple.RegexMatchAnnotator(re.compile(pattern), Token, window_type=Paragraph,
+                                        n_workers=n_workers) as annotator:
+            annotator.PARALLEL_MIN_CHARS = 0
+            annotator.process(jemdoc)
+        assert annotator._executor is None
+        return [(t.begin, t.end) for t in jemdoc.default_view.select(Token)]
+
+    text = "\n\n".join(f"Paragraph {i} has a handful of words in it." for i in range(200))
+    serial = run(text, r'\n\n', r'\w+', 1)
+    assert len(serial) == 200 * 9
+    assert run(text, r'\n\n', r'\w+', 3) == serial
+
+    # windows are scanned in place, so anchors and lookbehinds see the text around them in workers too
+    text = "||".join(f"w{i} x{i}" for i in range(50))
+    for pattern in (r'^\w+|(?<!\|)\b\w', r'(?<=\|\|)\w+', r'(?m)^\w|\bx'):
+        serial = run(text, r'\|\|', pattern, 1)
+        assert run(text, r'\|\|', pattern, 2) == serial
+    assert len(run(text, r'\|\|', r'^\w+|(?<!\|)\b\w', 1)) == 51
+
+    # pipelines shut the workers down once the collection is processed
+    from jembatan.pipeline import SimplePipeline
+    annotator = simple.RegexMatchAnnotator(re.compile(r'\w+'), Token, window_type=Paragraph, n_workers=2)
+    annotator.PARALLEL_MIN_CHARS = 0
+    stages = [simple.RegexSplitAnnotator(re.compile(r'\|\|'), Paragraph), annotator]
+    SimplePipeline.run([text_to_jembatan_doc(text)], stages)
+    assert annotator._executor is None
+
+
+def test_multi_regex_match():
+    import re
+    from jembatan.typesys.segmentation import Paragraph
+    from jembatan.typesys.chunking import NounChunk
+
+    text = "Call 555-1234 or email bob@example.com.  BOB answers at 555-9876."
+    patterns = {
+        re.compile(r'\d{3}-\d{4}'): Paragraph,
+        re.compile(r'bob', re.IGNORECASE): NounChunk,
+    }
+
+    def spans(jemdoc, annotation_type):
+        return [(a.begin, a.end) for a in jemdoc.default_view.select(annotation_type)]
+
+    separate = text_to_jembatan_doc(text)
+    for pattern, annotation_type in patterns.items():
+        simple.RegexMatchAnnotator(pattern, annotation_type).process(separate)
+
+    for allow_overlaps in (False, True):
+        combined = text_to_jembatan_doc(text)
+        annotator = simple.MultiRegexMatchAnnotator(patterns, allow_overlaps=allow_overlaps)
+        annotator.process(combined)
+        assert (annotator.combined_re is None) == allow_overlaps
+        assert spans(combined, Paragraph) == spans(separate, Paragraph) == [(5, 13), (56, 64)]
+        assert spans(combined, NounChunk) == spans(separate, NounChunk) == [(23, 26), (41, 44)]
+
+    # overlapping matches of different patterns are only kept when scanning separately
+    overlapping = [(r'\w+@\w+', Paragraph), (r'example', NounChunk), (r'(\w)\1', Token)]
+    jemdoc = text_to_jembatan_doc(text)
+    annotator = simple.MultiRegexMatchAnnotator(overlapping)
+    assert len(annotator.separate) == 1
+    annotator.process(jemdoc)
+    assert spans(jemdoc, NounChunk) == []
+    assert spans(jemdoc, Token) == [(2, 4), (5, 7), (56, 58)]
+    jemdoc = text_to_jembatan_doc(text)
+    simple.MultiRegexMatchAnnotator(overlapping, allow_overlaps=True).process(jemdoc)
+    assert spans(jemdoc, NounChunk) == [(27, 34)]
+
+    # flags stay scoped to their own pattern in the combined scan
+    jemdoc = text_to_jembatan_doc("café Crème")
+    annotator = simple.MultiRegexMatchAnnotator([(re.compile(r'\w+', re.ASCII), Token), (r'è', NounChunk)])
+    assert annotator.combined_re is not None
+    annotator.process(jemdoc)
+    assert spans(jemdoc, Token) == [(0, 3), (5, 7), (8, 10)]
+    assert spans(jemdoc, NounChunk) == [(7, 8)]
+
+
+def test_regex_split_windows():
+    import re
+    from jembatan.typesys.segmentation import Paragraph
+
+    text = "One. Two.\n\nThree. Four\n\nFive"
+    jemdoc = text_to_jembatan_doc(text)
+    simple.RegexSplitAnnotator(re.compile(r'\n\n'), Paragraph).process(jemdoc)
+    simple.RegexSplitAnnotator(re.compile(r'(?<=\.) '), Sentence, window_type=Paragraph).process(jemdoc)
+
+    spndx = jemdoc.default_view
+    assert [spndx.spanned_text(p) for p in spndx.select(Paragraph)] == ["One. Two.", "Three. Four", "Five"]
+    # sentences never run past the end of their paragraph
+    assert [spndx.spanned_text(s) for s in spndx.select(Sentence)] == ["One.", "Two.", "Three.", "Four", "Five"]
@@ -123,3 +123,314 @@ def test_spacy_json_serialization(spacy_pipeline):
 
     parses = spndx_out.select(jemtypes.syntax.DependencyParse)
     compare_dep_annotations(spndx_out, parses[0], expected_graph, expected_pos_tags, expected_lemmas)
+
+
+def annotation_summary(spndx):
+    return [(a.__class__.__name__, a.begin, a.end, getattr(a, 'pos', None), getattr(a, 'label', None))
+            for a in spndx.annotations]
+
+
+def test_spacy_batch_processing(spacy_pipeline):
+    texts = [
+        "John gave the ball to Mary.",
+        "Education is all a matter of building bridges.  When one burns one's bridges, what a very nice fire.",
+        "Short one."
+    ]
+
+    spacy_analyzer = jemspacy.SpacyAnalyzer(spacy_pipeline=spacy_pipeline, batch_size=2)
+
+    single_jemdocs = [text_to_jembatan_doc(text) for text in texts]
+    for jemdoc in single_jemdocs:
+        spacy_analyzer.process(jemdoc)
+
+    batch_jemdocs = [text_to_jembatan_doc(text) for text in texts]
+    spacy_analyzer.process_batch(batch_jemdocs)
+
+    for single, batched in zip(single_jemdocs, batch_jemdocs):
+        assert annotation_summary(single.default_view) == annotation_summary(batched.default_view)
+
+
+def test_spacy_windowed_processing(spacy_pipeline):
+    from jembatan.analyzers.simple import RegexSplitAnnotator
+    from jembatan.core.spandex import Span
+    from jembatan.typesys.segmentation import Paragraph
+    import re
+
+    text = "John gave the ball to Mary.\n\nA much longer paragraph follows here.  It has two sentences."
+    jemdoc = text_to_jembatan_doc(text)
+    RegexSplitAnnotator(re.compile(r'\n\n'), Paragraph).process(jemdoc)
+
+    spacy_analyzer = jemspacy.SpacyAnalyzer(spacy_pipeline=spacy_pipeline, window_type=Paragraph, batch_size=1)
+    spacy_analyzer.process(jemdoc)
+
+    spndx = jemdoc.default_view
+    paragraphs = spndx.select(Paragraph)
+    assert len(paragraphs) == 2
+    for paragraph in paragraphs:
+        spacy_doc = spacy_pipeline(spndx.spanned_text(paragraph))
+        tokens = spndx.select_covered(jemtypes.segmentation.Token, paragraph)
+        expected = [(paragraph.begin + t.idx, paragraph.begin + t.idx + len(t)) for t in spacy_doc if not t.is_space]
+        assert [(t.begin, t.end) for t in tokens] == expected
+
+    sentences = spndx.select(jemtypes.segmentation.Sentence)
+    assert len(sentences) == 3
+    assert spndx.spanned_text(Span(sentences[0].begin, sentences[0].end)) == "John gave the ball to Mary."
+
+    # one parse per sentence, each rooted within its sentence
+    parses = spndx.select(jemtypes.syntax.DependencyParse)
+    assert [(p.begin, p.end) for p in parses] == [(s.begin, s.end) for s in sentences]
+    for parse in parses:
+        assert parse.root is not None
+        assert parse.begin <= parse.root.begin < parse.end
+
+
+def test_spacy_array_conversion_lemmas():
+    import spacy
+
+    # without a lemmatizer or tagger the LEMMA column is unset, lemmas must still match the object path
+    nlp = spacy.blank("en")
+    nlp.add_pipe(nlp.create_pipe("sentencizer"))
+    spacy_doc = nlp("The children were running home.")
+
+    layers = jemspacy.AnnotationLayers.SENTENCE | jemspacy.AnnotationLayers.TOKEN
+    from_arrays = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, annotation_layers=layers, use_arrays=True)
+    from_objects = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, annotation_layers=layers,
+                                                                 use_arrays=False)
+    lemmas = [t.lemma for t in from_arrays.select(jemtypes.segmentation.Token)]
+    assert lemmas == [t.lemma for t in from_objects.select(jemtypes.segmentation.Token)]
+    assert lemmas == [t.lemma_ for t in spacy_doc]
+    assert all(lemmas)
+
+
+def dependency_summary(spndx):
+    return [(e.label, e.head.begin, e.child.begin) for e in spndx.select(jemtypes.syntax.DependencyEdge)]
+
+
+def test_spacy_array_conversion(spacy_pipeline):
+    text = "Education is all a matter of building bridges.  When one burns one's bridges, what a very nice fire."
+    spacy_doc = spacy_pipeline(text)
+
+    from_arrays = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, use_arrays=True)
+    from_objects = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, use_arrays=False)
+
+    assert annotation_summary(from_arrays) == annotation_summary(from_objects)
+    assert dependency_summary(from_arrays) == dependency_summary(from_objects)
+    for token_a, token_o in zip(from_arrays.select(jemtypes.segmentation.Token),
+                                from_objects.select(jemtypes.segmentation.Token)):
+        assert (token_a.lemma, token_a.tag) == (token_o.lemma, token_o.tag)
+
+
+def test_spacy_layer_pipeline(spacy_pipeline):
+    layers = jemspacy.AnnotationLayers
+    spacy_analyzer = jemspacy.SpacyAnalyzer(spacy_pipeline=spacy_pipeline)
+
+    tokens_only = spacy_analyzer.layer_pipeline(layers.DOCUMENT | layers.SENTENCE | layers.TOKEN)
+    assert "parser" not in tokens_only.pipe_names
+    assert "ner" not in tokens_only.pipe_names
+    assert "tagger" in tokens_only.pipe_names
+    assert spacy_analyzer.layer_pipeline(layers.DOCUMENT | layers.SENTENCE | layers.TOKEN) is tokens_only
+    assert spacy_analyzer.layer_pipeline(layers.ALL()) is spacy_pipeline
+
+    text = "John gave the ball to Mary.  Education is all a matter of building bridges."
+    full = text_to_jembatan_doc(text)
+    spacy_analyzer.process(full)
+    partial = text_to_jembatan_doc(text)
+    spacy_analyzer.process(partial, annotation_layers=layers.DOCUMENT | layers.SENTENCE | layers.TOKEN)
+
+    def tokens(jemdoc):
+        return [(t.begin, t.end, t.pos, t.lemma) for t in jemdoc.default_view.select(jemtypes.segmentation.Token)]
+
+    assert tokens(partial) == tokens(full)
+    assert partial.default_view.select(jemtypes.segmentation.Sentence)
+    assert not partial.default_view.select(jemtypes.syntax.DependencyParse)
+    assert not partial.default_view.select(jemtypes.chunking.Entity)
+
+
+def test_model_registry_sharing():
+    from jembatan.analyzers.registry import ModelRegistry
+
+    loads = []
+
+    def loader(name, **config):
+        loads.append((name, config))
+        return object()
+
+    registry = ModelRegistry(loader=loader)
+    first = jemspacy.SpacyAnalyzer(model_name="model", registry=registry)
+    second = jemspacy.SpacyAnalyzer(model_name="model", registry=registry)
+    other = jemspacy.SpacyAnalyzer(model_name="model", model_config={"disable": ["ner"]}, registry=registry)
+
+    # models are loaded lazily and shared between analyzers with the same configuration
+    assert not loads
+    assert first.spacy_pipeline is second.spacy_pipeline
+    assert other.spacy_pipeline is not first.spacy_pipeline
+    assert loads == [("model", {}), ("model", {"disable": ["ner"]})]
+    assert registry.refcount("model") == 2
+
+    first.release_model()
+    assert registry.evict() == []
+    second.release_model()
+    assert registry.evict("model") == [ModelRegistry.key("model")]
+    assert registry.loaded() == {ModelRegistry.key("model", disable=["ner"]): 1}
+
+
+def test_spacy_cache_key_identifies_model():
+    import spacy
+    from jembatan.pipeline.cache import stage_fingerprint
+
+    english = stage_fingerprint(jemspacy.SpacyAnalyzer(spacy.blank("en")))
+    assert english == stage_fingerprint(jemspacy.SpacyAnalyzer(spacy.blank("en")))
+    assert english != stage_fingerprint(jemspacy.SpacyAnalyzer(spacy.blank("de")))
+
+    with_sentencizer = spacy.blank("en")
+    with_sentencizer.add_pipe(with_sentencizer.create_pipe("sentencizer"))
+    assert english != stage_fingerprint(jemspacy.SpacyAnalyzer(with_sentencizer))
+
+    # registry models are identified by name and configuration without loading them
+    analyzer = jemspacy.SpacyAnalyzer(model_name="model")
+    assert stage_fingerprint(analyzer) != stage_fingerprint(jemspacy.SpacyAnalyzer(model_name="other"))
+    assert analyzer._spacy_pipeline is None
+
+
+def test_spacy_existing_tokens(spacy_pipeline):
+    from jembatan.analyzers.simple import SimpleTokenizer
+
+    text = "John gave the ball  to Mary.\nEducation is all a matter of building bridges"
+    jemdoc = text_to_jembatan_doc(text)
+    SimpleTokenizer().process(jemdoc)
+    spndx = jemdoc.default_view
+    existing = spndx.select(jemtypes.segmentation.Token)
+
+    spacy_analyzer = jemspacy.SpacyAnalyzer(spacy_pipeline=spacy_pipeline, token_type=jemtypes.segmentation.Token)
+    spacy_analyzer.process(jemdoc)
+
+    tokens = spndx.select(jemtypes.segmentation.Token)
+    assert [id(t) for t in tokens] == [id(t) for t in existing]
+    assert all(t.lemma and t.pos for t in tokens)
+
+    sentences = spndx.select(jemtypes.segmentation.Sentence)
+    assert sentences and sentences[0].begin == 0 and sentences[-1].end == len(text)
+
+    token_spans = {(t.begin, t.end) for t in tokens}
+    for node in spndx.select(jemtypes.syntax.DependencyNode):
+        assert (node.begin, node.end) in token_spans
+
+
+def test_spacy_existing_tokens_multiprocess(tmp_path):
+    import pytest
+    import spacy
+    import re
+    from jembatan.analyzers.simple import RegexMatchAnnotator
+    from jembatan.pipeline.cache import CachedAnalysisFunction, StageResultStore
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe(nlp.create_pipe("sentencizer"))
+    layers = jemspacy.AnnotationLayers.SENTENCE | jemspacy.AnnotationLayers.TOKEN
+
+    results = []
+    for n_process in (1, 2):
+        jemdocs = [text_to_jembatan_doc(f"Document {i} is here .  It has two sentences !") for i in range(6)]
+        for jemdoc in jemdocs:
+            RegexMatchAnnotator(re.compile(r"\S+"), jemtypes.segmentation.Token).process(jemdoc)
+        analyzer = jemspacy.SpacyAnalyzer(nlp, token_type=jemtypes.segmentation.Token, n_process=n_process)
+        analyzer.process_batch(jemdocs, annotation_layers=layers)
+        results.append([[(s.begin, s.end) for s in jemdoc.default_view.select(jemtypes.segmentation.Sentence)]
+                        for jemdoc in jemdocs])
+    assert results[0] == results[1]
+    assert results[0][0] == [(0, 20), (22, 44)]
+    assert not isinstance(nlp.tokenizer, jemspacy.PretokenizedTokenizer)
+
+    # tagger output is merged onto existing tokens, which a cache can not replay
+    with pytest.raises(ValueError):
+        CachedAnalysisFunction(analyzer, StageResultStore(str(tmp_path)))
+
+
+def test_spacy_source_opt_in(spacy_pipeline):
+    text = "John gave the ball to Mary in London."
+    spacy_doc = spacy_pipeline(text)
+
+    for use_arrays in (True, False):
+        spndx = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, use_arrays=use_arrays)
+        assert not any(hasattr(a, "source") for a in spndx.annotations)
+
+        spndx = jemspacy.SpacyToSpandexUtils.spacy_to_spandex(spacy_doc, use_arrays=use_arrays, keep_source=True)
+        for tok in spndx.select(jemtypes.segmentation.Token):
+            assert tok.source.idx == tok.begin
+        for sent in spndx.select(jemtypes.segmentation.Sentence):
+            assert sent.source.start_char == sent.begin
+        for entity in spndx.select(jemtypes.chunking.Entity):
+            assert entity.source is not entity
+            assert entity.source.start_char == entity.begin
+
+
+def test_spacy_chunked_processing():
+    import spacy
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe(nlp.create_pipe("sentencizer"))
+
+    paragraphs = [" ".join(f"Sentence {j} of paragraph {i} is here." for j in range(8)) for i in range(20)]
+    text = "\n\n".join(paragraphs) + " and a trailing fragment"
+
+    bounds = jemspacy.chunk_bounds(text, 700, 200)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(text)
+    assert all(end - begin <= 700 for begin, end in bounds)
+    assert all(prev_begin < begin < prev_end for (prev_begin, prev_end), (begin, _) in zip(bounds, bounds[1:]))
+
+    layers = jemspacy.AnnotationLayers.DOCUMENT | jemspacy.AnnotationLayers.SENTENCE | jemspacy.AnnotationLayers.TOKEN
+    whole = text_to_jembatan_doc(text)
+    jemspacy.SpacyAnalyzer(spacy_pipeline=nlp).process(whole, annotation_layers=layers)
+    chunked = text_to_jembatan_doc(text)
+    jemspacy.SpacyAnalyzer(spacy_pipeline=nlp, chunk_size=700, chunk_overlap=200).process(
+        chunked, annotation_layers=layers)
+
+    assert annotation_summary(chunked.default_view) == annotation_summary(whole.default_view)
+
+
+def test_spacy_chunked_processing_random_texts():
+    import random
+    import spacy
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe(nlp.create_pipe("sentencizer"))
+    layers = jemspacy.AnnotationLayers.DOCUMENT | jemspacy.AnnotationLayers.SENTENCE | jemspacy.AnnotationLayers.TOKEN
+
+    # sentences of up to ~300 characters, so chunks often start and end inside sentences, joined by
+    # assorted whitespace
+    rng = random.Random(0)
+    for _ in range(20):
+        sentences = []
+        while sum(len(s) for s in sentences) < rng.randint(800, 3000):
+            words = " ".join(rng.choice(["alpha", "beta", "gamma", "delta"]) for _ in range(rng.choice([2, 10, 45])))
+            sentences.append(words + rng.choice([".", "!", "?"]) + rng.choice([" ", "  ", "\n", "\n\n", " \n "]))
+        text = "".join(sentences)
+
+        whole = text_to_jembatan_doc(text)
+        jemspacy.SpacyAnalyzer(spacy_pipeline=nlp).process(whole, annotation_layers=layers)
+        chunked = text_to_jembatan_doc(text)
+        jemspacy.SpacyAnalyzer(spacy_pipeline=nlp, chunk_size=400, chunk_overlap=100).process(
+            chunked, annotation_layers=layers)
+        assert annotation_summary(chunked.default_view) == annotation_summary(whole.default_view)
+
+
+def test_spacy_jsonl_export(tmp_path):
+    import spacy
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe(nlp.create_pipe("sentencizer"))
+    texts = ["John gave the ball to Mary.  She kept it.", "Short one.", "Education is all  a matter of bridges."]
+
+    serializer = jemspacy.SpacyToJson()
+    for text in texts:
+        spacydoc = nlp(text)
+        assert serializer.to_json_arrays(spacydoc) == serializer.to_json(spacydoc)
+
+    exporter = jemspacy.SpacyJsonlExporter(nlp, batch_size=2)
+    path = tmp_path / "corpus.jsonl"
+    count = exporter.export(((text, {"id": i}) for i, text in enumerate(texts)), path, as_tuples=True)
+    assert count == 3
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["id"] for r in records] == [0, 1, 2]
+    assert records[0] == dict(serializer.to_json(nlp(texts[0])), id=0)
+    assert {"content": " ", "beginOffset": 17} in [t["text"] for t in records[2]["tokens"]]
@@ -3,6 +3,7 @@ from dataclasses import field
 from jembatan.core.spandex import Span
 from jembatan.core.spandex import constants as jemconst
 from jembatan.core.spandex import json as spandex_json
+from jembatan.core.spandex.align import align_corpus
 from jembatan.readers.textreader import text_to_jembatan_doc
 from jembatan.typesys import Annotation, AnnotationScope, DocumentAnnotation, SpannedAnnotation
 from typing import Dict, List
@@ -146,6 +147,39 @@ def test_spandex():
     assert len(blahs) == 2
 
 
+def test_view_alignment():
+    jemdocs = []
+    for n in range(5):
+        jemdoc = text_to_jembatan_doc("x" * 100)
+        gold = jemdoc.create_view("gold", content_string=jemdoc.default_view.content_string)
+        gold.add_annotations(*[FooSpanAnnotation(begin=b, end=e) for b, e in [(0, 5), (10, 20), (30, 35), (50, 60)]])
+        jemdoc.default_view.add_annotations(
+            *[FooSpanAnnotation(begin=b, end=e) for b, e in [(0, 5), (12, 15), (15, 22), (40, 45), (50, 60 + n)]])
+        jemdocs.append(jemdoc)
+
+    def offsets(alignment):
+        return (
+            [(g.begin, g.end, s.begin, s.end) for g, s in alignment.exact],
+            [(g.begin, g.end, s.begin, s.end) for g, s in alignment.overlap],
+            [(a.begin, a.end) for a in alignment.left_unmatched],
+            [(a.begin, a.end) for a in alignment.right_unmatched],
+        )
+
+    alignment = jemdocs[1].align("gold", jemconst.SPANDEX_DEFAULT_VIEW, FooSpanAnnotation)
+    assert offsets(alignment) == (
+        [(0, 5, 0, 5)],
+        [(10, 20, 12, 15), (10, 20, 15, 22), (50, 60, 50, 61)],
+        [(30, 35)],
+        [(40, 45)],
+    )
+
+    expected = [offsets(jemdoc.align("gold", jemconst.SPANDEX_DEFAULT_VIEW, FooSpanAnnotation)) for jemdoc in jemdocs]
+    aligned = list(align_corpus(jemdocs, "gold", jemconst.SPANDEX_DEFAULT_VIEW, FooSpanAnnotation,
+                                n_workers=2, batch_size=2))
+    assert [jemdoc for jemdoc, _ in aligned] == jemdocs
+    assert [offsets(alignment) for _, alignment in aligned] == expected
+
+
 def test_serialization():
     content_string = ''.join(str(s % 10) for s in range(100))
 